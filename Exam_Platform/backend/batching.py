@@ -0,0 +1,122 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import log
+
+# Dynamic batching configuration shared by the YOLO and FaceNet batchers
+BATCHING_ENABLED = os.getenv('PROCTOR_BATCHING', '1') != '0'
+BATCH_MAX_SIZE = int(os.getenv('PROCTOR_BATCH_MAX_SIZE', '16'))
+BATCH_MAX_WAIT_MS = float(os.getenv('PROCTOR_BATCH_MAX_WAIT_MS', '5'))
+
+
+class MicroBatcher:
+    """
+    Collects single items submitted from concurrent requests and runs them through
+    batch_fn together. batch_fn receives a list of items and must return a list of
+    results in the same order; each caller gets back only its own result.
+
+    A batch is dispatched as soon as max_batch_size items are queued or max_wait_ms
+    has passed since the first item of the batch arrived, whichever comes first.
+
+    batch_fn is never called from two threads at once: with batching enabled only the
+    worker thread calls it, and with batching disabled inline calls take a lock, since
+    the shared Ultralytics predictors are not thread-safe.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                 name='batcher', enabled=BATCHING_ENABLED):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self.enabled = enabled and self.max_batch_size > 1
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._inline_lock = threading.Lock()
+
+        # Statistics
+        self.batches_run = 0
+        self.items_processed = 0
+        self.largest_batch = 0
+
+    def submit(self, item):
+        """Queue an item and return a Future resolving to its result."""
+        future = Future()
+        if not self.enabled:
+            # Batching disabled: run inline as a batch of one, one caller at a time
+            try:
+                with self._inline_lock:
+                    result = self._run([item])[0]
+                future.set_result(result)
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self._ensure_worker()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        """Submit an item and block until its result is ready."""
+        return self.submit(item).result()
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._loop, name=f"{self.name}-worker", daemon=True)
+                self._worker.start()
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect_batch()
+            items = [item for item, _ in batch]
+            try:
+                results = self._run(items)
+            except Exception as e:
+                log.error("%s batch of %s failed: %s", self.name, len(items), e)
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _run(self, items):
+        results = self.batch_fn(items)
+        if len(results) != len(items):
+            raise RuntimeError(f"{self.name}: batch_fn returned {len(results)} results for {len(items)} items")
+        self.batches_run += 1
+        self.items_processed += len(items)
+        self.largest_batch = max(self.largest_batch, len(items))
+        return results
+
+    def get_status(self):
+        """Batching statistics for debugging."""
+        return {
+            'enabled': self.enabled,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'queued': self._queue.qsize(),
+            'batches_run': self.batches_run,
+            'items_processed': self.items_processed,
+            'largest_batch': self.largest_batch,
+            'average_batch_size': (self.items_processed / self.batches_run) if self.batches_run else 0.0
+        }
@@ -0,0 +1,324 @@
+"""
+Offline replay benchmark for the proctoring pipeline.
+
+Replays a video file, a directory of images or synthetic frames through
+HybridVerificationService.process_frame without a browser or webcam. Each frame
+is JPEG-encoded and decoded again, as it would be on upload. Reports per-stage
+latency percentiles, frames per second, peak RSS and model memory, and writes
+them as JSON so runs from different releases can be compared.
+
+Usage:
+  python benchmark.py --source exam.mp4 --fps 5 --output results.json
+  python benchmark.py --source frames/ --student-id S1 --verify-every 10
+  python benchmark.py --synthetic 300 --database --output results.json
+  python benchmark.py --synthetic 300 --compare baseline.json
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+# Per-frame stages reported by process_frame, plus the ones measured here
+STAGES = (
+    'decode_ms', 'gate_ms', 'yolo_ms', 'face_mesh_ms', 'face_verification_ms',
+    'people_ms', 'comprehensive_ms', 'identity_ms', 'process_ms', 'verify_face_ms',
+    'db_record_ms', 'db_flush_ms', 'total_ms'
+)
+PERCENTILES = (50, 90, 95, 99)
+
+
+# ---------------------------------------------------------------------------- frame sources
+
+def _synthetic_frames(count, width=640, height=480):
+    """Deterministic frames: a noisy background with a block that drifts, then holds still."""
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    for i in range(count):
+        frame = background.copy()
+        # Moves for half of every 40 frames, so the motion gate sees both cases
+        offset = min(i % 40, 20) * 8
+        cv2.rectangle(frame, (100 + offset, 120), (260 + offset, 420), (40, 80, 160), -1)
+        yield frame
+
+
+def _video_frames(path):
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"could not open video {path}")
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                return
+            yield frame
+    finally:
+        capture.release()
+
+
+def _image_frames(directory):
+    for filename in sorted(os.listdir(directory)):
+        if filename.lower().endswith(IMAGE_EXTENSIONS):
+            frame = cv2.imread(os.path.join(directory, filename), cv2.IMREAD_COLOR)
+            if frame is not None:
+                yield frame
+
+
+def iter_frames(source=None, synthetic=0, limit=None, loop=False):
+    """Yield BGR frames from a video file, an image directory or the synthetic generator."""
+    produced = 0
+    while True:
+        if synthetic:
+            frames = _synthetic_frames(synthetic)
+        elif os.path.isdir(source):
+            frames = _image_frames(source)
+        else:
+            frames = _video_frames(source)
+        empty = True
+        for frame in frames:
+            empty = False
+            yield frame
+            produced += 1
+            if limit is not None and produced >= limit:
+                return
+        if not loop or empty:
+            return
+
+
+# ---------------------------------------------------------------------------- statistics
+
+def summarize(values):
+    """Percentiles, mean and max of a list of milliseconds; None when there are no samples."""
+    if not values:
+        return None
+    array = np.asarray(values, dtype=np.float64)
+    summary = {f'p{p}': float(np.percentile(array, p)) for p in PERCENTILES}
+    summary.update({'mean': float(array.mean()), 'max': float(array.max()), 'count': int(array.size)})
+    return summary
+
+
+def peak_rss_bytes():
+    try:
+        import resource
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    except ImportError:
+        return None
+
+
+# ---------------------------------------------------------------------------- replay
+
+def run_benchmark(frames, student_id='benchmark', exam_id='benchmark', fps=0.0, warmup=5,
+                  jpeg_quality=80, verify_every=0, database=False):
+    """
+    Replay frames through the hybrid pipeline and return the results dict.
+    fps=0 replays unthrottled; warm-up frames are processed but not measured.
+    """
+    import model_registry
+    from hybrid_verification import HybridVerificationService
+
+    load_start = time.perf_counter()
+    hybrid_verifier = HybridVerificationService()
+    setup_seconds = time.perf_counter() - load_start
+
+    writer = None
+    if database:
+        # Needs DATABASE_URL; rows are flushed synchronously on the writer's interval
+        from violation_writer import ViolationWriter
+        writer = ViolationWriter()
+
+    samples = {stage: [] for stage in STAGES}
+    measured = gated = violations = 0
+    encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
+    interval = 1.0 / fps if fps > 0 else 0.0
+    next_due = time.perf_counter()
+    last_flush = time.perf_counter()
+    replay_start = None
+
+    for index, frame in enumerate(frames):
+        if interval:
+            delay = next_due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            next_due = max(next_due + interval, time.perf_counter() - interval)
+        ok, jpeg = cv2.imencode('.jpg', frame, encode_params)
+        if not ok:
+            continue
+        jpeg = jpeg.tobytes()
+
+        frame_start = time.perf_counter()
+        decoded = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+        timings = {'decode_ms': (time.perf_counter() - frame_start) * 1000.0}
+
+        stage_start = time.perf_counter()
+        result = hybrid_verifier.process_frame(decoded, student_id, exam_id)
+        timings['process_ms'] = (time.perf_counter() - stage_start) * 1000.0
+        timings.update(result.get('timings', {}))
+
+        if verify_every and index % verify_every == 0:
+            stage_start = time.perf_counter()
+            hybrid_verifier.face_verifier.verify_face(student_id, base64.b64encode(jpeg).decode('ascii'))
+            timings['verify_face_ms'] = (time.perf_counter() - stage_start) * 1000.0
+
+        if writer is not None:
+            stage_start = time.perf_counter()
+            writer.record(student_id, exam_id, result['violations'])
+            timings['db_record_ms'] = (time.perf_counter() - stage_start) * 1000.0
+            if time.perf_counter() - last_flush >= writer.flush_interval:
+                stage_start = time.perf_counter()
+                if writer.flush():
+                    timings['db_flush_ms'] = (time.perf_counter() - stage_start) * 1000.0
+                last_flush = time.perf_counter()
+        timings['total_ms'] = (time.perf_counter() - frame_start) * 1000.0
+
+        if index < warmup:
+            continue
+        if replay_start is None:
+            replay_start = frame_start
+        measured += 1
+        gated += bool(result.get('gated'))
+        violations += sum(bool(v) for v in result['violations'].values())
+        for stage in STAGES:
+            if stage in timings:
+                samples[stage].append(timings[stage])
+
+    if writer is not None:
+        writer.flush()
+    wall_seconds = time.perf_counter() - replay_start if replay_start is not None else 0.0
+
+    import inference_backends
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'student_id': student_id,
+            'exam_id': exam_id,
+            'target_fps': fps or None,
+            'warmup_frames': warmup,
+            'jpeg_quality': jpeg_quality,
+            'inference': inference_backends.get_status()
+        },
+        'throughput': {
+            'frames': measured,
+            'wall_seconds': wall_seconds,
+            'fps': measured / wall_seconds if wall_seconds > 0 else None,
+            'gated_frames': gated,
+            'violations': violations
+        },
+        'latency_ms': {stage: summarize(values) for stage, values in samples.items() if values},
+        'memory': {
+            'peak_rss_bytes': peak_rss_bytes(),
+            'models': model_registry.memory_usage(),
+            'model_load_seconds': model_registry.get_status()['load_seconds'],
+            'service_setup_seconds': setup_seconds
+        },
+        'pipeline': {
+            'cascade': hybrid_verifier.get_cascade_status(),
+            'motion_gate': hybrid_verifier.get_motion_gate_status(),
+            'embedding_cache': hybrid_verifier.get_embedding_cache_status(),
+            'batching': hybrid_verifier.get_batching_status()
+        }
+    }
+
+
+# ---------------------------------------------------------------------------- reporting
+
+def compare(results, baseline, tolerance=0.10, statistic='p95', min_delta_ms=0.5):
+    """
+    Compare a run against a baseline results file.
+    Returns a list of regressions: stages whose statistic grew by more than tolerance
+    (and by at least min_delta_ms, so sub-millisecond noise is ignored), and a
+    throughput drop of more than tolerance between runs with the same target rate.
+    """
+    regressions = []
+    for stage, summary in results['latency_ms'].items():
+        base = (baseline.get('latency_ms') or {}).get(stage)
+        if not summary or not base or base.get(statistic, 0) <= 0:
+            continue
+        change = summary[statistic] / base[statistic] - 1.0
+        if change > tolerance and summary[statistic] - base[statistic] >= min_delta_ms:
+            regressions.append({'metric': f'{stage}.{statistic}', 'baseline': base[statistic],
+                                'current': summary[statistic], 'change': change})
+    base_fps = (baseline.get('throughput') or {}).get('fps')
+    fps = results['throughput']['fps']
+    same_rate = (baseline.get('meta') or {}).get('target_fps') == results['meta']['target_fps']
+    if same_rate and base_fps and fps is not None and fps < base_fps * (1.0 - tolerance):
+        regressions.append({'metric': 'fps', 'baseline': base_fps, 'current': fps, 'change': fps / base_fps - 1.0})
+    return regressions
+
+
+def print_report(results):
+    throughput = results['throughput']
+    fps = f"{throughput['fps']:.1f}" if throughput['fps'] else 'n/a'
+    print(f"\nFrames: {throughput['frames']}  wall: {throughput['wall_seconds']:.2f}s  fps: {fps}  "
+          f"gated: {throughput['gated_frames']}")
+    print(f"{'stage':<22}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}{'n':>7}")
+    for stage, summary in results['latency_ms'].items():
+        print(f"{stage:<22}" + ''.join(f"{summary[k]:>9.2f}" for k in ('p50', 'p90', 'p95', 'p99', 'max'))
+              + f"{summary['count']:>7}")
+    peak = results['memory']['peak_rss_bytes']
+    if peak:
+        print(f"Peak RSS: {peak / 2 ** 20:.1f} MiB")
+    for name, size in results['memory']['models'].items():
+        if name != 'process_peak_rss' and size:
+            print(f"Model {name}: {size / 2 ** 20:.1f} MiB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay frames through the proctoring pipeline and report latency.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--source', help="video file or directory of images")
+    source.add_argument('--synthetic', type=int, metavar='N', help="replay N generated frames")
+    parser.add_argument('--student-id', default='benchmark', help="student whose reference images are used")
+    parser.add_argument('--exam-id', default='benchmark')
+    parser.add_argument('--fps', type=float, default=0.0, help="replay rate; 0 (default) is unthrottled")
+    parser.add_argument('--limit', type=int, help="stop after this many frames")
+    parser.add_argument('--loop', action='store_true', help="repeat the source until --limit frames")
+    parser.add_argument('--warmup', type=int, default=5, help="frames processed before measuring (default 5)")
+    parser.add_argument('--jpeg-quality', type=int, default=80)
+    parser.add_argument('--verify-every', type=int, default=0, metavar='N',
+                        help="also time FaceVerificationService.verify_face on every Nth frame")
+    parser.add_argument('--database', action='store_true', help="record violations and time DB flushes (needs DATABASE_URL)")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--compare', metavar='BASELINE', help="fail if p95 latency or fps regressed against this results file")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="allowed regression for --compare (default 0.10)")
+    args = parser.parse_args(argv)
+
+    frames = iter_frames(args.source, args.synthetic or 0, args.limit, args.loop)
+    results = run_benchmark(
+        frames, args.student_id, args.exam_id, fps=args.fps, warmup=args.warmup,
+        jpeg_quality=args.jpeg_quality, verify_every=args.verify_every, database=args.database
+    )
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"[INFO] Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"[ERROR] Regression in {regression['metric']}: {regression['baseline']:.2f} -> "
+                  f"{regression['current']:.2f} ({regression['change']:+.0%})")
+        if regressions:
+            return 1
+        print(f"[INFO] No regressions against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
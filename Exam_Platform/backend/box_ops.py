@@ -0,0 +1,98 @@
+"""
+Vectorised bounding-box helpers. Boxes are contiguous float32 arrays of shape
+(N, 4) in (x1, y1, x2, y2) pixel coordinates.
+"""
+
+import numpy as np
+
+EMPTY_BOXES = np.zeros((0, 4), dtype=np.float32)
+
+
+def result_arrays(results):
+    """
+    Flatten YOLO results into contiguous (boxes, confidences, classes) arrays,
+    copying each result's tensors off the device once instead of per box.
+    """
+    boxes, confs, classes = [], [], []
+    for result in results:
+        if len(result.boxes) == 0:
+            continue
+        boxes.append(result.boxes.xyxy.cpu().numpy())
+        confs.append(result.boxes.conf.cpu().numpy())
+        classes.append(result.boxes.cls.cpu().numpy())
+    if not boxes:
+        return EMPTY_BOXES, np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+    return (
+        np.ascontiguousarray(np.concatenate(boxes), dtype=np.float32),
+        np.ascontiguousarray(np.concatenate(confs), dtype=np.float32),
+        np.concatenate(classes).astype(np.int64)
+    )
+
+
+def as_boxes(boxes):
+    """Stack a sequence of boxes into an (N, 4) float32 array."""
+    if len(boxes) == 0:
+        return EMPTY_BOXES
+    return np.ascontiguousarray(np.asarray(boxes, dtype=np.float32).reshape(-1, 4))
+
+
+def centers(boxes):
+    return np.stack(((boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2), axis=1)
+
+
+def areas(boxes):
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def pairwise_distances(points_a, points_b):
+    """(N, M) Euclidean distances between two sets of 2-D points."""
+    diff = points_a[:, None, :] - points_b[None, :, :]
+    return np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+
+
+def pairwise_intersections(boxes_a, boxes_b):
+    """(N, M) intersection areas."""
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    size = np.clip(bottom_right - top_left, 0, None)
+    return size[..., 0] * size[..., 1]
+
+
+def pairwise_iou(boxes_a, boxes_b):
+    """(N, M) intersection over union."""
+    intersection = pairwise_intersections(boxes_a, boxes_b)
+    union = areas(boxes_a)[:, None] + areas(boxes_b)[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def pairwise_overlap_of_smaller(boxes_a, boxes_b):
+    """(N, M) intersection divided by the smaller box's area."""
+    intersection = pairwise_intersections(boxes_a, boxes_b)
+    smaller = np.minimum(areas(boxes_a)[:, None], areas(boxes_b)[None, :])
+    return np.divide(intersection, smaller, out=np.zeros_like(intersection), where=smaller > 0)
+
+
+def upper_pairs(n):
+    """Row and column indices of every unordered pair (i < j) among n items."""
+    return np.triu_indices(n, k=1)
+
+
+def greedy_assign(cost, max_cost):
+    """
+    One-to-one assignment on an (N, M) cost matrix: repeatedly take the cheapest
+    remaining pair below max_cost. Returns a list of (row, col) pairs. For the
+    handful of people in a webcam frame this matches Hungarian assignment in
+    practice at a fraction of the cost.
+    """
+    if cost.size == 0:
+        return []
+    rows, cols = np.nonzero(cost < max_cost)
+    order = np.argsort(cost[rows, cols], kind='stable')
+    used_rows, used_cols, pairs = set(), set(), []
+    for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        pairs.append((row, col))
+    return pairs
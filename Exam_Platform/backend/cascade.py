@@ -0,0 +1,164 @@
+import copy
+import json
+import os
+import threading
+import time
+
+from metrics import log
+
+# Per-check scheduling. every_n: run on every Nth analysed frame of a session;
+# min_interval: seconds between runs; min_faces/max_faces: only run with that many faces in view.
+DEFAULT_CHECKS = {
+    'multiple_people': {'enabled': True, 'every_n': 1},
+    'devices': {'enabled': True, 'every_n': 1},
+    # Head pose and gaze; with several faces in view multiple_faces already fires
+    'face_mesh': {'enabled': True, 'every_n': 1, 'min_faces': 1, 'max_faces': 1},
+    # FaceNet verification runs on tracking events (new person ID, reappearance);
+    # a person ID already verified is not re-verified before min_interval
+    'identity': {'min_interval': 5.0},
+}
+# Stages that always run but are still cost-accounted
+ACCOUNTED_STAGES = ('yolo', 'tracking')
+
+_SETTING_TYPES = {
+    'enabled': bool,
+    'every_n': int,
+    'min_interval': float,
+    'min_faces': int,
+    'max_faces': int,
+}
+
+
+def _load_env_config():
+    """Optional JSON overrides, e.g. PROCTOR_CASCADE_CONFIG='{"devices": {"every_n": 3}}'."""
+    raw = os.getenv('PROCTOR_CASCADE_CONFIG', '')
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError as e:
+        log.warning("Ignoring invalid PROCTOR_CASCADE_CONFIG: %s", e)
+        return {}
+
+
+def validate_overrides(overrides):
+    """Return a cleaned copy of {check: {setting: value}}; raises ValueError on unknown checks or settings."""
+    if not isinstance(overrides, dict):
+        raise ValueError("Cascade config must be an object of checks")
+    cleaned = {}
+    for check, settings in overrides.items():
+        if check not in DEFAULT_CHECKS:
+            raise ValueError(f"Unknown check '{check}'")
+        if not isinstance(settings, dict):
+            raise ValueError(f"Settings for '{check}' must be an object")
+        cleaned[check] = {}
+        for key, value in settings.items():
+            if key not in DEFAULT_CHECKS[check]:
+                raise ValueError(f"Unknown setting '{key}' for check '{check}'")
+            try:
+                value = _SETTING_TYPES[key](value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid value for '{check}.{key}': {value!r}")
+            if key == 'every_n' and value < 1:
+                raise ValueError("every_n must be at least 1")
+            if key in ('min_interval', 'min_faces', 'max_faces') and value < 0:
+                raise ValueError(f"{key} must not be negative")
+            cleaned[check][key] = value
+    return cleaned
+
+
+class CascadeScheduler:
+    """
+    Decides which per-frame checks run for a session and accounts their cost.
+
+    Checks run on their own cadence (every Nth analysed frame or a minimum
+    interval) and trigger conditions; a check that is not due keeps its last
+    decision so skipping it only delays detection, it never clears a violation.
+    Settings come from DEFAULT_CHECKS, PROCTOR_CASCADE_CONFIG and per-exam
+    overrides set through set_exam_config().
+    """
+
+    def __init__(self, config=None):
+        self.defaults = copy.deepcopy(DEFAULT_CHECKS)
+        for check, settings in validate_overrides(config if config is not None else _load_env_config()).items():
+            self.defaults[check].update(settings)
+        self._exam_overrides = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            name: {'runs': 0, 'skips': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            for name in (*ACCOUNTED_STAGES, *DEFAULT_CHECKS)
+        }
+
+    # ------------------------------------------------------------------ configuration
+
+    def config_for(self, exam_id):
+        overrides = self._exam_overrides.get(str(exam_id))
+        if not overrides:
+            return self.defaults
+        return {check: {**settings, **overrides.get(check, {})} for check, settings in self.defaults.items()}
+
+    def set_exam_config(self, exam_id, overrides):
+        """Replace the per-exam overrides; returns the effective config for the exam."""
+        cleaned = validate_overrides(overrides)
+        with self._lock:
+            if cleaned:
+                self._exam_overrides[str(exam_id)] = cleaned
+            else:
+                self._exam_overrides.pop(str(exam_id), None)
+        return self.config_for(exam_id)
+
+    # ------------------------------------------------------------------ scheduling
+
+    def applies(self, session, name, face_count=None):
+        """Whether a check is enabled and its trigger condition holds; a check that does not apply reports nothing."""
+        settings = self.config_for(session.exam_id)[name]
+        if not settings.get('enabled', True):
+            return False
+        if face_count is None:
+            return True
+        return settings.get('min_faces', 0) <= face_count <= settings.get('max_faces', face_count)
+
+    def is_due(self, session, name):
+        """Whether an applicable check's cadence says it should run on the session's current frame."""
+        settings = self.config_for(session.exam_id)[name]
+        state = session.check_state.get(name)
+        if state is None:
+            return True
+        if session.frame_index - state['frame'] < settings.get('every_n', 1):
+            return False
+        return time.time() - state['time'] >= settings.get('min_interval', 0.0)
+
+    def record_run(self, session, name, elapsed_ms, result=None):
+        """Account a run and remember its decision for frames where the check is skipped."""
+        session.check_state[name] = {'frame': session.frame_index, 'time': time.time(), 'result': result}
+        self.account(name, elapsed_ms)
+
+    def account(self, name, elapsed_ms):
+        """Add the cost of one run without touching the check's schedule."""
+        with self._lock:
+            stats = self._stats[name]
+            stats['runs'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+    def record_skip(self, name):
+        with self._lock:
+            self._stats[name]['skips'] += 1
+
+    @staticmethod
+    def last_result(session, name, default=None):
+        state = session.check_state.get(name)
+        return default if state is None or state['result'] is None else state['result']
+
+    def get_status(self):
+        with self._lock:
+            costs = {
+                name: {
+                    **stats,
+                    'avg_ms': stats['total_ms'] / stats['runs'] if stats['runs'] else 0.0,
+                    'skip_ratio': stats['skips'] / (stats['runs'] + stats['skips']) if stats['runs'] + stats['skips'] else 0.0
+                }
+                for name, stats in self._stats.items()
+            }
+            exam_overrides = copy.deepcopy(self._exam_overrides)
+        return {'defaults': self.defaults, 'exam_overrides': exam_overrides, 'costs': costs}
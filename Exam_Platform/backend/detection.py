@@ -1,12 +1,19 @@
-import os
-import torch
+import cv2
 import numpy as np
 from PIL import Image
-from ultralytics import YOLO
+from batching import MicroBatcher
+from inference_backends import YOLO_MAX_BATCH_SIZE
+from model_registry import get_face_yolo
+from metrics import log
 
-# Load YOLOv8n-face model
-MODEL_PATH = os.path.join(os.path.dirname(__file__), 'weights', 'yolov8n-face.pt')
-yolo_model = YOLO(MODEL_PATH)
+def _predict_face_boxes(images):
+    """Run the shared YOLOv8n-face model over a batch of images; returns one (n, 4) xyxy array per image."""
+    results = get_face_yolo().predict(source=images, conf=0.5, verbose=False)
+    return [result.boxes.xyxy.cpu().numpy() for result in results]
+
+# All face detection goes through one batcher, so the shared model is never called
+# from two threads at once and concurrent requests share a forward pass
+_face_box_batcher = MicroBatcher(_predict_face_boxes, max_batch_size=YOLO_MAX_BATCH_SIZE, name='face_yolo')
 
 def detect_face_from_pil(pil_image):
     """
@@ -22,13 +29,11 @@ def detect_face_from_pil(pil_image):
         img_array = np.array(pil_image)
 
         # Run YOLOv8 detection
-        results = yolo_model.predict(source=img_array, conf=0.5, verbose=False)
+        boxes = _face_box_batcher(img_array)  # shape (n, 4) with [x1, y1, x2, y2]
 
-        if not results or len(results[0].boxes) == 0:
+        if len(boxes) == 0:
             return None
 
-        # Get all bounding boxes
-        boxes = results[0].boxes.xyxy.cpu().numpy()  # shape (n, 4) with [x1, y1, x2, y2]
         # Choose the largest face based on area
         biggest = max(boxes, key=lambda b: (b[2] - b[0]) * (b[3] - b[1]))
 
@@ -37,9 +42,62 @@ def detect_face_from_pil(pil_image):
 
         return cropped
     except Exception as e:
-        print(f"[ERROR] Face detection failed: {str(e)}")
+        log.error("Face detection failed: %s", e)
+        return None
+
+def _crop_largest_face(image, boxes):
+    """Crop the largest of an image's face boxes and resize it to 160x160; None if there is none."""
+    if len(boxes) == 0:
+        return None
+
+    # Choose the largest face based on area
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    x1, y1, x2, y2 = map(int, boxes[int(np.argmax(areas))])
+
+    height, width = image.shape[:2]
+    x1, y1 = max(0, x1), max(0, y1)
+    x2, y2 = min(width, x2), min(height, y2)
+    if x2 <= x1 or y2 <= y1:
         return None
 
+    return cv2.resize(image[y1:y2, x1:x2], (160, 160))
+
+def detect_face_from_array(image):
+    """
+    Detects the largest face in a decoded image array (H x W x 3, BGR as produced by
+    cv2.imdecode) and returns a 160x160 crop in the same channel order.
+    The input buffer is read in place; only the small resized crop is allocated.
+    Returns None if no face is detected.
+    """
+    try:
+        if image is None or image.size == 0:
+            return None
+
+        # Run YOLOv8 detection directly on the frame buffer
+        return _crop_largest_face(image, _face_box_batcher(image))
+    except Exception as e:
+        log.error("Face detection failed: %s", e)
+        return None
+
+def detect_faces_from_arrays(images):
+    """
+    Batch version of detect_face_from_array: all images are submitted to the face
+    batcher together, so they share one YOLO forward pass.
+    Returns one 160x160 crop (or None) per image, in input order.
+    """
+    futures = [
+        _face_box_batcher.submit(image) if image is not None and image.size > 0 else None
+        for image in images
+    ]
+    crops = []
+    for image, future in zip(images, futures):
+        try:
+            crops.append(_crop_largest_face(image, future.result()) if future is not None else None)
+        except Exception as e:
+            log.error("Face detection failed: %s", e)
+            crops.append(None)
+    return crops
+
 def detect_face_from_base64(base64_image):
     """
     Detects face from base64 encoded image string.
@@ -62,5 +120,5 @@ def detect_face_from_base64(base64_image):
         # Detect and crop face
         return detect_face_from_pil(pil_image)
     except Exception as e:
-        print(f"[ERROR] Base64 face detection failed: {str(e)}")
+        log.error("Base64 face detection failed: %s", e)
         return None
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Entries older than this are dropped regardless of use (seconds)
+EMBEDDING_CACHE_TTL = float(os.getenv('PROCTOR_EMBEDDING_CACHE_TTL', '30'))
+# Live tracks cached per process; least recently used entries are evicted first
+EMBEDDING_CACHE_SIZE = int(os.getenv('PROCTOR_EMBEDDING_CACHE_SIZE', '4096'))
+
+
+class CachedVerification:
+    """A tracked person's live embedding and the verification result computed from it."""
+
+    __slots__ = ('embedding', 'result', 'references', 'verified_at')
+
+    def __init__(self, embedding, result, references, verified_at):
+        self.embedding = embedding  # (512,) float32, None when no face was found
+        self.result = result
+        self.references = references  # ReferenceEmbeddings the result was scored against
+        self.verified_at = verified_at
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of live-face verifications keyed by (session key, track ID).
+
+    A track keeps its ID for as long as the tracker follows the same person, so a
+    cached entry stands in for FaceNet on later frames of that track. Entries expire
+    after `ttl` seconds; the oldest entries are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, ttl=EMBEDDING_CACHE_TTL, max_entries=EMBEDDING_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rescored = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def get(self, key, max_age=None, now=None):
+        """
+        Return the entry for key if it is younger than max_age (and the TTL), else None.
+        Counts a hit or a miss.
+        """
+        now = time.time() if now is None else now
+        max_age = self.ttl if max_age is None else min(max_age, self.ttl)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.verified_at >= self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None or now - entry.verified_at >= max_age:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, embedding, result, references, now=None):
+        entry = CachedVerification(embedding, result, references, time.time() if now is None else now)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+        return entry
+
+    def record_rescore(self):
+        """Count a hit whose embedding was re-scored because the references changed."""
+        with self._lock:
+            self.rescored += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_status(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'rescored': self.rescored,
+                'expired': self.expired,
+                'evicted': self.evicted
+            }
@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from metrics import log
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, single worker only
+    fcntl = None
+
+EMBEDDING_STORE_DIR = os.getenv('PROCTOR_EMBEDDING_STORE', 'face_embeddings')
+EMBEDDING_DIM = 512
+# Bumped when the way embeddings are computed changes; older stores are recomputed
+STORE_VERSION = 2
+
+
+class EmbeddingStore:
+    """
+    On-disk store of reference face embeddings.
+
+    Embeddings live in an append-only float32 matrix (embeddings.f32) that is
+    memory-mapped for reading; index.json maps student_id -> view_type -> row.
+    Replacing a view appends a new row and repoints the index, so readers never
+    see a half-written matrix. Other processes pick up changes via refresh(),
+    which compares the index file's inode and mtime.
+    """
+
+    def __init__(self, directory=EMBEDDING_STORE_DIR, dim=EMBEDDING_DIM):
+        self.directory = directory
+        self.dim = dim
+        self.matrix_path = os.path.join(directory, 'embeddings.f32')
+        self.index_path = os.path.join(directory, 'index.json')
+        self.lock_path = os.path.join(directory, '.lock')
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._rows = 0
+        self._matrix = None
+        self._index_mtime = None
+        self._unreported_changes = set()
+        self.refresh()
+
+    # ------------------------------------------------------------------ reading
+
+    def _read_index(self):
+        if not os.path.exists(self.index_path):
+            return {}, 0
+        with open(self.index_path) as f:
+            index = json.load(f)
+        if index.get('version') != STORE_VERSION or index.get('dim') != self.dim:
+            log.warning("Ignoring embedding index with version %s / dim %s", index.get('version'), index.get('dim'))
+            return {}, 0
+        return index.get('entries', {}), index.get('rows', 0)
+
+    def refresh(self):
+        """
+        Reload the index if another process changed it.
+        Returns the set of student_ids whose entries changed.
+        """
+        with self._lock:
+            try:
+                # The index is replaced atomically, so a new inode also marks a change
+                stat = os.stat(self.index_path)
+                mtime = (stat.st_ino, stat.st_mtime_ns)
+            except FileNotFoundError:
+                mtime = None
+            if mtime == self._index_mtime:
+                changed, self._unreported_changes = self._unreported_changes, set()
+                return changed
+
+            entries, rows = self._read_index()
+            changed = {
+                student_id for student_id in set(entries) | set(self._entries)
+                if entries.get(student_id) != self._entries.get(student_id)
+            }
+            self._entries = entries
+            self._rows = rows
+            self._matrix = None  # re-mapped lazily with the new row count
+            self._index_mtime = mtime
+            changed |= self._unreported_changes
+            self._unreported_changes = set()
+            return changed
+
+    def _get_matrix(self):
+        if self._matrix is None and self._rows > 0:
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r', shape=(self._rows, self.dim))
+        return self._matrix
+
+    def get(self, student_id):
+        """Return {view_type: (1, dim) float32 embedding} for a student, or None if not stored."""
+        with self._lock:
+            views = self._entries.get(str(student_id))
+            if not views:
+                return None
+            matrix = self._get_matrix()
+            return {
+                view_type: np.array(matrix[entry['row']:entry['row'] + 1])
+                for view_type, entry in views.items()
+            }
+
+    def get_matrix(self, student_id):
+        """
+        Return (view_types, (views, dim) float32 matrix) for a student, or None if not stored.
+        The matrix is a contiguous in-memory copy, ordered by view type.
+        """
+        with self._lock:
+            views = self._entries.get(str(student_id))
+            if not views:
+                return None
+            view_types = sorted(views)
+            rows = [views[view_type]['row'] for view_type in view_types]
+            return view_types, np.ascontiguousarray(self._get_matrix()[rows])
+
+    def get_all(self):
+        """Return (student_ids, view_types, (rows, dim) float32 matrix) for every live embedding."""
+        with self._lock:
+            student_ids, view_types, rows = [], [], []
+            for student_id, views in self._entries.items():
+                for view_type, entry in views.items():
+                    student_ids.append(student_id)
+                    view_types.append(view_type)
+                    rows.append(entry['row'])
+            matrix = self._get_matrix()
+            if not rows:
+                return [], [], np.zeros((0, self.dim), dtype=np.float32)
+            return student_ids, view_types, np.ascontiguousarray(matrix[rows])
+
+    def get_sources(self, student_id):
+        """Return {view_type: source filename} of a student's stored embeddings."""
+        with self._lock:
+            return {view_type: entry.get('source') for view_type, entry in self._entries.get(str(student_id), {}).items()}
+
+    def has(self, student_id):
+        with self._lock:
+            return bool(self._entries.get(str(student_id)))
+
+    # ------------------------------------------------------------------ writing
+
+    def _locked_update(self, update_fn):
+        """Run update_fn(entries, rows) -> rows under a cross-process lock and persist the index."""
+        with self._lock, open(self.lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Start from the latest on-disk state, another worker may have written
+                entries, rows = self._read_index()
+                rows = update_fn(entries, rows)
+                tmp_path = self.index_path + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    json.dump({'version': STORE_VERSION, 'dim': self.dim, 'rows': rows, 'entries': entries}, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.index_path)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+            # Keep changes picked up here so the next refresh() still reports them
+            self._unreported_changes |= self.refresh()
+
+    def put(self, student_id, view_type, embedding, source=None):
+        """Persist one reference embedding, replacing any previous one for the same view."""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        if vector.shape[0] != self.dim:
+            raise ValueError(f"Expected embedding of size {self.dim}, got {vector.shape[0]}")
+
+        def update(entries, rows):
+            # Rows are appended at the index's row count; trailing bytes from a crashed write are overwritten
+            with open(self.matrix_path, 'r+b' if os.path.exists(self.matrix_path) else 'wb') as f:
+                f.seek(rows * self.dim * 4)
+                f.write(vector.tobytes())
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+            entries.setdefault(str(student_id), {})[view_type] = {'row': rows, 'source': source}
+            return rows + 1
+
+        self._locked_update(update)
+
+    def remove(self, student_id):
+        """Forget all embeddings for a student so they are recomputed from images on next load."""
+        def update(entries, rows):
+            entries.pop(str(student_id), None)
+            return rows
+
+        self._locked_update(update)
+
+    def get_status(self):
+        with self._lock:
+            live_rows = sum(len(views) for views in self._entries.values())
+            return {
+                'directory': self.directory,
+                'students': len(self._entries),
+                'live_rows': live_rows,
+                'total_rows': self._rows,
+                'size_bytes': self._rows * self.dim * 4
+            }
@@ -1,207 +1,354 @@
 import os
+import threading
+import cv2
 import numpy as np
-from PIL import Image
-import io
 import base64 as b64
-from detection import detect_face_from_base64
+from detection import detect_faces_from_arrays
 from recognition import FaceRecognizer
+from embedding_store import EmbeddingStore
+from gallery import EmbeddingGallery
+from metrics import log
 import json
 
+class ReferenceEmbeddings:
+    """A student's reference views as one contiguous (views, 512) float32 matrix."""
+    __slots__ = ('views', 'matrix')
+
+    def __init__(self, views, matrix):
+        self.views = list(views)
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32).reshape(len(self.views), -1)
+
+    @classmethod
+    def from_views(cls, embeddings):
+        """Build from {view_type: (1, 512) embedding}, ordered by view type."""
+        views = sorted(embeddings)
+        return cls(views, np.vstack([np.asarray(embeddings[view], dtype=np.float32).reshape(1, -1) for view in views]))
+
+    def __len__(self):
+        return len(self.views)
+
+    def distances(self, live_embeddings):
+        """Euclidean distances from (N, 512) live embeddings to every view, as an (N, views) array."""
+        live = np.asarray(live_embeddings, dtype=np.float32).reshape(-1, self.matrix.shape[1])
+        return np.linalg.norm(live[:, None, :] - self.matrix[None, :, :], axis=2)
+
 class FaceVerificationService:
     def __init__(self):
         self.recognizer = FaceRecognizer()
         self.reference_embeddings = {}
         self.face_images_dir = 'face_images'
+        # Reference embeddings persisted across restarts and shared between workers
+        self.embedding_store = EmbeddingStore()
+        # Every enrolled reference embedding, for 1:N search on identity mismatches; loaded at warm-up or on first use
+        self.gallery = EmbeddingGallery(dim=self.embedding_store.dim)
+        self._gallery_loaded = False
+        self._gallery_lock = threading.Lock()
+    
+    def _compute_reference_embeddings(self, filepaths):
+        """
+        Detect the face in each reference image file and embed all of them in one batch.
+        Returns one (1, 512) embedding per file; unreadable images raise ValueError.
+        """
+        images = []
+        for filepath in filepaths:
+            ref_image = cv2.imread(filepath, cv2.IMREAD_COLOR)
+            if ref_image is None:
+                raise ValueError(f"could not read image {filepath}")
+            images.append(ref_image)
+        
+        # Detect faces in all reference images together
+        face_crops = detect_faces_from_arrays(images)
+        for i, filepath in enumerate(filepaths):
+            if face_crops[i] is None:
+                log.warning("No face detected in reference image: %s", filepath)
+                # Try to use the original image if face detection fails
+                face_crops[i] = images[i]
         
+        # Compute embeddings
+        return self.recognizer.get_embeddings(face_crops)
+    
+    def _compute_reference_embedding(self, filepath):
+        """Detect the face in a reference image file and compute its embedding."""
+        return self._compute_reference_embeddings([filepath])[0]
+    
+    def add_reference_image(self, student_id, view_type, filepath):
+        """
+        Compute and persist the embedding for a newly uploaded reference image.
+        Cached embeddings for the student are invalidated so the new view is used.
+        """
+        try:
+            embedding = self._compute_reference_embedding(filepath)
+            if embedding is None:
+                raise ValueError("embedding could not be computed")
+            self.embedding_store.put(student_id, view_type, embedding, source=os.path.basename(filepath))
+            # Drops the cached references and inserts the new view into the gallery
+            self._refresh_from_store()
+            log.info("Stored reference embedding for student %s, %s view", student_id, view_type)
+            return True
+        except Exception as e:
+            log.error("Failed to store reference embedding for %s: %s", filepath, e)
+            self.invalidate_reference(student_id)
+            return False
+    
+    def invalidate_reference(self, student_id):
+        """Drop cached and stored embeddings so the next load recomputes them from the images."""
+        self.reference_embeddings.pop(student_id, None)
+        self.embedding_store.remove(student_id)
+        self._refresh_from_store()
+    
+    def _refresh_from_store(self):
+        """
+        Forget cached embeddings that this or another worker has updated in the store,
+        and apply the same changes to the gallery.
+        """
+        changed = self.embedding_store.refresh()
+        for student_id in changed:
+            self.reference_embeddings.pop(student_id, None)
+            if self._gallery_loaded:
+                stored = self.embedding_store.get_matrix(student_id)
+                if stored:
+                    self.gallery.set_student(str(student_id), *stored)
+                else:
+                    self.gallery.remove(str(student_id))
+    
+    def load_gallery(self):
+        """Load every stored reference embedding into the gallery once; its index is built in the background."""
+        with self._gallery_lock:
+            if self._gallery_loaded:
+                return
+            self._refresh_from_store()
+            self.gallery.load(*self.embedding_store.get_all())
+            self._gallery_loaded = True
+            log.info("Loaded %s reference embeddings into the gallery", len(self.gallery))
+    
+    def _ensure_gallery(self):
+        if not self._gallery_loaded:
+            self.load_gallery()
+    
+    def identify(self, live_embedding, exclude_student_id=None, k=1):
+        """
+        1:N search of every enrolled student's references for a live embedding.
+        Returns up to k {'student_id', 'view', 'distance'} dicts, closest first.
+        """
+        self._ensure_gallery()
+        exclude = None if exclude_student_id is None else str(exclude_student_id)
+        return self.gallery.search(live_embedding, k=k, exclude=exclude)
+    
+    def _best_other_match(self, live_embedding, student_id):
+        """Closest other enrolled student, flagged as matched under the single-view threshold."""
+        matches = self.identify(live_embedding, exclude_student_id=student_id)
+        if not matches:
+            return None
+        best = matches[0]
+        return {**best, 'matched': best['distance'] < self._adaptive_threshold(1)}
+        
+    def _reference_files(self, student_id):
+        """Newest image per view in face_images/ for a student: {view_type: filepath}."""
+        reference_files = {}
+        if os.path.exists(self.face_images_dir):
+            # Sorted so the latest upload (timestamped filename) of a view wins
+            for filename in sorted(os.listdir(self.face_images_dir)):
+                if filename.startswith(f"{student_id}_") and filename.endswith('.png'):
+                    parts = filename.replace('.png', '').split('_')
+                    if len(parts) >= 3:
+                        reference_files[parts[1]] = os.path.join(self.face_images_dir, filename)
+        return reference_files
+    
     def load_reference_images(self, student_id):
         """
-        Load reference images for a student and compute embeddings.
-        Simplified to work with any available reference images.
+        Load reference embeddings for a student.
+        Stored embeddings are reused per view when they were computed from the newest
+        image of that view in face_images/; missing or outdated views are computed
+        from the images in one batch and persisted.
         """
         try:
-            # Look for reference images in face_images directory
-            reference_files = []
-            if os.path.exists(self.face_images_dir):
-                for filename in os.listdir(self.face_images_dir):
-                    if filename.startswith(f"{student_id}_") and filename.endswith('.png'):
-                        parts = filename.replace('.png', '').split('_')
-                        if len(parts) >= 3:
-                            view_type = parts[1]
-                            reference_files.append((view_type, os.path.join(self.face_images_dir, filename)))
-            
-            # Sort by view type to ensure consistent order
-            reference_files.sort(key=lambda x: x[0])
-            
-            if len(reference_files) == 0:
-                print(f"[ERROR] No reference images found for student {student_id}")
-                return False
+            self._refresh_from_store()
+            sources = self.embedding_store.get_sources(student_id)
+            reference_files = self._reference_files(student_id)
+            stale = sorted(
+                (view_type, filepath) for view_type, filepath in reference_files.items()
+                if sources.get(view_type) != os.path.basename(filepath)
+            )
             
-            # Load and compute embeddings for each reference image
-            embeddings = {}
-            for view_type, filepath in reference_files:
+            if stale:
                 try:
-                    # Load image
-                    ref_image = Image.open(filepath)
-                    
-                    # Convert to RGB if necessary
-                    if ref_image.mode in ('RGBA', 'LA', 'P'):
-                        ref_image = ref_image.convert('RGB')
-                    
-                    # Detect face in reference image
-                    face_crop = detect_face_from_base64(self._pil_to_base64(ref_image))
-                    if face_crop is None:
-                        print(f"[WARNING] No face detected in reference image: {filepath}")
-                        # Try to use the original image if face detection fails
-                        embedding = self.recognizer.get_embedding(ref_image)
-                        if embedding is not None:
-                            embeddings[view_type] = embedding
-                            print(f"[INFO] Used original image for {view_type} view")
-                        continue
-                    
-                    # Compute embedding
-                    embedding = self.recognizer.get_embedding(face_crop)
-                    if embedding is not None:
-                        embeddings[view_type] = embedding
-                        print(f"[INFO] Loaded reference embedding for {view_type} view")
-                    
+                    computed = self._compute_reference_embeddings([filepath for _, filepath in stale])
                 except Exception as e:
-                    print(f"[ERROR] Failed to process reference image {filepath}: {str(e)}")
-                    continue
+                    log.error("Failed to process reference images for student %s: %s", student_id, e)
+                    computed = []
+                for (view_type, filepath), embedding in zip(stale, computed):
+                    if embedding is not None:
+                        self.embedding_store.put(student_id, view_type, embedding, source=os.path.basename(filepath))
+                        log.info("Loaded reference embedding for %s view", view_type)
+                self._refresh_from_store()
             
-            if len(embeddings) >= 1:  # At least 1 reference embedding needed
-                self.reference_embeddings[student_id] = embeddings
-                print(f"[INFO] Successfully loaded {len(embeddings)} reference embeddings for student {student_id}")
+            stored = self.embedding_store.get_matrix(student_id)
+            if stored:  # At least 1 reference embedding needed
+                self.reference_embeddings[student_id] = ReferenceEmbeddings(*stored)
+                log.info("Loaded %s reference embeddings for student %s (%s computed from images)",
+                         len(stored[0]), student_id, len(stale))
                 return True
+            if not reference_files:
+                log.error("No reference images found for student %s", student_id)
             else:
-                print(f"[ERROR] No valid reference embeddings for student {student_id}")
-                return False
+                log.error("No valid reference embeddings for student %s", student_id)
+            return False
                 
         except Exception as e:
-            print(f"[ERROR] Failed to load reference images for student {student_id}: {str(e)}")
+            log.error("Failed to load reference images for student %s: %s", student_id, e)
             return False
     
-    def _pil_to_base64(self, pil_image):
-        """Convert PIL image to base64 string."""
-        buffer = io.BytesIO()
-        pil_image.save(buffer, format='PNG')
-        img_str = b64.b64encode(buffer.getvalue()).decode()
-        return f"data:image/png;base64,{img_str}"
-    
     def verify_face(self, student_id, live_image_base64, threshold=None):
+        """
+        Verify a base64 / data-URL encoded live image.
+        Decodes once and delegates to verify_face_array.
+        """
+        try:
+            if ',' in live_image_base64:
+                live_image_base64 = live_image_base64.split(',')[1]
+            image_bytes = b64.b64decode(live_image_base64)
+            live_image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        except Exception as e:
+            log.error("Failed to decode live image: %s", e)
+            live_image = None
+        if live_image is None:
+            return {
+                'success': False,
+                'error': 'Could not decode live image',
+                'verified': False
+            }
+        return self.verify_face_array(student_id, live_image, threshold)
+    
+    def verify_face_array(self, student_id, live_image, threshold=None):
         """
         Enhanced face verification for 3-angle system.
+        Takes a decoded BGR image array (a frame or a view into one, no copy needed).
         Uses adaptive thresholds and intelligent matching logic.
         """
+        return self.verify_face_arrays(student_id, [live_image], threshold)[0]
+    
+    @staticmethod
+    def _adaptive_threshold(num_references):
+        """Adaptive threshold based on number of reference images."""
+        if num_references >= 3:
+            return 0.82  # More lenient for 3-angle system
+        elif num_references >= 2:
+            return 0.78  # Medium for 2-angle system
+        return 0.75  # Strict for single angle
+    
+    @staticmethod
+    def _match(distances, threshold):
+        """
+        Decide each live face from its (N, views) distance matrix. Returns an (N,) bool array.
+        A face matches when any view is under the threshold; with 3+ views it also matches
+        when the distances are consistently low (another lighting or angle than the references)
+        or when at least 2 views are reasonably close.
+        """
+        verified = (distances < threshold).any(axis=1)
+        if distances.shape[1] >= 3:
+            consistent = (distances.mean(axis=1) < 0.88) & (distances.std(axis=1) < 0.12)
+            close_views = (distances < 0.90).sum(axis=1) >= 2
+            verified |= consistent | close_views
+        return verified
+    
+    def get_references(self, student_id):
+        """Current reference embeddings of a student, loading them if needed; None if there are none."""
+        # Pick up reference embeddings updated by other workers
+        self._refresh_from_store()
+        
+        # Check if reference embeddings are loaded
+        if student_id not in self.reference_embeddings:
+            log.info("Loading reference images for student %s", student_id)
+            if not self.load_reference_images(student_id):
+                return None
+        return self.reference_embeddings.get(student_id)
+    
+    def score_embeddings(self, student_id, live_embeddings, threshold=None, references=None):
+        """
+        Score (N, 512) live embeddings against all of a student's reference views
+        with one matrix operation. Returns one result dict per embedding.
+        """
+        references = references if references is not None else self.get_references(student_id)
+        if references is None:
+            return [
+                {'success': False, 'error': 'No reference images found for this student', 'verified': False}
+                for _ in range(len(live_embeddings))
+            ]
+        
+        if threshold is None:
+            threshold = self._adaptive_threshold(len(references))
+            log.debug("Using adaptive threshold: %s (based on %s reference images)", threshold, len(references))
+        
+        live_embeddings = np.asarray(live_embeddings, dtype=np.float32).reshape(-1, references.matrix.shape[1])
+        distances = references.distances(live_embeddings)
+        verified = self._match(distances, threshold)
+        best_distances = distances.min(axis=1)
+        
+        results = []
+        for row in range(len(live_embeddings)):
+            view_distances = {view: float(d) for view, d in zip(references.views, distances[row])}
+            log.debug("Face verification for student %s - verified: %s, best_distance: %.4f, threshold: %s, distances: %s",
+                      student_id, bool(verified[row]), best_distances[row], threshold, view_distances)
+            results.append({
+                'success': True,
+                'verified': bool(verified[row]),
+                'best_distance': float(best_distances[row]),
+                'threshold': threshold,
+                'message': 'Same person detected' if verified[row] else 'Different person detected',
+                'distances': view_distances if len(references) >= 3 else None,
+                # For a mismatch: who else the face is closest to, e.g. a proxy who is also enrolled
+                'best_other_match': None if verified[row] else self._best_other_match(live_embeddings[row], student_id)
+            })
+        return results
+    
+    def verify_face_arrays(self, student_id, live_images, threshold=None):
+        """
+        Verify several decoded BGR image arrays (e.g. every person region of a frame)
+        against one student in a single call: faces are detected and embedded as one
+        batch and scored against all reference views with one matrix operation.
+        Returns one result dict per image, in input order.
+        """
+        return self.verify_and_embed(student_id, live_images, threshold)[0]
+    
+    def verify_and_embed(self, student_id, live_images, threshold=None):
+        """
+        verify_face_arrays that also returns each image's (512,) live embedding
+        (None where no face was found), so callers can cache and re-score it.
+        Returns (results, embeddings).
+        """
+        def failure(error):
+            return {'success': False, 'error': error, 'verified': False}
+        
+        embeddings = [None] * len(live_images)
         try:
-            # Check if reference embeddings are loaded
-            if student_id not in self.reference_embeddings:
-                print(f"[INFO] Loading reference images for student {student_id}")
-                if not self.load_reference_images(student_id):
-                    return {
-                        'success': False,
-                        'error': 'No reference images found for this student',
-                        'verified': False
-                    }
+            references = self.get_references(student_id)
+            if references is None:
+                return [failure('No reference images found for this student') for _ in live_images], embeddings
             
-            # Adaptive threshold based on number of reference images
-            if threshold is None:
-                num_references = len(self.reference_embeddings[student_id])
-                if num_references >= 3:
-                    threshold = 0.82  # More lenient for 3-angle system
-                elif num_references >= 2:
-                    threshold = 0.78  # Medium for 2-angle system
+            # Detect faces in all live images
+            face_crops = detect_faces_from_arrays(live_images)
+            results = [None] * len(live_images)
+            present = []
+            for i, face_crop in enumerate(face_crops):
+                if face_crop is None:
+                    log.debug("No face detected in live image for student %s", student_id)
+                    results[i] = failure('No face detected in live image')
                 else:
-                    threshold = 0.75  # Strict for single angle
-                print(f"[DEBUG] Using adaptive threshold: {threshold} (based on {num_references} reference images)")
+                    present.append(i)
+            if not present:
+                return results, embeddings
             
-            # Detect face in live image
-            face_crop = detect_face_from_base64(live_image_base64)
-            if face_crop is None:
-                print(f"[DEBUG] No face detected in live image for student {student_id}")
-                return {
-                    'success': False,
-                    'error': 'No face detected in live image',
-                    'verified': False
-                }
-            
-            # Compute embedding for live face
-            live_embedding = self.recognizer.get_embedding(face_crop)
-            if live_embedding is None:
-                print(f"[DEBUG] Failed to compute embedding for live face for student {student_id}")
-                return {
-                    'success': False,
-                    'error': 'Failed to compute embedding for live face',
-                    'verified': False
-                }
-            
-            # Compare with reference embeddings
-            reference_embeddings = self.reference_embeddings[student_id]
-            best_match = False
-            best_distance = float('inf')
-            distances = {}
-            
-            print(f"[DEBUG] Face verification for student {student_id} - threshold: {threshold}")
-            print(f"[DEBUG] Number of reference embeddings: {len(reference_embeddings)}")
-            
-            # Calculate distances to all reference views
-            for view_type, ref_embedding in reference_embeddings.items():
-                distance = np.linalg.norm(live_embedding - ref_embedding)
-                distances[view_type] = distance
-                print(f"[DEBUG] {view_type} view distance: {distance:.4f}, threshold: {threshold}")
-                
-                if distance < best_distance:
-                    best_distance = distance
-                
-                # If any reference matches well enough, consider it the same person
-                if distance < threshold:
-                    best_match = True
-                    print(f"[DEBUG] Match found with {view_type} view! Distance: {distance:.4f}")
-            
-            # Enhanced verification logic for 3-angle system
-            if not best_match and len(distances) >= 3:
-                # Calculate average distance and standard deviation
-                avg_distance = np.mean(list(distances.values()))
-                std_distance = np.std(list(distances.values()))
-                
-                print(f"[DEBUG] Enhanced check - Avg distance: {avg_distance:.4f}, Std: {std_distance:.4f}")
-                
-                # If average distance is reasonable and distances are consistent, it might be the same person
-                # with different lighting/angle than reference images
-                if avg_distance < 0.88 and std_distance < 0.12:
-                    best_match = True
-                    print(f"[DEBUG] Enhanced verification passed - consistent distances across all views")
-            
-            # Additional leniency for 3-angle system
-            if not best_match and len(distances) >= 3:
-                # Check if at least 2 out of 3 views are reasonably close
-                close_views = sum(1 for d in distances.values() if d < 0.90)
-                if close_views >= 2:
-                    best_match = True
-                    print(f"[DEBUG] Multi-view verification passed - {close_views}/3 views are close")
-            
-            # Determine verification result
-            verified = best_match
-            
-            print(f"[DEBUG] Final verification result: {verified}, best_distance: {best_distance:.4f}")
-            if len(distances) >= 3:
-                print(f"[DEBUG] All distances: {distances}")
-            
-            return {
-                'success': True,
-                'verified': verified,
-                'best_distance': float(best_distance),
-                'threshold': threshold,
-                'message': 'Same person detected' if verified else 'Different person detected',
-                'distances': distances if len(distances) >= 3 else None
-            }
+            # Compute embeddings for all live faces and score them against every reference view
+            live_embeddings = np.vstack(self.recognizer.get_embeddings([face_crops[i] for i in present]))
+            scored = self.score_embeddings(student_id, live_embeddings, threshold, references)
+            for row, i in enumerate(present):
+                results[i] = scored[row]
+                embeddings[i] = live_embeddings[row]
+            return results, embeddings
             
         except Exception as e:
-            print(f"[ERROR] Face verification failed: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e),
-                'verified': False
-            }
+            log.error("Face verification failed: %s", e)
+            return [failure(str(e)) for _ in live_images], [None] * len(live_images)
     
     def get_verification_status(self, student_id):
         """Get the current verification status for a student."""
@@ -209,7 +356,7 @@ class FaceVerificationService:
             return {
                 'loaded': True,
                 'reference_count': len(self.reference_embeddings[student_id]),
-                'reference_views': list(self.reference_embeddings[student_id].keys())
+                'reference_views': list(self.reference_embeddings[student_id].views)
             }
         else:
             return {
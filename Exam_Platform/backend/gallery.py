@@ -0,0 +1,348 @@
+"""
+In-process gallery of every enrolled reference embedding for 1:N search.
+
+Used to tell who a face belongs to when it does not match the expected student.
+Small galleries are searched exactly with one matrix product. From
+PROCTOR_GALLERY_IVF_MIN_ROWS embeddings on, an IVF index is built: a k-means
+coarse quantiser splits the rows into inverted lists, and a query only scans the
+PROCTOR_GALLERY_NPROBE lists whose centroids are closest to it. New embeddings
+are appended to their nearest list; the index is rebuilt once the gallery has
+doubled since the last build. Index builds run in a background thread and are
+swapped in when done, so searches and writes never wait for k-means; until the
+first index is ready, searches scan every row.
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+from metrics import log
+
+GALLERY_IVF_MIN_ROWS = int(os.getenv('PROCTOR_GALLERY_IVF_MIN_ROWS', '4096'))
+GALLERY_NPROBE = int(os.getenv('PROCTOR_GALLERY_NPROBE', '8'))
+KMEANS_ITERATIONS = 8
+# Training rows per list for the k-means coarse quantiser
+KMEANS_SAMPLES_PER_LIST = 64
+# Rows assigned to their nearest list per matrix product, bounding the scores matrix
+ASSIGN_CHUNK_ROWS = 16384
+
+
+def _lists_for(rows):
+    """Inverted lists for a gallery size: about 4 * sqrt(rows), so each list holds ~sqrt(rows) / 4 rows."""
+    return max(1, int(4 * np.sqrt(rows)))
+
+
+def _normalise(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+def _spare_capacity(rows):
+    """Matrix rows to allocate when compacting, leaving room to grow without an immediate copy."""
+    return max(64, rows + rows // 4)
+
+
+def _assign(vectors, centroids):
+    """Nearest centroid (cosine) of every row, in chunks."""
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_CHUNK_ROWS):
+        chunk = _normalise(vectors[start:start + ASSIGN_CHUNK_ROWS])
+        assignment[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignment
+
+
+def _kmeans(vectors, k, rng):
+    """Spherical k-means (cosine) over normalised vectors; returns (k, dim) unit centroids."""
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        # Per-centroid sums from contiguous runs of the sorted assignment
+        order = np.argsort(assignment, kind='stable')
+        counts = np.bincount(assignment, minlength=k)
+        filled = counts > 0
+        sums = np.zeros_like(centroids)
+        sums[filled] = np.add.reduceat(vectors[order], np.concatenate(([0], np.cumsum(counts)[:-1]))[filled])
+        empty = ~filled
+        # Re-seed empty lists from random rows
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        centroids = _normalise(sums)
+    return centroids
+
+
+class EmbeddingGallery:
+    """
+    Reference embeddings of all students in one growable float32 matrix.
+
+    Rows are labelled with a student code and view type. Replacing or removing a
+    student tombstones its rows, which are compacted away on the next index build.
+    search() returns the closest students by Euclidean distance, the metric
+    FaceVerificationService uses, with at most one entry per student.
+
+    Row storage is append-only between compactions, so a background build can read
+    a prefix of the matrix without holding the lock.
+    """
+
+    def __init__(self, dim=512, ivf_min_rows=GALLERY_IVF_MIN_ROWS, nprobe=GALLERY_NPROBE):
+        self.dim = dim
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        # Bumped whenever row numbers change (reset, compaction); stale index builds are discarded
+        self._generation = 0
+        self._building = False
+        self._reset()
+        self.searches = 0
+        self.search_seconds = 0.0
+
+    def _reset(self):
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._squared_norms = np.zeros(0, dtype=np.float32)
+        self._codes = np.zeros(0, dtype=np.int64)
+        self._alive = np.zeros(0, dtype=bool)
+        self._views = []
+        self._rows = 0
+        self._student_codes = {}
+        self._code_students = []
+        self._student_rows = {}
+        self._live = 0
+        self._centroids = None
+        self._lists = []
+        self._built_rows = 0
+        self._generation += 1
+
+    def __len__(self):
+        return self._live
+
+    # ------------------------------------------------------------------ writing
+
+    def _code(self, student_id):
+        code = self._student_codes.get(student_id)
+        if code is None:
+            code = self._student_codes[student_id] = len(self._code_students)
+            self._code_students.append(student_id)
+        return code
+
+    def _reserve(self, extra):
+        needed = self._rows + extra
+        if needed <= len(self._vectors):
+            return
+        capacity = max(needed, 2 * len(self._vectors), 64)
+        for name, fill in (('_vectors', 0.0), ('_squared_norms', 0.0), ('_codes', -1), ('_alive', False)):
+            old = getattr(self, name)
+            grown = np.full((capacity, *old.shape[1:]), fill, dtype=old.dtype)
+            grown[:self._rows] = old[:self._rows]
+            setattr(self, name, grown)
+
+    def _append(self, student_id, views, matrix):
+        count = len(views)
+        self._reserve(count)
+        rows = np.arange(self._rows, self._rows + count)
+        self._vectors[rows] = matrix
+        self._squared_norms[rows] = np.einsum('ij,ij->i', matrix, matrix)
+        self._codes[rows] = self._code(student_id)
+        self._alive[rows] = True
+        self._views.extend(views)
+        self._rows += count
+        self._student_rows[student_id] = rows.tolist()
+        self._live += count
+        if self._centroids is not None:
+            for row, list_id in zip(rows, _assign(matrix, self._centroids)):
+                self._lists[list_id] = np.append(self._lists[list_id], row)
+
+    def _drop(self, student_id):
+        rows = self._student_rows.pop(student_id, None)
+        if rows:
+            self._alive[rows] = False
+            self._live -= len(rows)
+
+    def _compact(self):
+        """Remove tombstoned rows, keeping spare capacity and remapping the inverted lists."""
+        keep = np.flatnonzero(self._alive[:self._rows])
+        if len(keep) == self._rows:
+            return
+        remap = np.full(self._rows, -1, dtype=np.int64)
+        remap[keep] = np.arange(len(keep))
+        capacity = _spare_capacity(len(keep))
+        for name, fill in (('_vectors', 0.0), ('_squared_norms', 0.0), ('_codes', -1), ('_alive', False)):
+            old = getattr(self, name)
+            compacted = np.full((capacity, *old.shape[1:]), fill, dtype=old.dtype)
+            compacted[:len(keep)] = old[keep]
+            setattr(self, name, compacted)
+        self._views = [self._views[row] for row in keep]
+        self._rows = len(keep)
+        self._student_rows = {
+            student_id: remap[rows].tolist() for student_id, rows in self._student_rows.items()
+        }
+        self._lists = [remap[rows][remap[rows] >= 0] for rows in self._lists]
+        self._generation += 1
+
+    def set_student(self, student_id, views, matrix):
+        """Insert or replace all reference embeddings of one student."""
+        matrix = np.asarray(matrix, dtype=np.float32).reshape(len(views), self.dim)
+        with self._lock:
+            self._drop(student_id)
+            if len(views):
+                self._append(student_id, list(views), matrix)
+            self._maybe_build()
+
+    def add(self, student_id, view_type, embedding):
+        """Insert or replace one view of a student."""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(1, self.dim)
+        with self._lock:
+            rows = self._student_rows.get(student_id, [])
+            kept = [row for row in rows if self._views[row] != view_type]
+            views = [self._views[row] for row in kept] + [view_type]
+            matrix = np.vstack((self._vectors[kept], vector))
+        self.set_student(student_id, views, matrix)
+
+    def remove(self, student_id):
+        with self._lock:
+            self._drop(student_id)
+            self._maybe_build()
+
+    def load(self, student_ids, view_types, matrix):
+        """Replace the gallery with a bulk load, e.g. every row of the embedding store."""
+        matrix = np.asarray(matrix, dtype=np.float32).reshape(-1, self.dim)
+        grouped = {}
+        for row, student_id in enumerate(student_ids):
+            grouped.setdefault(student_id, []).append(row)
+        with self._lock:
+            self._reset()
+            for student_id, rows in grouped.items():
+                self._append(student_id, [view_types[row] for row in rows], matrix[rows])
+            self._maybe_build()
+
+    # ------------------------------------------------------------------ index
+
+    def _maybe_build(self):
+        live = len(self)
+        if live < self.ivf_min_rows:
+            self._centroids = None
+            self._lists = []
+        elif self._centroids is None or live >= 2 * self._built_rows:
+            self.build(background=True)
+        # Tombstones of replaced students are compacted away once they outnumber live rows;
+        # a running build compacts when it is swapped in
+        dead = self._rows - live
+        if not self._building and dead > max(live, 64):
+            self._compact()
+
+    def build(self, background=False):
+        """
+        Rebuild the IVF lists (and compact tombstoned rows) from the current rows.
+        With background=True the k-means runs in a daemon thread; the call returns at once.
+        """
+        with self._lock:
+            if self._building:
+                return
+            live_rows = np.flatnonzero(self._alive[:self._rows])
+            if len(live_rows) < self.ivf_min_rows:
+                self._compact()
+                return
+            self._building = True
+            # Rows below the watermark are not rewritten until the next compaction
+            snapshot = (self._generation, self._rows, self._vectors[:self._rows], live_rows)
+        if background:
+            threading.Thread(target=self._build_index, args=snapshot, name='gallery-index', daemon=True).start()
+        else:
+            self._build_index(*snapshot)
+
+    def _build_index(self, generation, watermark, vectors, live_rows):
+        start = time.perf_counter()
+        try:
+            rng = np.random.default_rng(0)
+            nlist = min(_lists_for(len(live_rows)), len(live_rows))
+            sample_size = min(len(live_rows), nlist * KMEANS_SAMPLES_PER_LIST)
+            sample = _normalise(vectors[rng.choice(live_rows, size=sample_size, replace=False)])
+            centroids = _kmeans(sample, nlist, rng)
+            assignment = _assign(vectors, centroids)
+        except Exception as e:
+            log.error("Gallery index build failed: %s", e)
+            with self._lock:
+                self._building = False
+            return
+        with self._lock:
+            self._building = False
+            if generation != self._generation:
+                # The gallery was reloaded meanwhile; build again from the new rows
+                self._maybe_build()
+                return
+            if self._rows > watermark:
+                assignment = np.concatenate((assignment, _assign(self._vectors[watermark:self._rows], centroids)))
+            order = np.argsort(assignment, kind='stable')
+            bounds = np.searchsorted(assignment[order], np.arange(nlist + 1))
+            self._centroids = centroids
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(nlist)]
+            self._built_rows = len(self)
+            self._compact()
+            log.info("Built gallery index: %s embeddings in %s lists (%.0f ms)",
+                     len(self), nlist, (time.perf_counter() - start) * 1000.0)
+            self._maybe_build()
+
+    # ------------------------------------------------------------------ reading
+
+    def _candidates(self, query):
+        """Rows of the nprobe inverted lists whose centroids are closest to the query."""
+        scores = self._centroids @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        nprobe = min(self.nprobe, len(self._lists))
+        probes = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        return np.concatenate([self._lists[list_id] for list_id in probes])
+
+    def search(self, embedding, k=1, exclude=None):
+        """
+        Closest students to one embedding, best first.
+        Returns up to k dicts {'student_id', 'view', 'distance'}; `exclude` skips one student.
+        """
+        query = np.asarray(embedding, dtype=np.float32).reshape(self.dim)
+        start = time.perf_counter()
+        with self._lock:
+            excluded = self._student_codes.get(exclude, -1)
+            if self._centroids is None:
+                # Exact scan over a view of all rows (no copy), then drop tombstones and `exclude`
+                scores = self._squared_norms[:self._rows] - 2.0 * (self._vectors[:self._rows] @ query)
+                rows = np.flatnonzero(self._alive[:self._rows] & (self._codes[:self._rows] != excluded))
+                squared = scores[rows]
+            else:
+                rows = self._candidates(query)
+                rows = rows[self._alive[rows] & (self._codes[rows] != excluded)]
+                squared = self._squared_norms[rows] - 2.0 * (self._vectors[rows] @ query)
+            if len(rows) == 0:
+                matches = []
+            else:
+                distances = np.sqrt(np.clip(squared + float(query @ query), 0.0, None))
+                # Enough candidates for k distinct students even if each has several views
+                top = min(len(rows), 4 * k)
+                nearest = np.argpartition(distances, top - 1)[:top]
+                nearest = nearest[np.argsort(distances[nearest])]
+                matches, seen = [], set()
+                for i in nearest:
+                    code = int(self._codes[rows[i]])
+                    if code in seen:
+                        continue
+                    seen.add(code)
+                    matches.append({
+                        'student_id': self._code_students[code],
+                        'view': self._views[rows[i]],
+                        'distance': float(distances[i])
+                    })
+                    if len(matches) == k:
+                        break
+            self.searches += 1
+            self.search_seconds += time.perf_counter() - start
+        return matches
+
+    def get_status(self):
+        with self._lock:
+            return {
+                'students': len(self._student_rows),
+                'embeddings': len(self),
+                'rows_including_tombstones': self._rows,
+                'index': 'ivf' if self._centroids is not None else 'flat',
+                'building': self._building,
+                'lists': len(self._lists),
+                'nprobe': self.nprobe,
+                'searches': self.searches,
+                'avg_search_ms': self.search_seconds / self.searches * 1000.0 if self.searches else None
+            }
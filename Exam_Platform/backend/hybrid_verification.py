@@ -1,339 +1,268 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
 import time
+import box_ops
+import landmarks
+import pose
 from face_verification import FaceVerificationService
-from detection import detect_face_from_base64
-import base64
-import io
-from PIL import Image
+from batching import MicroBatcher
+from inference_backends import YOLO_MAX_BATCH_SIZE
+from model_registry import get_yolo
+from session_registry import SessionRegistry, ProctoringSession, new_multiple_people_history
+from motion_gate import MotionGate, motion_thumbnail
+from cascade import CascadeScheduler
+from embedding_cache import EmbeddingCache
+from metrics import log
+
+def _elapsed_ms(start):
+    return (time.perf_counter() - start) * 1000.0
 
 class HybridVerificationService:
-    def __init__(self):
-        self.yolo_detector = YOLO('yolov8n.pt')
-        self.face_verifier = FaceVerificationService()
+    def __init__(self, face_verifier=None):
+        # Frames from concurrent sessions share one batched YOLO forward pass
+        self.yolo_batcher = MicroBatcher(self._run_yolo_batch, max_batch_size=YOLO_MAX_BATCH_SIZE, name='yolo')
+        # Share the caller's verifier so reference embeddings are cached once per process
+        self.face_verifier = face_verifier if face_verifier is not None else FaceVerificationService()
         self.person_class = 0  # YOLO class for person
         self.face_class = 0    # YOLO class for face
         self.person_confidence = 0.5
         self.face_confidence = 0.7
         
-        # Initialize MediaPipe Face Mesh for detailed face analysis
-        import mediapipe as mp
-        self.mp_face_mesh = mp.solutions.face_mesh
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
-            max_num_faces=3,
-            min_detection_confidence=0.7,
-            min_tracking_confidence=0.7
-        )
-        
-        # Key facial landmarks for head pose estimation
-        self.pose_landmarks = [33, 263, 1, 61, 291, 199]  # Nose, left eye, right eye, left mouth, right mouth, chin
-        
-        # Eye landmarks for looking away detection
-        self.left_eye = [33, 133]  # Left eye outer and inner corners
-        self.right_eye = [362, 263]  # Right eye outer and inner corners
-        self.eye_top = [159, 386]  # Top of left and right eyes
-        self.eye_bottom = [145, 374]  # Bottom of left and right eyes
+        # MediaPipe Face Mesh instances are created per worker thread in landmarks.py;
+        # pose and gaze landmarks and thresholds live in pose.py
         
-        # Tracking state
-        self.tracked_person_id = None
-        self.person_last_seen = None
-        self.person_disappeared = False
-        self.face_verification_required = False
-        self.last_verification_time = 0
+        # Verification timing
         self.verification_cooldown = 5  # seconds
         
-        # Person tracking history
-        self.person_tracking_history = {}
-        
-        # Device detection temporal tracking
-        self.device_detection_history = {}
+        # Device detection thresholds
         self.device_min_duration = 0.5  # Minimum seconds device must be visible
         self.device_confidence_threshold = 0.3
         self.device_classes = {67: 'cell phone', 73: 'laptop', 62: 'monitor/tv'}
         
-        # Multiple people detection temporal tracking
-        self.multiple_people_detection_history = {
-            'first_detected': None,
-            'last_detected': None,
-            'total_detections': 0,
-            'consecutive_frames': 0,
-            'violation_triggered': False
-        }
+        # Multiple people detection thresholds
         self.multiple_people_min_duration = 1.0  # Adjusted: Minimum seconds multiple people must be visible
         self.multiple_people_confidence_threshold = 0.3  # Lowered: Confidence for multiple people
         
-        self.person_id_counter = 0
-        self.person_id_map = {}  # Maps bbox center to ID
-        self.original_student_id = None  # Preserved original student's person ID
+        # Per-(student, exam) tracking state lives in the session registry
+        self.sessions = SessionRegistry()
+        # Skips the heavy models for frames where nothing moved
+        self.motion_gate = MotionGate()
+        # Per-check cadence, trigger conditions and cost accounting
+        self.scheduler = CascadeScheduler()
+        # Live embeddings and verification results per tracked person, shared by all sessions
+        self.embedding_cache = EmbeddingCache()
         
-    def _pil_to_base64(self, pil_image):
-        """Convert PIL image to base64 string."""
-        buffer = io.BytesIO()
-        pil_image.save(buffer, format='PNG')
-        img_str = base64.b64encode(buffer.getvalue()).decode()
-        return f"data:image/png;base64,{img_str}"
+    @property
+    def yolo_detector(self):
+        # Resolved on use so constructing the service does not load the weights
+        return get_yolo()
     
-    def _detect_person_and_face(self, frame):
-        """Detect person and face objects in the frame."""
-        results = self.yolo_detector(frame)
-        
-        persons = []
-        faces = []
+    def _run_yolo_batch(self, frames):
+        """Run YOLO over a list of frames in one call; returns one Results object per frame."""
+        return self.yolo_detector(frames, verbose=False)
+    
+    def _run_yolo(self, frame):
+        """Run a single YOLO forward pass and return the results shared by all per-frame checks."""
+        return [self.yolo_batcher(frame)]
+    
+    def _detect_person_and_face(self, frame, detections):
+        """Detect person and face objects from the frame's YOLO detection arrays."""
+        boxes, confs, classes = detections
+        person_mask = (classes == self.person_class) & (confs > self.person_confidence)
+        face_mask = ~person_mask & (classes == self.face_class) & (confs > self.face_confidence)
         
-        for result in results:
-            for box in result.boxes:
-                cls = int(box.cls[0])
-                conf = float(box.conf[0])
-                bbox = box.xyxy[0].cpu().numpy()
-                
-                if cls == self.person_class and conf > self.person_confidence:
-                    persons.append({
-                        'bbox': bbox,
-                        'confidence': conf,
-                        'center': ((bbox[0] + bbox[2])/2, (bbox[1] + bbox[3])/2)
-                    })
-                elif cls == self.face_class and conf > self.face_confidence:
-                    faces.append({
-                        'bbox': bbox,
-                        'confidence': conf
-                    })
+        person_boxes = np.ascontiguousarray(boxes[person_mask])
+        person_centers = box_ops.centers(person_boxes)
+        persons = [
+            {
+                'bbox': person_boxes[i],
+                'confidence': float(conf),
+                'center': (float(person_centers[i, 0]), float(person_centers[i, 1]))
+            } for i, conf in enumerate(confs[person_mask])
+        ]
+        faces = [
+            {
+                'bbox': bbox,
+                'confidence': float(conf)
+            } for bbox, conf in zip(boxes[face_mask], confs[face_mask])
+        ]
         
         return persons, faces
     
-    def _detect_comprehensive_violations(self, frame, violations):
+    def _detect_comprehensive_violations(self, session, frame, violations, detections, timings):
         """
         Detect comprehensive violations including multiple faces, looking away, head turning, and devices.
+        Reuses the YOLO detection arrays already computed for this frame; FaceMesh and device
+        tracking run when the cascade scheduler says they are due.
         """
         try:
-            # Detect faces and devices using YOLO
-            yolo_results = self.yolo_detector(frame)
-            
-            # Count faces detected by YOLO
-            face_count = 0
-            face_boxes = []
-            current_time = time.time()
+            boxes, confs, classes = detections
+            # Faces with higher confidence (YOLO class 0 is face)
+            face_boxes = np.ascontiguousarray(boxes[(classes == 0) & (confs > 0.7)])
+            face_count = len(face_boxes)
             
-            # Track current frame device detections
+            # Devices above the confidence threshold
             current_frame_devices = set()
+            device_mask = np.isin(classes, list(self.device_classes)) & (confs > self.device_confidence_threshold)
+            for cls, conf in zip(classes[device_mask].tolist(), confs[device_mask].tolist()):
+                device_name = self.device_classes[cls]
+                current_frame_devices.add(device_name)
+                log.debug("Device detected: %s (confidence: %.2f)", device_name, conf)
             
-            for result in yolo_results:
-                for box in result.boxes:
-                    cls = int(box.cls[0])
-                    conf = float(box.conf[0])
-                    
-                    # Check for faces with higher confidence
-                    if cls == 0 and conf > 0.7:  # YOLO class 0 is face
-                        face_count += 1
-                        face_boxes.append(box.xyxy[0])  # Store face box coordinates
-                        
-                        # Get face region for detailed analysis
-                        x1, y1, x2, y2 = map(int, box.xyxy[0])
-                        face_region = frame[y1:y2, x1:x2]
-                        
-                        # Process face region with MediaPipe for detailed analysis
-                        if face_region.size > 0:  # Check if face region is valid
-                            rgb_face = cv2.cvtColor(face_region, cv2.COLOR_BGR2RGB)
-                            face_results = self.face_mesh.process(rgb_face)
-                            
-                            if face_results.multi_face_landmarks:
-                                for face_landmarks in face_results.multi_face_landmarks:
-                                    # Check head pose
-                                    pitch, yaw, roll = self._get_head_pose(face_landmarks)
-                                    print(f"[DEBUG] Head pose - Yaw: {yaw:.1f}°, Pitch: {pitch:.1f}°, Roll: {roll:.1f}°")
-                                    if abs(yaw) > 30 or abs(pitch) > 20:  # Thresholds in degrees
-                                        violations['head_turning'] = True
-                                        print(f"[DEBUG] Head turning detected - Yaw: {yaw:.1f}°, Pitch: {pitch:.1f}°")
-
-                                    # Check gaze direction
-                                    looking_away_result = self._is_looking_away(face_landmarks, self.left_eye, self.right_eye, self.eye_top, self.eye_bottom)
-                                    if looking_away_result:
-                                        violations['looking_away'] = True
-                                        print(f"[DEBUG] Looking away violation triggered")
-                    
-                    # Check for devices with temporal tracking
-                    elif cls in self.device_classes and conf > self.device_confidence_threshold:
-                        device_name = self.device_classes[cls]
-                        current_frame_devices.add(device_name)
-                        print(f"[DEBUG] Device detected: {device_name} (confidence: {conf:.2f})")
-                        
-                        # Update device detection history
-                        if device_name not in self.device_detection_history:
-                            self.device_detection_history[device_name] = {
-                                'first_detected': current_time,
-                                'last_detected': current_time,
-                                'total_detections': 1,
-                                'consecutive_frames': 1
-                            }
-                            print(f"[DEBUG] New device tracking started: {device_name}")
-                        else:
-                            # Update existing device tracking
-                            device_track = self.device_detection_history[device_name]
-                            device_track['last_detected'] = current_time
-                            device_track['total_detections'] += 1
-                            device_track['consecutive_frames'] += 1
-                            print(f"[DEBUG] Device tracking updated: {device_name} (consecutive: {device_track['consecutive_frames']})")
-            
-            # Check for devices that were detected before but not in current frame
-            devices_to_remove = []
-            for device_name, device_track in self.device_detection_history.items():
-                if device_name not in current_frame_devices:
-                    # Device not detected in current frame, reset consecutive count
-                    device_track['consecutive_frames'] = 0
-                    
-                    # If device hasn't been detected for too long, remove from history
-                    if current_time - device_track['last_detected'] > 3.0:  # 3 seconds timeout
-                        devices_to_remove.append(device_name)
-            
-            # Remove expired devices
-            for device_name in devices_to_remove:
-                del self.device_detection_history[device_name]
+            # Head pose and gaze with MediaPipe
+            if self.scheduler.applies(session, 'face_mesh', face_count):
+                if self.scheduler.is_due(session, 'face_mesh'):
+                    stage_start = time.perf_counter()
+                    head_turning, looking_away = self._analyze_faces(frame, face_boxes)
+                    timings['face_mesh_ms'] = _elapsed_ms(stage_start)
+                    self.scheduler.record_run(session, 'face_mesh', timings['face_mesh_ms'], (head_turning, looking_away))
+                else:
+                    self.scheduler.record_skip('face_mesh')
+                    head_turning, looking_away = self.scheduler.last_result(session, 'face_mesh', (False, False))
+                violations['head_turning'] = head_turning
+                violations['looking_away'] = looking_away
+            else:
+                self.scheduler.record_skip('face_mesh')
             
-            # Check if any device has been detected for minimum duration
-            for device_name, device_track in self.device_detection_history.items():
-                detection_duration = current_time - device_track['first_detected']
-                print(f"[DEBUG] Device {device_name}: duration={detection_duration:.1f}s, consecutive={device_track['consecutive_frames']}")
-                if detection_duration >= self.device_min_duration:
-                    violations['device_detected'] = True
-                    print(f"[WARNING] Device violation: {device_name} detected for {detection_duration:.1f}s")
-                    break
+            # Devices with temporal tracking
+            if self.scheduler.applies(session, 'devices'):
+                if self.scheduler.is_due(session, 'devices'):
+                    stage_start = time.perf_counter()
+                    device_detected = self._update_device_history(session, current_frame_devices)
+                    self.scheduler.record_run(session, 'devices', _elapsed_ms(stage_start), device_detected)
+                else:
+                    self.scheduler.record_skip('devices')
+                    device_detected = self.scheduler.last_result(session, 'devices', False)
+                violations['device_detected'] = device_detected
+            else:
+                self.scheduler.record_skip('devices')
 
             # Set multiple faces violation only if we have clear evidence of multiple faces
             if face_count > 1:
                 # Additional check: verify that faces are not too close to each other
                 # (to avoid false positives from face detection artifacts)
-                is_multiple_faces = True
-                for i in range(len(face_boxes)):
-                    for j in range(i + 1, len(face_boxes)):
-                        box1 = face_boxes[i]
-                        box2 = face_boxes[j]
-                        
-                        # Calculate distance between face centers
-                        center1 = ((box1[0] + box1[2])/2, (box1[1] + box1[3])/2)
-                        center2 = ((box2[0] + box2[2])/2, (box2[1] + box2[3])/2)
-                        distance = math.sqrt((center1[0] - center2[0])**2 + (center1[1] - center2[1])**2)
-                        
-                        # If faces are too close, it might be a false positive
-                        if distance < 50:  # Minimum distance threshold in pixels
-                            is_multiple_faces = False
-                            break
-                    
-                    if not is_multiple_faces:
-                        break
-                
-                violations['multiple_faces'] = is_multiple_faces
+                face_centers = box_ops.centers(face_boxes)
+                rows, cols = box_ops.upper_pairs(face_count)
+                distances = box_ops.pairwise_distances(face_centers, face_centers)[rows, cols]
+                # If any two faces are too close, it might be a false positive
+                violations['multiple_faces'] = not bool((distances < 50).any())  # Minimum distance threshold in pixels
                 
         except Exception as e:
-            print(f"[ERROR] Comprehensive violation detection failed: {str(e)}")
+            log.error("Comprehensive violation detection failed: %s", e)
     
-    def _get_head_pose(self, face_landmarks):
+    def _analyze_faces(self, frame, face_boxes):
         """
-        Calculate head pose (pitch, yaw, roll) using 6 key facial points
+        Run FaceMesh once on the full frame, match the faces to the YOLO face boxes
+        and check each matched face; returns (head_turning, looking_away).
         """
-        import numpy as np
-        import cv2
-        face_3d = []
-        face_2d = []
-
-        for idx in self.pose_landmarks:
-            lm = face_landmarks.landmark[idx]
-            x, y, z = lm.x, lm.y, lm.z
-            face_3d.append([x * 100, y * 100, z * 100])
-            face_2d.append([x * 100, y * 100])
-
-        face_2d = np.array(face_2d, dtype=np.float64)
-        face_3d = np.array(face_3d, dtype=np.float64)
-
-        # Camera matrix estimation
-        focal_length = 500
-        center = (100, 100)
-        cam_matrix = np.array([
-            [focal_length, 0, center[0]],
-            [0, focal_length, center[1]],
-            [0, 0, 1]
-        ], dtype=np.float64)
-
-        dist_matrix = np.zeros((4, 1), dtype=np.float64)
-
-        # Solve PnP
-        success, rot_vec, trans_vec = cv2.solvePnP(
-            face_3d, face_2d, cam_matrix, dist_matrix
-        )
-
-        # Get rotational matrix
-        rmat, jac = cv2.Rodrigues(rot_vec)
-
-        # Get angles
-        angles, mtxR, mtxQ, Qx, Qy, Qz = cv2.RQDecomp3x3(rmat)
-
-        return angles[0], angles[1], angles[2]  # pitch, yaw, roll
-
-    def _is_looking_away(self, face_landmarks, left_eye, right_eye, eye_top, eye_bottom):
-        """
-        Detect if person is looking away using eye aspect ratio and head pose
-        """
-        import math
-        def get_distance(p1, p2):
-            return math.sqrt((p1.x - p2.x)**2 + (p1.y - p2.y)**2)
-
-        # Calculate Eye Aspect Ratio (EAR) for both eyes
-        left_ear = (
-            get_distance(face_landmarks.landmark[eye_top[0]], face_landmarks.landmark[eye_bottom[0]]) /
-            get_distance(face_landmarks.landmark[left_eye[0]], face_landmarks.landmark[left_eye[1]])
-        )
-
-        right_ear = (
-            get_distance(face_landmarks.landmark[eye_top[1]], face_landmarks.landmark[eye_bottom[1]]) /
-            get_distance(face_landmarks.landmark[right_eye[0]], face_landmarks.landmark[right_eye[1]])
-        )
-
-        # Get head pose
-        pitch, yaw, _ = self._get_head_pose(face_landmarks)
-
-        # Combined check for looking away:
-        # 1. Significant head turn (yaw)
-        # 2. Looking up/down significantly (pitch)
-        # 3. Eyes mostly closed or wide open (unusual EAR)
-        avg_ear = (left_ear + right_ear) / 2
-        normal_ear_range = (0.2, 0.5)  # Normal range for eye aspect ratio
-
-        return (
-            abs(yaw) > 30 or  # Head turned too much
-            abs(pitch) > 20 or  # Looking too far up/down
-            avg_ear < normal_ear_range[0] or  # Eyes too closed
-            avg_ear > normal_ear_range[1]  # Eyes too wide
-        )
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        landmark_sets = landmarks.extract_landmarks(rgb_frame)
+        
+        # Landmarks are re-normalised to their box, so thresholds match the per-crop analysis
+        matched = landmarks.match_landmarks_to_boxes(landmark_sets, face_boxes, frame.shape)
+        if not matched:
+            return False, False
+        
+        # One pose solve per face, all faces in one call
+        face_pose = pose.estimate(np.stack([face_landmarks for _, face_landmarks in matched]))
+        for yaw, pitch, roll, ear in zip(face_pose['yaw'], face_pose['pitch'], face_pose['roll'], face_pose['ear']):
+            log.debug("Head pose - Yaw: %.1f°, Pitch: %.1f°, Roll: %.1f°, EAR: %.2f", yaw, pitch, roll, ear)
+        head_turning = bool(face_pose['head_turning'].any())
+        looking_away = bool(face_pose['looking_away'].any())
+        if head_turning:
+            log.debug("Head turning detected")
+        if looking_away:
+            log.debug("Looking away violation triggered")
+        return head_turning, looking_away
     
-    def _assign_person_ids(self, persons):
-        # Assign unique IDs to all detected persons based on bbox center proximity
-        assigned_ids = []
-        for person in persons:
-            center = tuple(person['center'])
-            # Find closest existing center
-            min_dist = float('inf')
-            min_id = None
-            for prev_center, pid in self.person_id_map.items():
-                dist = ((center[0] - prev_center[0])**2 + (center[1] - prev_center[1])**2)**0.5
-                if dist < 50:  # Threshold for matching same person
-                    if dist < min_dist:
-                        min_dist = dist
-                        min_id = pid
-            if min_id is not None:
-                person['id'] = min_id
-                assigned_ids.append(min_id)
+    def _update_device_history(self, session, current_frame_devices):
+        """Update per-device temporal tracking; returns True when a device has been visible long enough."""
+        current_time = time.time()
+        for device_name in current_frame_devices:
+            # Update device detection history
+            if device_name not in session.device_detection_history:
+                session.device_detection_history[device_name] = {
+                    'first_detected': current_time,
+                    'last_detected': current_time,
+                    'total_detections': 1,
+                    'consecutive_frames': 1
+                }
+                log.debug("New device tracking started: %s", device_name)
             else:
-                self.person_id_counter += 1
-                person['id'] = self.person_id_counter
-                assigned_ids.append(self.person_id_counter)
-            self.person_id_map[center] = person['id']
-        # Remove old IDs not seen in this frame
-        self.person_id_map = {center: pid for center, pid in self.person_id_map.items() if pid in assigned_ids}
+                # Update existing device tracking
+                device_track = session.device_detection_history[device_name]
+                device_track['last_detected'] = current_time
+                device_track['total_detections'] += 1
+                device_track['consecutive_frames'] += 1
+                log.debug("Device tracking updated: %s (consecutive: %s)", device_name, device_track['consecutive_frames'])
+        
+        # Check for devices that were detected before but not in current frame
+        devices_to_remove = []
+        for device_name, device_track in session.device_detection_history.items():
+            if device_name not in current_frame_devices:
+                # Device not detected in current frame, reset consecutive count
+                device_track['consecutive_frames'] = 0
+                
+                # If device hasn't been detected for too long, remove from history
+                if current_time - device_track['last_detected'] > 3.0:  # 3 seconds timeout
+                    devices_to_remove.append(device_name)
+        
+        # Remove expired devices
+        for device_name in devices_to_remove:
+            del session.device_detection_history[device_name]
+        
+        # Check if any device has been detected for minimum duration
+        for device_name, device_track in session.device_detection_history.items():
+            detection_duration = current_time - device_track['first_detected']
+            log.debug("Device %s: duration=%.1fs, consecutive=%s", device_name, detection_duration, device_track['consecutive_frames'])
+            if detection_duration >= self.device_min_duration:
+                log.warning("Device violation: %s detected for %.1fs", device_name, detection_duration)
+                return True
+        return False
+    
+    def _assign_person_ids(self, session, persons):
+        """Assign stable IDs to the detected persons with the session's multi-object tracker."""
+        track_ids = session.person_tracker.update(box_ops.as_boxes([person['bbox'] for person in persons]))
+        for person, track_id in zip(persons, track_ids.tolist()):
+            person['id'] = track_id
         return persons
 
-    def process_frame(self, frame, student_id):
+    def process_frame(self, frame, student_id, exam_id=None):
         """
         Process a frame and return verification status and violations.
+        Tracking state is kept per (student_id, exam_id) session.
         """
+        session = self.sessions.get(student_id, exam_id)
+        with session.lock:
+            gate_start = time.perf_counter()
+            thumbnail = motion_thumbnail(frame)
+            if self.motion_gate.should_skip(session, thumbnail):
+                return self._cached_result(session, _elapsed_ms(gate_start))
+            gate_ms = _elapsed_ms(gate_start)
+
+            result = self._process_session_frame(session, frame, student_id)
+            if session.last_result is result:
+                session.motion_reference = thumbnail
+            result['timings']['gate_ms'] = gate_ms
+            return result
+    
+    def _cached_result(self, session, gate_ms):
+        """Reuse the last full analysis for a frame the motion gate skipped."""
+        cached = session.last_result
+        if cached['detection_boxes']['persons']:
+            # The scene is unchanged, so the examinee is still in view
+            session.person_last_seen = time.time()
+        return {
+            'violations': dict(cached['violations']),
+            'verification': {**cached['verification'], 'face_verification_triggered': False},
+            'tracked_person_id': session.tracked_person_id,
+            'detection_boxes': cached['detection_boxes'],
+            'timings': {'gate_ms': gate_ms},
+            'gated': True
+        }
+    
+    def _process_session_frame(self, session, frame, student_id):
+        """Run the detection pipeline for one frame against the given session's state."""
         violations = {
             'person_disappeared': False,
             'identity_mismatch': False,
@@ -356,153 +285,274 @@ class HybridVerificationService:
             'faces': []
         }
         
+        # Per-stage wall time in milliseconds
+        timings = {}
+        analysis_complete = False
+        
         try:
+            session.frame_index += 1
+            
+            # One YOLO pass per frame feeds every detector below
+            stage_start = time.perf_counter()
+            yolo_results = self._run_yolo(frame)
+            detections = box_ops.result_arrays(yolo_results)
+            timings['yolo_ms'] = _elapsed_ms(stage_start)
+            self.scheduler.account('yolo', timings['yolo_ms'])
+            
             # Detect persons and faces
-            persons, faces = self._detect_person_and_face(frame)
-            persons = self._assign_person_ids(persons)
+            stage_start = time.perf_counter()
+            persons, faces = self._detect_person_and_face(frame, detections)
+            persons = self._assign_person_ids(session, persons)
+            self.scheduler.account('tracking', _elapsed_ms(stage_start))
             
             # Store detection boxes for frontend visualization
             detection_boxes['persons'] = persons
             detection_boxes['faces'] = faces
             
             # Check for multiple people with temporal persistence
-            multiple_people_detected = self._detect_multiple_people_with_persistence(persons)
+            multiple_people_detected = False
+            if self.scheduler.applies(session, 'multiple_people'):
+                if self.scheduler.is_due(session, 'multiple_people'):
+                    check_start = time.perf_counter()
+                    multiple_people_detected = self._detect_multiple_people_with_persistence(session, persons)
+                    self.scheduler.record_run(session, 'multiple_people', _elapsed_ms(check_start), multiple_people_detected)
+                else:
+                    self.scheduler.record_skip('multiple_people')
+                    multiple_people_detected = self.scheduler.last_result(session, 'multiple_people', False)
+            else:
+                self.scheduler.record_skip('multiple_people')
             if multiple_people_detected:
                 violations['multiple_people'] = True
                 verification_result['message'] = 'Multiple people detected'
-                # New logic: Run face verification for all detected persons
-                for person in persons:
-                    # Extract bounding box
-                    bbox = person['bbox']
-                    x1, y1, x2, y2 = map(int, bbox)
-                    person_region = frame[y1:y2, x1:x2]
-                    if person_region.size > 0:
-                        # Convert to base64 for face verification
-                        try:
-                            frame_rgb = cv2.cvtColor(person_region, cv2.COLOR_BGR2RGB)
-                            pil_image = Image.fromarray(frame_rgb)
-                            frame_base64 = self._pil_to_base64(pil_image)
-                            face_result = self.face_verifier.verify_face(student_id, frame_base64)
-                            if face_result['success'] and not face_result['verified']:
-                                violations['identity_mismatch'] = True
-                                verification_result['message'] = 'Identity verification failed - different person detected (multiple people)'
-                                break  # No need to check further if a proxy is found
-                        except Exception as e:
-                            print(f"[ERROR] Face verification for multiple people failed: {str(e)}")
+                # Run face verification for all detected persons in one batch,
+                # directly on the frame regions, no re-encoding
+                try:
+                    for face_result in self._verify_people(session, student_id, frame, persons, timings):
+                        if face_result and face_result['success'] and not face_result['verified']:
+                            self._flag_identity_mismatch(violations, verification_result, face_result,
+                                                         'Identity verification failed - different person detected (multiple people)')
+                            break  # One proxy is enough
+                except Exception as e:
+                    log.error("Face verification for multiple people failed: %s", e)
+            
+            timings['people_ms'] = _elapsed_ms(stage_start)
             
             # Comprehensive violation detection using MediaPipe and YOLO
-            self._detect_comprehensive_violations(frame, violations)
+            stage_start = time.perf_counter()
+            self._detect_comprehensive_violations(session, frame, violations, detections, timings)
+            timings['comprehensive_ms'] = _elapsed_ms(stage_start)
             
             # Track the main person (largest bbox)
+            stage_start = time.perf_counter()
             if persons:
                 main_person = max(persons, key=lambda p: (p['bbox'][2] - p['bbox'][0]) * (p['bbox'][3] - p['bbox'][1]))
                 main_person_id = main_person['id']
                 # On first run, set the original student ID after successful verification
-                if self.original_student_id is None:
+                if session.original_student_id is None:
                     # Run face verification for the first main person
-                    x1, y1, x2, y2 = map(int, main_person['bbox'])
-                    person_region = frame[y1:y2, x1:x2]
-                    if person_region.size > 0:
-                        frame_rgb = cv2.cvtColor(person_region, cv2.COLOR_BGR2RGB)
-                        pil_image = Image.fromarray(frame_rgb)
-                        frame_base64 = self._pil_to_base64(pil_image)
-                        face_result = self.face_verifier.verify_face(student_id, frame_base64)
-                        if face_result['success'] and face_result['verified']:
-                            self.original_student_id = main_person_id
-                            self.tracked_person_id = main_person_id
+                    face_result = self._verify_person(session, student_id, frame, main_person, timings)
+                    if face_result and face_result['success'] and face_result['verified']:
+                        session.original_student_id = main_person_id
+                        session.tracked_person_id = main_person_id
                 else:
                     # If the tracked person ID changes, verify the new person
-                    if self.tracked_person_id != main_person_id:
-                        x1, y1, x2, y2 = map(int, main_person['bbox'])
-                        person_region = frame[y1:y2, x1:x2]
-                        if person_region.size > 0:
-                            frame_rgb = cv2.cvtColor(person_region, cv2.COLOR_BGR2RGB)
-                            pil_image = Image.fromarray(frame_rgb)
-                            frame_base64 = self._pil_to_base64(pil_image)
-                            face_result = self.face_verifier.verify_face(student_id, frame_base64)
-                            if face_result['success'] and not face_result['verified']:
-                                violations['identity_mismatch'] = True
-                                verification_result['message'] = 'Identity verification failed - tracked person changed and does not match reference'
-                            elif face_result['success'] and face_result['verified']:
-                                self.tracked_person_id = main_person_id
+                    if session.tracked_person_id != main_person_id:
+                        face_result = self._verify_person(session, student_id, frame, main_person, timings)
+                        if face_result and face_result['success'] and not face_result['verified']:
+                            self._flag_identity_mismatch(violations, verification_result, face_result,
+                                                         'Identity verification failed - tracked person changed and does not match reference')
+                        elif face_result and face_result['success'] and face_result['verified']:
+                            session.tracked_person_id = main_person_id
             # Assign person ID and track
-            person_id = self.tracked_person_id
+            person_id = session.tracked_person_id
             if person_id:
                 verification_result['person_tracked'] = True
                 verification_result['message'] = f'Tracking person: {person_id}'
             
             # Check if person disappeared
-            if self._check_person_disappeared(persons):
+            if self._check_person_disappeared(session, persons):
                 violations['person_disappeared'] = True
                 verification_result['message'] = 'Person left camera view'
             
             # Trigger face verification if needed
-            if self._should_trigger_face_verification():
-                print(f"[DEBUG] Triggering face verification for student {student_id}")
+            if self._should_trigger_face_verification(session):
+                log.debug("Triggering face verification for student %s", student_id)
                 verification_result['face_verification_triggered'] = True
                 
-                # Convert frame to base64 for face verification
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                pil_image = Image.fromarray(frame_rgb)
-                frame_base64 = self._pil_to_base64(pil_image)
-                
-                # Perform face verification
-                print(f"[DEBUG] Calling face_verifier.verify_face()")
-                face_result = self.face_verifier.verify_face(student_id, frame_base64)
-                print(f"[DEBUG] Face verification result: {face_result}")
+                # Verify the main person's track (cached while the track is stable), else the whole frame
+                if persons:
+                    face_result = self._verify_person(session, student_id, frame, main_person, timings)
+                else:
+                    verify_start = time.perf_counter()
+                    face_result = self.face_verifier.verify_face_array(student_id, frame)
+                    self._account_verification(timings, verify_start)
+                log.debug("Face verification result: %s", face_result)
                 
-                if face_result['success']:
+                if face_result is None:
+                    verification_result['message'] = 'Face verification error: empty person region'
+                elif face_result['success']:
                     verification_result['identity_verified'] = face_result['verified']
                     if not face_result['verified']:
-                        violations['identity_mismatch'] = True
-                        verification_result['message'] = 'Identity verification failed - different person detected'
+                        self._flag_identity_mismatch(violations, verification_result, face_result,
+                                                     'Identity verification failed - different person detected')
                     else:
                         verification_result['message'] = 'Identity verified - same person confirmed'
                 else:
                     verification_result['message'] = f'Face verification error: {face_result.get("error", "Unknown error")}'
+            timings['identity_ms'] = _elapsed_ms(stage_start)
+            analysis_complete = True
             
         except Exception as e:
-            print(f"[ERROR] Hybrid verification failed: {str(e)}")
+            log.error("Hybrid verification failed: %s", e)
             verification_result['message'] = f'Verification error: {str(e)}'
         
-        return {
+        result = {
             'violations': violations,
             'verification': verification_result,
-            'tracked_person_id': self.tracked_person_id,
-            'detection_boxes': detection_boxes
+            'tracked_person_id': session.tracked_person_id,
+            'detection_boxes': detection_boxes,
+            'timings': timings,
+            'gated': False
         }
+        # Only a complete analysis may stand in for later unchanged frames
+        if analysis_complete:
+            session.last_result = result
+            session.last_analysis_time = time.time()
+        return result
     
-    def get_tracking_status(self):
-        """Get current tracking status."""
+    def _status_session(self, student_id, exam_id):
+        """Look up a session for read-only status calls without creating one."""
+        session = self.sessions.get(student_id, exam_id, create=False)
+        return session if session is not None else ProctoringSession(student_id, exam_id)
+    
+    def get_tracking_status(self, student_id, exam_id=None):
+        """Get current tracking status for a session."""
+        session = self._status_session(student_id, exam_id)
         return {
-            'tracked_person_id': self.tracked_person_id,
-            'person_disappeared': self.person_disappeared,
-            'face_verification_required': self.face_verification_required,
-            'tracking_history': self.person_tracking_history
+            'tracked_person_id': session.tracked_person_id,
+            'person_disappeared': session.person_disappeared,
+            'face_verification_required': session.face_verification_required,
+            'tracking_history': session.person_tracking_history,
+            'tracker': session.person_tracker.get_status()
         }
     
-    def reset_tracking(self):
-        """Reset tracking state."""
-        self.tracked_person_id = None
-        self.person_last_seen = None
-        self.person_disappeared = False
-        self.face_verification_required = False
-        self.person_tracking_history = {}
-        self.device_detection_history = {}
-        self.multiple_people_detection_history = {
-            'first_detected': None,
-            'last_detected': None,
-            'total_detections': 0,
-            'consecutive_frames': 0,
-            'violation_triggered': False
+    def reset_tracking(self, student_id=None, exam_id=None):
+        """Reset tracking state for one session, or for every session when no student is given."""
+        if student_id is None:
+            self.sessions.clear()
+            log.info("Tracking state reset for all sessions")
+            return
+        session = self.sessions.get(student_id, exam_id, create=False)
+        if session is not None:
+            with session.lock:
+                session.reset()
+        log.info("Tracking state reset for student %s, exam %s", student_id, exam_id)
+    
+    def get_session_status(self):
+        """Get session registry statistics."""
+        return self.sessions.get_status()
+    
+    def get_batching_status(self):
+        """Get dynamic batching statistics for YOLO and FaceNet."""
+        return {
+            'yolo': self.yolo_batcher.get_status(),
+            'facenet': self.face_verifier.recognizer.batcher.get_status()
         }
-        self.person_id_counter = 0
-        self.person_id_map = {}
-        self.original_student_id = None
-        print("[INFO] Tracking state reset")
     
-    def get_device_detection_status(self):
+    def _flag_identity_mismatch(self, violations, verification_result, face_result, message):
+        """Mark an identity mismatch, naming the enrolled student the face matches if the gallery found one."""
+        violations['identity_mismatch'] = True
+        verification_result['message'] = message
+        best_other = face_result.get('best_other_match')
+        if best_other and best_other['matched']:
+            verification_result['suspected_student_id'] = best_other['student_id']
+            verification_result['suspected_distance'] = best_other['distance']
+            verification_result['message'] = f"{message} (matches enrolled student {best_other['student_id']})"
+    
+    def _verify_people(self, session, student_id, frame, persons, timings=None):
+        """
+        FaceNet-verify tracked people. Each track's live embedding and result are cached
+        and reused until the identity interval passes, so a stable track that was
+        recently verified skips FaceNet; only tracking events pay for it. If the
+        student's references changed since, the cached embedding is re-scored instead.
+        People that are due are verified together in one batched call.
+        Returns one face verification result per person, or None for an empty region.
+        """
+        now = time.time()
+        min_interval = self.scheduler.config_for(session.exam_id)['identity']['min_interval']
+        results = [None] * len(persons)
+        pending, regions, rescore = [], [], []
+        references = None
+        for i, person in enumerate(persons):
+            entry = self.embedding_cache.get((session.cache_key, person['id']), max_age=min_interval, now=now)
+            if entry is not None:
+                self.scheduler.record_skip('identity')
+                if entry.embedding is not None:
+                    references = references or self.face_verifier.get_references(student_id)
+                    if references is not None and entry.references is not references:
+                        rescore.append((i, entry))
+                        continue
+                results[i] = entry.result
+                continue
+            x1, y1, x2, y2 = map(int, person['bbox'])
+            person_region = frame[y1:y2, x1:x2]
+            if person_region.size == 0:
+                continue
+            pending.append(i)
+            regions.append(person_region)
+        if rescore:
+            # References were updated (e.g. a new upload): no FaceNet, only the matrix op
+            scored = self.face_verifier.score_embeddings(
+                student_id, np.stack([entry.embedding for _, entry in rescore]), references=references
+            )
+            for (i, entry), face_result in zip(rescore, scored):
+                entry.result, entry.references = face_result, references
+                self.embedding_cache.record_rescore()
+                results[i] = face_result
+        if regions:
+            verify_start = time.perf_counter()
+            face_results, embeddings = self.face_verifier.verify_and_embed(student_id, regions)
+            self._account_verification(timings, verify_start)
+            references = self.face_verifier.reference_embeddings.get(student_id)
+            for i, face_result, embedding in zip(pending, face_results, embeddings):
+                self.embedding_cache.put((session.cache_key, persons[i]['id']), embedding, face_result, references, now=now)
+                results[i] = face_result
+        return results
+    
+    def _verify_person(self, session, student_id, frame, person, timings=None):
+        """FaceNet-verify one tracked person; see _verify_people."""
+        return self._verify_people(session, student_id, frame, [person], timings)[0]
+    
+    def _account_verification(self, timings, verify_start):
+        """Charge a face verification call to the identity check and the frame's timings."""
+        elapsed = _elapsed_ms(verify_start)
+        self.scheduler.account('identity', elapsed)
+        if timings is not None:
+            timings['face_verification_ms'] = timings.get('face_verification_ms', 0.0) + elapsed
+    
+    def get_embedding_cache_status(self):
+        """Get live-embedding cache hit/miss statistics."""
+        return self.embedding_cache.get_status()
+    
+    def get_gallery_status(self):
+        """Get 1:N gallery statistics."""
+        return self.face_verifier.gallery.get_status()
+    
+    def get_cascade_status(self):
+        """Get cascade scheduler settings and per-check cost accounting."""
+        return self.scheduler.get_status()
+    
+    def set_cascade_config(self, exam_id, overrides):
+        """Set per-exam cascade overrides; raises ValueError for unknown checks or settings."""
+        return self.scheduler.set_exam_config(exam_id, overrides)
+    
+    def get_motion_gate_status(self):
+        """Get motion gate statistics."""
+        return self.motion_gate.get_status()
+    
+    def get_device_detection_status(self, student_id, exam_id=None):
         """Get current device detection status for debugging."""
+        session = self._status_session(student_id, exam_id)
         current_time = time.time()
         status = {
             'active_devices': {},
@@ -510,7 +560,7 @@ class HybridVerificationService:
             'confidence_threshold': self.device_confidence_threshold
         }
         
-        for device_name, device_track in self.device_detection_history.items():
+        for device_name, device_track in session.device_detection_history.items():
             detection_duration = current_time - device_track['first_detected']
             time_since_last = current_time - device_track['last_detected']
             
@@ -524,26 +574,27 @@ class HybridVerificationService:
         
         return status
     
-    def get_multiple_people_detection_status(self):
+    def get_multiple_people_detection_status(self, student_id, exam_id=None):
         """Get current multiple people detection status for debugging."""
+        session = self._status_session(student_id, exam_id)
         current_time = time.time()
         status = {
-            'detection_history': self.multiple_people_detection_history.copy(),
+            'detection_history': session.multiple_people_detection_history.copy(),
             'min_duration': self.multiple_people_min_duration,
             'confidence_threshold': self.multiple_people_confidence_threshold
         }
         
-        if self.multiple_people_detection_history['first_detected']:
-            detection_duration = current_time - self.multiple_people_detection_history['first_detected']
+        if session.multiple_people_detection_history['first_detected']:
+            detection_duration = current_time - session.multiple_people_detection_history['first_detected']
             status['detection_duration'] = detection_duration
-            status['violation_triggered'] = self.multiple_people_detection_history['violation_triggered']
+            status['violation_triggered'] = session.multiple_people_detection_history['violation_triggered']
         else:
             status['detection_duration'] = 0
             status['violation_triggered'] = False
         
         return status
 
-    def _detect_multiple_people_with_persistence(self, persons):
+    def _detect_multiple_people_with_persistence(self, session, persons):
         """
         Detect multiple people with temporal persistence to prevent false positives.
         Returns True only if multiple people are consistently detected for minimum duration.
@@ -555,98 +606,80 @@ class HybridVerificationService:
         
         if len(high_confidence_persons) > 1:
             # Additional validation: check if persons are not too close (false positive from overlapping detections)
-            is_valid_multiple = True
-            for i in range(len(high_confidence_persons)):
-                for j in range(i + 1, len(high_confidence_persons)):
-                    person1 = high_confidence_persons[i]
-                    person2 = high_confidence_persons[j]
-                    
-                    # Calculate distance between person centers
-                    center1 = person1['center']
-                    center2 = person2['center']
-                    distance = ((center1[0] - center2[0])**2 + (center1[1] - center2[1])**2)**0.5
-                    
-                    # Calculate overlap between bounding boxes
-                    bbox1 = person1['bbox']
-                    bbox2 = person2['bbox']
-                    
-                    # Calculate intersection
-                    x1_i = max(bbox1[0], bbox2[0])
-                    y1_i = max(bbox1[1], bbox2[1])
-                    x2_i = min(bbox1[2], bbox2[2])
-                    y2_i = min(bbox1[3], bbox2[3])
-                    
-                    if x2_i > x1_i and y2_i > y1_i:
-                        intersection = (x2_i - x1_i) * (y2_i - y1_i)
-                        area1 = (bbox1[2] - bbox1[0]) * (bbox1[3] - bbox1[1])
-                        area2 = (bbox2[2] - bbox2[0]) * (bbox2[3] - bbox2[1])
-                        overlap_ratio = intersection / min(area1, area2) if min(area1, area2) > 0 else 0
-                        
-                        # If persons are too close or have high overlap, it might be a false positive
-                        if distance < 80 or overlap_ratio > 0.3:
-                            is_valid_multiple = False
-                            print(f"[DEBUG] Multiple people detection rejected - distance: {distance:.1f}, overlap: {overlap_ratio:.2f}")
-                            break
-                
-                if not is_valid_multiple:
-                    break
+            person_boxes = box_ops.as_boxes([p['bbox'] for p in high_confidence_persons])
+            person_centers = box_ops.centers(person_boxes)
+            rows, cols = box_ops.upper_pairs(len(person_boxes))
+            distances = box_ops.pairwise_distances(person_centers, person_centers)[rows, cols]
+            overlap_ratios = box_ops.pairwise_overlap_of_smaller(person_boxes, person_boxes)[rows, cols]
+            
+            # If persons are too close or have high overlap, it might be a false positive
+            rejected = (distances < 80) | (overlap_ratios > 0.3)
+            is_valid_multiple = not bool(rejected.any())
+            if not is_valid_multiple:
+                pair = int(np.argmax(rejected))
+                log.debug("Multiple people detection rejected - distance: %.1f, overlap: %.2f", distances[pair], overlap_ratios[pair])
             
             if is_valid_multiple:
                 # Update detection history
-                if self.multiple_people_detection_history['first_detected'] is None:
-                    self.multiple_people_detection_history['first_detected'] = current_time
+                if session.multiple_people_detection_history['first_detected'] is None:
+                    session.multiple_people_detection_history['first_detected'] = current_time
                 
-                self.multiple_people_detection_history['last_detected'] = current_time
-                self.multiple_people_detection_history['total_detections'] += 1
-                self.multiple_people_detection_history['consecutive_frames'] += 1
+                session.multiple_people_detection_history['last_detected'] = current_time
+                session.multiple_people_detection_history['total_detections'] += 1
+                session.multiple_people_detection_history['consecutive_frames'] += 1
                 
                 # Check if violation should be triggered
-                detection_duration = current_time - self.multiple_people_detection_history['first_detected']
+                detection_duration = current_time - session.multiple_people_detection_history['first_detected']
                 if (detection_duration >= self.multiple_people_min_duration and 
-                    not self.multiple_people_detection_history['violation_triggered']):
-                    self.multiple_people_detection_history['violation_triggered'] = True
-                    print(f"[WARNING] Multiple people violation triggered after {detection_duration:.1f}s")
+                    not session.multiple_people_detection_history['violation_triggered']):
+                    session.multiple_people_detection_history['violation_triggered'] = True
+                    log.warning("Multiple people violation triggered after %.1fs", detection_duration)
                     return True
             else:
                 # Reset detection history if validation fails
-                self.multiple_people_detection_history['consecutive_frames'] = 0
+                session.multiple_people_detection_history['consecutive_frames'] = 0
         else:
             # No multiple people detected, reset consecutive count
-            self.multiple_people_detection_history['consecutive_frames'] = 0
+            session.multiple_people_detection_history['consecutive_frames'] = 0
             
             # If no multiple people for too long, reset history
-            if (self.multiple_people_detection_history['last_detected'] and 
-                current_time - self.multiple_people_detection_history['last_detected'] > 3.0):
-                self.multiple_people_detection_history = {
-                    'first_detected': None,
-                    'last_detected': None,
-                    'total_detections': 0,
-                    'consecutive_frames': 0,
-                    'violation_triggered': False
-                }
+            if (session.multiple_people_detection_history['last_detected'] and 
+                current_time - session.multiple_people_detection_history['last_detected'] > 3.0):
+                session.multiple_people_detection_history = new_multiple_people_history()
         
-        return self.multiple_people_detection_history['violation_triggered'] 
+        return session.multiple_people_detection_history['violation_triggered'] 
 
-    def _check_person_disappeared(self, persons):
+    def _check_person_disappeared(self, session, persons):
         """Check if the tracked person has disappeared."""
-        if self.tracked_person_id is None:
+        if session.tracked_person_id is None:
             return False
         
         if not persons:
             # No persons detected, check if this is a disappearance
             current_time = time.time()
-            if self.person_last_seen and (current_time - self.person_last_seen) > 2:  # 2 second threshold
-                if not self.person_disappeared:
-                    self.person_disappeared = True
-                    self.face_verification_required = True
-                    print(f"[WARNING] Tracked person {self.tracked_person_id} disappeared")
-                    print(f"[DEBUG] Setting face_verification_required = True")
+            if session.person_last_seen and (current_time - session.person_last_seen) > 2:  # 2 second threshold
+                if not session.person_disappeared:
+                    session.person_disappeared = True
+                    session.face_verification_required = True
+                    log.warning("Tracked person %s disappeared", session.tracked_person_id)
+                    log.debug("Setting face_verification_required = True")
                 return True
         else:
             # Person detected, update last seen
-            if self.person_disappeared:
-                print(f"[DEBUG] Person reappeared after disappearance")
-            self.person_last_seen = time.time()
-            self.person_disappeared = False
+            if session.person_disappeared:
+                log.debug("Person reappeared after disappearance")
+            session.person_last_seen = time.time()
+            session.person_disappeared = False
         
-        return False 
\ No newline at end of file
+        return False
+    
+    def _should_trigger_face_verification(self, session):
+        """Check if a pending face verification is due (set after the tracked person reappears)."""
+        if not session.face_verification_required or session.person_disappeared:
+            return False
+        current_time = time.time()
+        if current_time - session.last_verification_time < self.verification_cooldown:
+            return False
+        session.face_verification_required = False
+        session.last_verification_time = current_time
+        return True
@@ -0,0 +1,302 @@
+"""
+Pluggable inference backends for the proctoring models.
+
+PROCTOR_INFERENCE_BACKEND selects how model_registry loads the models:
+
+- ``torch``: eager PyTorch FaceNet and the default Ultralytics path (default)
+- ``torchscript``: traced FaceNet and Ultralytics TorchScript exports
+- ``onnx``: ONNX Runtime for FaceNet and Ultralytics ONNX exports
+
+The onnx backend needs the packages in requirements-onnx.txt; the API checks
+for them at startup. Exports are written to PROCTOR_EXPORT_DIR on first use and
+reused afterwards.
+Every FaceNet export is checked against the eager PyTorch model and the result
+is stored next to it. Run ``python inference_backends.py export`` to build the
+exports ahead of deployment, or ``python inference_backends.py parity`` to
+re-check them.
+"""
+
+import importlib.util
+import json
+import os
+
+import numpy as np
+
+from batching import BATCH_MAX_SIZE
+from metrics import log
+
+INFERENCE_BACKEND = os.getenv('PROCTOR_INFERENCE_BACKEND', 'torch')
+INFERENCE_BACKENDS = ('torch', 'torchscript', 'onnx')
+# Intra-op threads per inference call; 0 keeps the library default (all cores)
+INFERENCE_THREADS = int(os.getenv('PROCTOR_INFERENCE_THREADS', '0'))
+# Dynamic int8 quantisation of FaceNet (Linear layers / ONNX weights) and of YOLO ONNX exports
+QUANTIZE_INT8 = os.getenv('PROCTOR_QUANTIZE_INT8', '0') == '1'
+EXPORT_DIR = os.getenv('PROCTOR_EXPORT_DIR', 'exported_models')
+
+# Traced TorchScript YOLO graphs keep the batch size they were exported with, so YOLO is
+# run one image at a time on that backend; ONNX exports have a dynamic batch axis
+YOLO_MAX_BATCH_SIZE = 1 if INFERENCE_BACKEND == 'torchscript' else BATCH_MAX_SIZE
+
+FACENET_INPUT_SHAPE = (3, 160, 160)
+# Exports whose embeddings drift further than this from PyTorch are reported
+PARITY_MIN_COSINE = 0.99
+
+_EXTENSIONS = {'torchscript': 'torchscript', 'onnx': 'onnx'}
+# Packages a backend needs beyond requirements.txt
+_OPTIONAL_MODULES = {'onnx': ('onnx', 'onnxruntime')}
+
+
+def _check_backend(backend):
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {INFERENCE_BACKENDS}")
+
+
+def check_backend_dependencies(backend=None):
+    """Raise RuntimeError naming the missing packages when the backend cannot load its models."""
+    backend = backend or INFERENCE_BACKEND
+    _check_backend(backend)
+    missing = [name for name in _OPTIONAL_MODULES.get(backend, ()) if importlib.util.find_spec(name) is None]
+    if missing:
+        raise RuntimeError(
+            f"PROCTOR_INFERENCE_BACKEND={backend} requires {', '.join(missing)}; "
+            f"install them with 'pip install -r requirements-onnx.txt'"
+        )
+
+
+def configure_threads():
+    """Apply PROCTOR_INFERENCE_THREADS to PyTorch (eager and TorchScript paths)."""
+    if INFERENCE_THREADS > 0:
+        import torch
+        torch.set_num_threads(INFERENCE_THREADS)
+
+
+# ---------------------------------------------------------------------------- FaceNet embedders
+# Every embedder maps a (N, 3, 160, 160) float32 array to (N, 512) float32 embeddings.
+
+class TorchEmbedder:
+    """Eager PyTorch or TorchScript module."""
+
+    def __init__(self, module, kind='torch'):
+        import torch
+        self.module = module
+        self.kind = kind
+        parameters = list(module.parameters())
+        self.device = parameters[0].device if parameters else torch.device('cpu')
+
+    def __call__(self, batch):
+        import torch
+        with torch.no_grad():
+            tensor = torch.from_numpy(np.ascontiguousarray(batch, dtype=np.float32)).to(self.device)
+            return self.module(tensor).cpu().numpy()
+
+
+class OnnxEmbedder:
+    """ONNX Runtime session on the CPU execution provider."""
+
+    kind = 'onnx'
+
+    def __init__(self, path):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if INFERENCE_THREADS > 0:
+            options.intra_op_num_threads = INFERENCE_THREADS
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.path = path
+
+    def __call__(self, batch):
+        return self.session.run(None, {self.input_name: np.ascontiguousarray(batch, dtype=np.float32)})[0]
+
+
+def _eager_facenet():
+    import torch
+    from facenet_pytorch import InceptionResnetV1
+    device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+    return InceptionResnetV1(pretrained='vggface2').eval().to(device)
+
+
+def _quantize_torch(module):
+    import torch
+    return torch.ao.quantization.quantize_dynamic(module.cpu(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def facenet_export_path(backend):
+    suffix = '-int8' if QUANTIZE_INT8 else ''
+    return os.path.join(EXPORT_DIR, f'facenet{suffix}.{_EXTENSIONS[backend]}')
+
+
+def _parity_path(export_path):
+    return export_path + '.parity.json'
+
+
+def export_facenet(backend, force=False):
+    """Export FaceNet for a TorchScript/ONNX backend if needed; returns the export path."""
+    import torch
+    path = facenet_export_path(backend)
+    if os.path.exists(path) and not force:
+        return path
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+
+    reference = _eager_facenet().cpu()
+    dummy = torch.zeros((1, *FACENET_INPUT_SHAPE))
+    tmp_path = path + '.tmp'
+    if backend == 'torchscript':
+        module = _quantize_torch(reference) if QUANTIZE_INT8 else reference
+        with torch.no_grad():
+            torch.jit.trace(module, dummy).save(tmp_path)
+    else:
+        fp32_path = tmp_path + '.fp32' if QUANTIZE_INT8 else tmp_path
+        torch.onnx.export(
+            reference, dummy, fp32_path,
+            input_names=['input'], output_names=['embedding'],
+            dynamic_axes={'input': {0: 'batch'}, 'embedding': {0: 'batch'}},
+            opset_version=17
+        )
+        if QUANTIZE_INT8:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+            os.remove(fp32_path)
+    os.replace(tmp_path, path)
+    log.info("Exported FaceNet (%s%s) to %s", backend, ', int8' if QUANTIZE_INT8 else '', path)
+
+    parity = check_facenet_parity(backend, reference=reference)
+    if parity['min_cosine'] < PARITY_MIN_COSINE:
+        log.warning("FaceNet %s export drifts from PyTorch: min cosine %.4f", backend, parity['min_cosine'])
+    return path
+
+
+def _load_exported_facenet(backend, path):
+    if backend == 'onnx':
+        return OnnxEmbedder(path)
+    import torch
+    return TorchEmbedder(torch.jit.load(path, map_location='cpu').eval(), kind='torchscript')
+
+
+def load_facenet(backend=None):
+    """Return a FaceNet embedder for the configured backend."""
+    backend = backend or INFERENCE_BACKEND
+    _check_backend(backend)
+    configure_threads()
+    if backend == 'torch':
+        module = _eager_facenet()
+        if QUANTIZE_INT8:
+            module = _quantize_torch(module)
+        return TorchEmbedder(module)
+    return _load_exported_facenet(backend, export_facenet(backend))
+
+
+def check_facenet_parity(backend=None, samples=8, reference=None):
+    """
+    Compare an exported FaceNet against the eager PyTorch model on seeded random
+    inputs. Returns and stores {'backend', 'samples', 'min_cosine', 'max_abs_diff'}.
+    """
+    backend = backend or INFERENCE_BACKEND
+    _check_backend(backend)
+    if backend == 'torch' and not QUANTIZE_INT8:
+        return {'backend': backend, 'samples': 0, 'min_cosine': 1.0, 'max_abs_diff': 0.0}
+
+    if reference is None:
+        reference = _eager_facenet().cpu()
+    inputs = np.random.default_rng(0).uniform(-1.0, 1.0, (samples, *FACENET_INPUT_SHAPE)).astype(np.float32)
+    expected = TorchEmbedder(reference)(inputs)
+    if backend == 'torch':
+        candidate = TorchEmbedder(_quantize_torch(_eager_facenet()))
+        path = None
+    else:
+        path = facenet_export_path(backend)
+        candidate = _load_exported_facenet(backend, path)
+    actual = candidate(inputs)
+
+    cosine = np.sum(expected * actual, axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1) + 1e-12
+    )
+    result = {
+        'backend': backend,
+        'quantized': QUANTIZE_INT8,
+        'samples': samples,
+        'min_cosine': float(cosine.min()),
+        'max_abs_diff': float(np.abs(expected - actual).max())
+    }
+    if path is not None:
+        with open(_parity_path(path), 'w') as f:
+            json.dump(result, f)
+    return result
+
+
+# ---------------------------------------------------------------------------- YOLO
+
+def yolo_export_path(weights_path, backend):
+    stem = os.path.splitext(os.path.basename(weights_path))[0]
+    suffix = '-int8' if QUANTIZE_INT8 and backend == 'onnx' else ''
+    return os.path.join(EXPORT_DIR, f'{stem}{suffix}.{_EXTENSIONS[backend]}')
+
+
+def export_yolo(weights_path, backend, force=False):
+    """Export an Ultralytics model with its own exporter; returns the export path."""
+    from ultralytics import YOLO
+    path = yolo_export_path(weights_path, backend)
+    if os.path.exists(path) and not force:
+        return path
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    # Ultralytics writes the export next to the weights. ONNX gets a dynamic batch axis for the
+    # micro-batcher; TorchScript is traced at batch 1 and run unbatched (YOLO_MAX_BATCH_SIZE)
+    options = {'dynamic': True, 'batch': BATCH_MAX_SIZE} if backend == 'onnx' else {'batch': 1}
+    exported = YOLO(weights_path).export(format=backend, **options)
+    if backend == 'onnx' and QUANTIZE_INT8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(exported, path + '.tmp', weight_type=QuantType.QUInt8)
+        os.replace(path + '.tmp', path)
+    else:
+        os.replace(exported, path)
+    log.info("Exported %s (%s) to %s", weights_path, backend, path)
+    return path
+
+
+def load_yolo(weights_path, backend=None):
+    """Load a YOLO model for the configured backend; exported models keep the Ultralytics Results API."""
+    from ultralytics import YOLO
+    backend = backend or INFERENCE_BACKEND
+    _check_backend(backend)
+    configure_threads()
+    if backend == 'torch':
+        return YOLO(weights_path)
+    return YOLO(export_yolo(weights_path, backend), task='detect')
+
+
+# ---------------------------------------------------------------------------- status
+
+def get_status():
+    status = {
+        'backend': INFERENCE_BACKEND,
+        'threads': INFERENCE_THREADS or None,
+        'quantize_int8': QUANTIZE_INT8,
+        'export_dir': EXPORT_DIR,
+        'facenet_parity': None
+    }
+    if INFERENCE_BACKEND in _EXTENSIONS:
+        parity_path = _parity_path(facenet_export_path(INFERENCE_BACKEND))
+        if os.path.exists(parity_path):
+            with open(parity_path) as f:
+                status['facenet_parity'] = json.load(f)
+    return status
+
+
+if __name__ == "__main__":
+    import sys
+    import model_registry
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    backend = sys.argv[2] if len(sys.argv) > 2 else INFERENCE_BACKEND
+    if command in ("export", "parity"):
+        check_backend_dependencies(backend)
+    if command == "export" and backend in _EXTENSIONS:
+        export_facenet(backend, force=True)
+        export_yolo(model_registry.YOLO_MODEL_PATH, backend, force=True)
+        export_yolo(model_registry.FACE_YOLO_MODEL_PATH, backend, force=True)
+    elif command == "parity":
+        print(json.dumps(check_facenet_parity(backend), indent=2))
+    else:
+        print("Usage:")
+        print("  python inference_backends.py export [onnx|torchscript]   # Build exports for a backend")
+        print("  python inference_backends.py parity [backend]            # Compare FaceNet embeddings with PyTorch")
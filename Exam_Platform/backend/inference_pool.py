@@ -0,0 +1,112 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Worker threads running blocking torch/YOLO/MediaPipe code
+INFERENCE_WORKERS = int(os.getenv('PROCTOR_INFERENCE_WORKERS', str(min(8, os.cpu_count() or 1))))
+# Maximum requests running or waiting for a worker before new ones are rejected
+INFERENCE_MAX_PENDING = int(os.getenv('PROCTOR_INFERENCE_MAX_PENDING', str(INFERENCE_WORKERS * 4)))
+
+
+class InferencePoolSaturated(Exception):
+    """Raised when the inference pool already has max_pending requests in flight."""
+
+
+class InferencePool:
+    """
+    Bounded thread pool for blocking inference called from async FastAPI handlers.
+    Threads (rather than processes) let every worker share the loaded models and the
+    micro-batchers; torch and OpenCV release the GIL during the heavy work.
+    """
+
+    def __init__(self, max_workers=INFERENCE_WORKERS, max_pending=INFERENCE_MAX_PENDING):
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(self.max_workers, max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='inference')
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        # Statistics
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                return False
+            self._pending += 1
+            return True
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) on the pool without blocking the event loop.
+        Returns (result, timings) where timings holds queue_wait_ms and run_ms.
+        Raises InferencePoolSaturated when the pool is full.
+        """
+        if not self._acquire():
+            raise InferencePoolSaturated(f"Inference pool saturated ({self.max_pending} requests pending)")
+
+        submitted = time.perf_counter()
+
+        def call():
+            started = time.perf_counter()
+            result = fn(*args, **kwargs)
+            finished = time.perf_counter()
+            return result, {
+                'queue_wait_ms': (started - submitted) * 1000.0,
+                'run_ms': (finished - started) * 1000.0
+            }
+
+        try:
+            loop = asyncio.get_running_loop()
+            outcome = await loop.run_in_executor(self._executor, call)
+            self.completed += 1
+            return outcome
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._release()
+
+    def run_on_each_worker(self, fn, timeout=60.0):
+        """
+        Run fn() once on every worker thread, e.g. to create per-thread state before the
+        first request. Blocks until all workers have finished; the first error is raised.
+        """
+        # Each task holds its worker at the barrier, so no worker can pick up a second task
+        barrier = threading.Barrier(self.max_workers)
+
+        def call():
+            try:
+                fn()
+            finally:
+                barrier.wait(timeout)
+
+        futures = [self._executor.submit(call) for _ in range(self.max_workers)]
+        for future in futures:
+            future.result()
+
+    def get_status(self):
+        """Pool statistics for debugging and health checks."""
+        with self._lock:
+            pending = self._pending
+        return {
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'pending': pending,
+            'saturated': pending >= self.max_pending,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'failed': self.failed
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,105 @@
+"""
+Face landmark extraction with MediaPipe FaceMesh.
+
+FaceMesh runs once on the full RGB frame and returns every face's 468 landmarks
+as (468, 3) arrays; the faces are then matched to YOLO boxes. FaceMesh objects
+are not thread-safe, so each worker thread gets its own instance.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+import box_ops
+
+FACEMESH_MAX_FACES = int(os.getenv('PROCTOR_FACEMESH_MAX_FACES', '3'))
+# Minimum share of a face's landmark extent that must lie inside a YOLO box to match it
+LANDMARK_BOX_MIN_OVERLAP = 0.5
+
+_local = threading.local()
+_instances = 0
+_instances_lock = threading.Lock()
+
+
+def get_face_mesh():
+    """Return this thread's FaceMesh, creating it on first use."""
+    global _instances
+    face_mesh = getattr(_local, 'face_mesh', None)
+    if face_mesh is None:
+        import mediapipe as mp
+        # Static image mode: one instance serves frames from many sessions,
+        # so tracking landmarks from the previous call would be wrong
+        face_mesh = mp.solutions.face_mesh.FaceMesh(
+            static_image_mode=True,
+            max_num_faces=FACEMESH_MAX_FACES,
+            min_detection_confidence=0.7,
+            min_tracking_confidence=0.7
+        )
+        _local.face_mesh = face_mesh
+        with _instances_lock:
+            _instances += 1
+    return face_mesh
+
+
+def warm_up():
+    """Create this thread's FaceMesh and run it once on a blank frame so its graph is loaded."""
+    extract_landmarks(np.zeros((64, 64, 3), dtype=np.uint8))
+
+
+def extract_landmarks(rgb_frame):
+    """Run FaceMesh on a full RGB frame; returns a list of (468, 3) float32 arrays normalised to the frame."""
+    results = get_face_mesh().process(rgb_frame)
+    if not results.multi_face_landmarks:
+        return []
+    return [
+        np.array([(point.x, point.y, point.z) for point in face.landmark], dtype=np.float32)
+        for face in results.multi_face_landmarks
+    ]
+
+
+def landmark_boxes(landmark_sets, frame_shape):
+    """Pixel bounding box of each face's landmarks, as an (N, 4) array."""
+    height, width = frame_shape[:2]
+    if not landmark_sets:
+        return box_ops.EMPTY_BOXES
+    scale = np.array([width, height], dtype=np.float32)
+    return box_ops.as_boxes([
+        np.concatenate((landmarks[:, :2].min(axis=0) * scale, landmarks[:, :2].max(axis=0) * scale))
+        for landmarks in landmark_sets
+    ])
+
+
+def to_box_coordinates(landmarks, box, frame_shape):
+    """
+    Re-normalise frame-relative landmarks to a box, as if FaceMesh had run on the crop.
+    MediaPipe scales z like x, so z is rescaled by the same factor.
+    """
+    height, width = frame_shape[:2]
+    x1, y1, x2, y2 = (float(v) for v in box)
+    box_width = max(x2 - x1, 1.0)
+    box_height = max(y2 - y1, 1.0)
+    local = np.empty_like(landmarks)
+    local[:, 0] = (landmarks[:, 0] * width - x1) / box_width
+    local[:, 1] = (landmarks[:, 1] * height - y1) / box_height
+    local[:, 2] = landmarks[:, 2] * width / box_width
+    return local
+
+
+def match_landmarks_to_boxes(landmark_sets, boxes, frame_shape):
+    """
+    One-to-one match of FaceMesh faces to YOLO boxes by how much of each face lies
+    inside the box. Returns a list of (box_index, box-normalised landmarks).
+    """
+    if not landmark_sets or len(boxes) == 0:
+        return []
+    overlap = box_ops.pairwise_overlap_of_smaller(landmark_boxes(landmark_sets, frame_shape), boxes)
+    pairs = box_ops.greedy_assign(1.0 - overlap, 1.0 - LANDMARK_BOX_MIN_OVERLAP)
+    return [
+        (box_index, to_box_coordinates(landmark_sets[face_index], boxes[box_index], frame_shape))
+        for face_index, box_index in sorted(pairs, key=lambda pair: pair[1])
+    ]
+
+
+def get_status():
+    return {'face_mesh_instances': _instances, 'max_faces': FACEMESH_MAX_FACES}
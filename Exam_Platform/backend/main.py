@@ -1,20 +1,42 @@
-from fastapi import FastAPI, Request, HTTPException, Depends
+# Imported first so the startup breakdown includes the time spent importing
+from startup import startup_tracker
+from fastapi import FastAPI, Request, HTTPException, Depends, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from typing import Optional
+from sqlalchemy import select, or_, and_
 from sqlalchemy.orm import Session
 import cv2
 import numpy as np
 import base64
 from hybrid_verification import HybridVerificationService
-from models import Violation, SessionLocal, Base, engine
-from datetime import datetime, timedelta
-import pytz
+from models import (Violation, ViolationSummary, SessionLocal, Base, ddl_engine, ensure_indexes,
+                    update_violation_summaries, rebuild_violation_summaries, violation_time)
+from datetime import datetime
 import os
 from PIL import Image
 import io
+import csv
+import json
 from face_verification import FaceVerificationService
+import model_registry
+import landmarks
+import inference_backends
+from inference_pool import InferencePool, InferencePoolSaturated
+from violation_writer import ViolationWriter
+import metrics
+from metrics import log
+import time
+import asyncio
+import threading
+
+startup_tracker.mark('imports')
+
+# Fail here, not on the first frame, when the selected backend's packages are missing
+inference_backends.check_backend_dependencies()
 
 app = FastAPI()
 
@@ -27,16 +49,147 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the database
-Base.metadata.create_all(bind=engine)
+def init_database():
+    """Create missing tables. Runs on startup, not at import."""
+    Base.metadata.create_all(bind=ddl_engine)
 
-# Initialize services
-hybrid_verifier = HybridVerificationService()
-face_verifier = FaceVerificationService()
+def maintain_database():
+    """
+    Build indexes added to existing tables and backfill summaries in the background, so startup
+    does not wait for them. The violation writer starts afterwards so its summary upserts do not
+    race the backfill; violations recorded meanwhile wait in its buffer.
+    """
+    try:
+        with startup_tracker.phase('database_maintenance'):
+            ensure_indexes()
+            backfill_violation_summaries()
+    except Exception as e:
+        log.error("Database maintenance failed: %s", e)
+    finally:
+        violation_writer.start()
+
+def backfill_violation_summaries():
+    """Populate the summary table once when it was created next to existing violations."""
+    db = SessionLocal()
+    try:
+        if db.query(ViolationSummary).first() is None and db.query(Violation).first() is not None:
+            log.info("Backfilling report.violation_summaries")
+            rebuild_violation_summaries(db)
+    finally:
+        db.close()
+
+# Load every model in this process before workers fork (gunicorn --preload)
+if os.getenv('PROCTOR_PRELOAD_MODELS') == '1':
+    with startup_tracker.phase('preload_models'):
+        model_registry.preload()
+
+# Initialize services; both share one model set and one reference-embedding cache.
+# Models are loaded on first use or by the startup warm-up (PROCTOR_STARTUP_MODE).
+with startup_tracker.phase('services'):
+    face_verifier = FaceVerificationService()
+    hybrid_verifier = HybridVerificationService(face_verifier=face_verifier)
+# Blocking inference runs here so the event loop stays free for other clients
+inference_pool = InferencePool()
 
 FACE_IMAGES_DIR = 'face_images'
 os.makedirs(FACE_IMAGES_DIR, exist_ok=True)
 DUPLICATE_WINDOW = 2
+# Detected violations are deduplicated in memory and written to the database in bulk
+violation_writer = ViolationWriter(duplicate_window=DUPLICATE_WINDOW)
+# Upper bound on frames analysed per second on a WebSocket session
+WS_TARGET_FPS = float(os.getenv('PROCTOR_WS_TARGET_FPS', '5'))
+
+def collect_component_metrics():
+    """Current queue depths, cache counters and gate ratios, read when /metrics is scraped."""
+    pool = inference_pool.get_status()
+    batchers = hybrid_verifier.get_batching_status()
+    cache = hybrid_verifier.get_embedding_cache_status()
+    gate = hybrid_verifier.get_motion_gate_status()
+    writer = violation_writer.get_status()
+    checks = hybrid_verifier.get_cascade_status()['costs']
+    return [
+        ('proctor_inference_pending', 'gauge', 'Frames queued or running in the inference pool',
+         [({}, pool['pending'])]),
+        ('proctor_inference_rejected_total', 'counter', 'Frames rejected because the inference pool was full',
+         [({}, pool['rejected'])]),
+        ('proctor_batcher_queued', 'gauge', 'Items waiting in a micro-batcher',
+         [({'batcher': name}, status['queued']) for name, status in batchers.items()]),
+        ('proctor_batcher_batches_total', 'counter', 'Batches run by a micro-batcher',
+         [({'batcher': name}, status['batches_run']) for name, status in batchers.items()]),
+        ('proctor_embedding_cache_lookups_total', 'counter', 'Embedding cache lookups by result',
+         [({'result': 'hit'}, cache['hits']), ({'result': 'miss'}, cache['misses'])]),
+        ('proctor_embedding_cache_hit_ratio', 'gauge', 'Embedding cache hits / lookups',
+         [({}, cache['hit_rate'])]),
+        ('proctor_motion_gate_skip_ratio', 'gauge', 'Fraction of frames skipped by the motion gate',
+         [({}, gate['skip_ratio'])]),
+        ('proctor_cascade_check_skip_ratio', 'gauge', 'Fraction of frames a cascade check was skipped on',
+         [({'check': name}, stats['skip_ratio']) for name, stats in checks.items()]),
+        ('proctor_active_sessions', 'gauge', 'Proctoring sessions held in memory',
+         [({}, hybrid_verifier.get_session_status()['active_sessions'])]),
+        ('proctor_gallery_embeddings', 'gauge', 'Reference embeddings in the 1:N gallery',
+         [({}, hybrid_verifier.get_gallery_status()['embeddings'])]),
+        ('proctor_violation_writer_pending', 'gauge', 'Violations buffered for the next database flush',
+         [({}, writer['pending'])]),
+        ('proctor_violation_writer_flush_failures_total', 'counter', 'Failed violation flushes',
+         [({}, writer['flush_failures'])]),
+        ('proctor_violation_writer_dropped_total', 'counter', 'Violations given up on (rejected too often or beyond the buffer cap)',
+         [({}, writer['dropped'])]),
+    ]
+
+metrics.registry.register_collector(collect_component_metrics)
+
+def saturated_response(e):
+    """429 returned when the inference pool is full; clients should drop this frame."""
+    return JSONResponse(
+        status_code=429,
+        content={"success": False, "frame_skipped": True, "detail": str(e)}
+    )
+
+@app.on_event("startup")
+def on_startup():
+    if os.getenv('PROCTOR_SKIP_DB_INIT') != '1':
+        with startup_tracker.phase('database'):
+            init_database()
+        threading.Thread(target=maintain_database, name='db-maintenance', daemon=True).start()
+    else:
+        violation_writer.start()
+    # FaceMesh is per thread, so it is created on every inference worker rather than once
+    startup_tracker.load_models(
+        model_registry.available_models(),
+        warmups={'face_mesh': lambda: inference_pool.run_on_each_worker(landmarks.warm_up)}
+    )
+    if startup_tracker.mode != 'lazy':
+        # Reads the embedding store off the request path; the gallery index then builds in its own thread
+        threading.Thread(target=face_verifier.load_gallery, name='gallery-load', daemon=True).start()
+    startup_tracker.mark_started()
+    log.info("Accepting requests %.2fs after process start (%s model loading)", startup_tracker.started_at, startup_tracker.mode)
+
+@app.on_event("shutdown")
+def shutdown_background_workers():
+    inference_pool.shutdown()
+    # Flush buffered violations before the process exits
+    violation_writer.stop()
+
+@app.get("/health")
+async def health():
+    """Liveness check; never touches the inference pool."""
+    return {"status": "ok", "inference": inference_pool.get_status()}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Pipeline metrics in the Prometheus text exposition format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready")
+async def ready():
+    """Readiness check: 200 once the replica can serve frames without loading models, 503 before."""
+    status = {
+        **startup_tracker.get_status(),
+        "models_loaded": model_registry.loaded_models(),
+        "models_available": model_registry.available_models(),
+        "face_mesh": landmarks.get_status()
+    }
+    return JSONResponse(status_code=200 if status['ready'] else 503, content=status)
 
 # Dependency
 def get_db():
@@ -54,8 +207,7 @@ class FaceImageUpload(BaseModel):
 @app.post("/upload_face_image")
 async def upload_face_image(data: FaceImageUpload):
     try:
-        image_data = data.image.split(',')[1]
-        image_bytes = base64.b64decode(image_data)
+        image_bytes = decode_base64_image(data.image)
 
         image = Image.open(io.BytesIO(image_bytes))
         if image.mode in ('RGBA', 'LA', 'P'):
@@ -66,7 +218,17 @@ async def upload_face_image(data: FaceImageUpload):
         filepath = os.path.join(FACE_IMAGES_DIR, filename)
         image.save(filepath)
 
-        return {"success": True, "filename": filename, "filepath": filepath}
+        # Embed the new reference now so verification never has to re-read the image
+        try:
+            embedding_stored, _ = await inference_pool.run(
+                face_verifier.add_reference_image, data.student_id, data.view_type, filepath
+            )
+        except InferencePoolSaturated:
+            # Computed from the images on the next load instead
+            await run_in_threadpool(face_verifier.invalidate_reference, data.student_id)
+            embedding_stored = False
+
+        return {"success": True, "filename": filename, "filepath": filepath, "embedding_stored": embedding_stored}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -91,13 +253,46 @@ async def get_face_images(student_id: str):
 
 
 
+VIOLATIONS_PAGE_SIZE = 100
+VIOLATIONS_MAX_PAGE_SIZE = 1000
+EXPORT_CHUNK_ROWS = int(os.getenv('PROCTOR_EXPORT_CHUNK_ROWS', '1000'))
+EXPORT_COLUMNS = ['id', 'student_id', 'exam_id', 'violation_type', 'confidence', 'timestamp', 'details']
+
+def encode_cursor(timestamp, violation_id):
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{violation_id}".encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        timestamp, violation_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(violation_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @app.get("/get_violations")
-async def get_violations(student_id: str, exam_id: str, db: Session = Depends(get_db)):
+async def get_violations(student_id: str, exam_id: str, limit: int = VIOLATIONS_PAGE_SIZE,
+                         cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    Newest-first page of a student's violations. Pass the returned next_cursor to fetch
+    the following page; it is null on the last page. Uses keyset pagination on
+    (timestamp, id), so every page costs one index range scan regardless of depth.
+    """
+    if limit < 1 or limit > VIOLATIONS_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {VIOLATIONS_MAX_PAGE_SIZE}")
     try:
-        violations = db.query(Violation).filter(
+        query = db.query(Violation).filter(
             Violation.student_id == student_id,
             Violation.exam_id == exam_id
-        ).order_by(Violation.timestamp.desc()).all()
+        )
+        if cursor:
+            cursor_ts, cursor_id = decode_cursor(cursor)
+            query = query.filter(or_(
+                Violation.timestamp < cursor_ts,
+                and_(Violation.timestamp == cursor_ts, Violation.id < cursor_id)
+            ))
+        # One extra row tells us whether another page exists
+        violations = query.order_by(Violation.timestamp.desc(), Violation.id.desc()).limit(limit + 1).all()
+        has_more = len(violations) > limit
+        violations = violations[:limit]
 
         return {
             "success": True,
@@ -108,6 +303,78 @@ async def get_violations(student_id: str, exam_id: str, db: Session = Depends(ge
                     "timestamp": v.timestamp.isoformat(),
                     "details": v.details
                 } for v in violations
+            ],
+            "next_cursor": encode_cursor(violations[-1].timestamp, violations[-1].id) if has_more else None
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def iter_violation_export(exam_id, student_id, export_format):
+    """
+    Yield an exam's violations as NDJSON or CSV chunks. Rows are fetched in batches of
+    EXPORT_CHUNK_ROWS through a server-side cursor, so memory stays flat for any exam size.
+    """
+    db = SessionLocal()
+    try:
+        stmt = select(*(getattr(Violation, column) for column in EXPORT_COLUMNS)).where(Violation.exam_id == exam_id)
+        if student_id is not None:
+            stmt = stmt.where(Violation.student_id == student_id)
+        stmt = stmt.order_by(Violation.student_id, Violation.timestamp, Violation.id)
+        result = db.execute(stmt.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_ROWS))
+
+        if export_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_COLUMNS)
+            yield buffer.getvalue()
+        for partition in result.partitions():
+            if export_format == 'csv':
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows(
+                    [*row[:5], row.timestamp.isoformat() if row.timestamp else '', row.details] for row in partition
+                )
+                yield buffer.getvalue()
+            else:
+                yield ''.join(
+                    json.dumps({**row._asdict(), 'timestamp': row.timestamp.isoformat() if row.timestamp else None}) + '\n'
+                    for row in partition
+                )
+    finally:
+        db.close()
+
+@app.get("/export_violations")
+async def export_violations(exam_id: str, format: str = 'ndjson', student_id: Optional[str] = None):
+    """Stream every violation of an exam (optionally one student) as NDJSON or CSV."""
+    if format not in ('ndjson', 'csv'):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    media_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    filename = f"violations_{exam_id}.{'csv' if format == 'csv' else 'ndjson'}"
+    return StreamingResponse(
+        iter_violation_export(exam_id, student_id, format),
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/get_violation_summary")
+async def get_violation_summary(exam_id: str, student_id: Optional[str] = None, db: Session = Depends(get_db)):
+    """Per-type violation counts and last occurrence for a student, or for every student in an exam."""
+    try:
+        query = db.query(ViolationSummary).filter(ViolationSummary.exam_id == exam_id)
+        if student_id is not None:
+            query = query.filter(ViolationSummary.student_id == student_id)
+        return {
+            "success": True,
+            "summary": [
+                {
+                    "student_id": s.student_id,
+                    "type": s.violation_type,
+                    "count": s.count,
+                    "first_seen": s.first_seen.isoformat() if s.first_seen else None,
+                    "last_seen": s.last_seen.isoformat() if s.last_seen else None
+                } for s in query.order_by(ViolationSummary.student_id, ViolationSummary.violation_type)
             ]
         }
     except Exception as e:
@@ -128,9 +395,16 @@ async def report_violation(data: ReportViolationRequest, db: Session = Depends(g
             exam_id=data.exam_id,
             violation_type=data.violation_type,
             details=data.details,
-            confidence=data.confidence
+            confidence=data.confidence,
+            timestamp=violation_time()
         )
         db.add(violation)
+        update_violation_summaries(db, [{
+            'exam_id': data.exam_id,
+            'student_id': data.student_id,
+            'violation_type': data.violation_type,
+            'timestamp': violation.timestamp
+        }])
         db.commit()
         return {"success": True}
     except Exception as e:
@@ -144,8 +418,10 @@ class FaceVerificationRequest(BaseModel):
 @app.post("/verify_face")
 async def verify_face(data: FaceVerificationRequest):
     try:
-        result = face_verifier.verify_face(data.student_id, data.image)
+        result, _ = await inference_pool.run(face_verifier.verify_face, data.student_id, data.image)
         return result
+    except InferencePoolSaturated as e:
+        return saturated_response(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -163,11 +439,13 @@ class LoadReferenceRequest(BaseModel):
 @app.post("/load_reference_images")
 async def load_reference_images(data: LoadReferenceRequest):
     try:
-        success = face_verifier.load_reference_images(data.student_id)
+        success, _ = await inference_pool.run(face_verifier.load_reference_images, data.student_id)
         return {
             "success": success,
             "message": "Reference images loaded successfully" if success else "Failed to load reference images"
         }
+    except InferencePoolSaturated as e:
+        return saturated_response(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -176,81 +454,312 @@ class HybridAnalyzeRequest(BaseModel):
     student_id: str
     exam_id: str
 
-@app.post("/hybrid_analyze")
-async def hybrid_analyze(data: HybridAnalyzeRequest, db: Session = Depends(get_db)):
+def decode_base64_image(image):
+    """Bytes of a base64 image sent as a data URL or as bare base64; raises ValueError if it is not base64."""
+    return base64.b64decode(image.split(',', 1)[-1])
+
+def decode_frame(image_bytes):
+    """Decode JPEG/PNG bytes into a BGR frame; np.frombuffer wraps the bytes without copying."""
+    if not image_bytes:
+        return None
+    return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+def build_analysis_response(result, timings):
+    return {
+        "success": True, 
+        "violations": result['violations'],
+        "verification": result['verification'],
+        "tracked_person_id": result['tracked_person_id'],
+        "gated": result.get('gated', False),
+        "timings": timings
+    }
+
+def violation_details(result):
+    """Extra text for recorded violations: the enrolled student an identity mismatch matches, if any."""
+    verification = result['verification']
+    if verification.get('suspected_student_id') is None:
+        return None
+    return {
+        'identity_mismatch': f"matches enrolled student {verification['suspected_student_id']} "
+                             f"(distance {verification['suspected_distance']:.3f})"
+    }
+
+async def analyze_frame(frame, student_id, exam_id, request_start, decode_ms):
+    """Run hybrid verification on a decoded frame and record violations."""
     try:
-        image_bytes = base64.b64decode(data.image.split(',')[1])
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
         # Use hybrid verification
-        result = hybrid_verifier.process_frame(frame, data.student_id)
-        
-        current_time = datetime.now(pytz.timezone('Asia/Kolkata'))
-        time_window_start = current_time - timedelta(seconds=DUPLICATE_WINDOW)
-        
-        # Check for violations and add to database
-        violations = result['violations']
-        for v_type, is_violation in violations.items():
-            if is_violation:
-                exists = db.query(Violation).filter(
-                    Violation.student_id == data.student_id,
-                    Violation.exam_id == data.exam_id,
-                    Violation.violation_type == v_type,
-                    Violation.timestamp >= time_window_start
-                ).first()
-                if not exists:
-                    db.add(Violation(
-                        student_id=data.student_id,
-                        exam_id=data.exam_id,
-                        violation_type=v_type,
-                        confidence=0.8,
-                        details=f"Hybrid detection: {v_type}",
-                        timestamp=current_time
-                    ))
+        result, pool_timings = await inference_pool.run(
+            hybrid_verifier.process_frame, frame, student_id, exam_id
+        )
         
-        db.commit()
+        record_start = time.perf_counter()
+        recorded = violation_writer.record(student_id, exam_id, result['violations'], details=violation_details(result))
         
-        return {
-            "success": True, 
-            "violations": violations,
-            "verification": result['verification'],
-            "tracked_person_id": result['tracked_person_id']
+        timings = {
+            "decode_ms": decode_ms,
+            **pool_timings,
+            **result.get('timings', {}),
+            "record_ms": (time.perf_counter() - record_start) * 1000.0,
+            "total_ms": (time.perf_counter() - request_start) * 1000.0
         }
+        metrics.record_frame(result, timings, recorded)
+        
+        return build_analysis_response(result, timings)
+    except InferencePoolSaturated as e:
+        metrics.FRAMES.inc(outcome='rejected')
+        return saturated_response(e)
+    except Exception as e:
+        metrics.FRAMES.inc(outcome='error')
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/hybrid_analyze")
+async def hybrid_analyze(data: HybridAnalyzeRequest):
+    try:
+        request_start = time.perf_counter()
+        frame = decode_frame(decode_base64_image(data.image))
+        decode_ms = (time.perf_counter() - request_start) * 1000.0
+    except ValueError:
+        # binascii.Error from malformed base64 is a ValueError
+        frame = None
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
+    if frame is None:
+        raise HTTPException(status_code=400, detail="The image field is not a decodable image")
+    return await analyze_frame(frame, data.student_id, data.exam_id, request_start, decode_ms)
+
+@app.post("/hybrid_analyze_frame")
+async def hybrid_analyze_frame(request: Request, student_id: Optional[str] = None, exam_id: Optional[str] = None):
+    """
+    Analyze a webcam frame sent as raw JPEG bytes.
+    Accepts either an application/octet-stream (or image/jpeg) body, or multipart/form-data
+    with the image in a "frame" file field. student_id/exam_id come from the query string,
+    the X-Student-Id / X-Exam-Id headers, or (multipart only) form fields.
+    """
+    request_start = time.perf_counter()
+    student_id = student_id or request.headers.get('x-student-id')
+    exam_id = exam_id or request.headers.get('x-exam-id')
+    
+    if request.headers.get('content-type', '').startswith('multipart/form-data'):
+        form = await request.form()
+        upload = form.get('frame')
+        image_bytes = await upload.read() if upload is not None and hasattr(upload, 'read') else b''
+        student_id = student_id or form.get('student_id')
+        exam_id = exam_id or form.get('exam_id')
+    else:
+        image_bytes = await request.body()
+    
+    if not student_id or not exam_id:
+        raise HTTPException(status_code=400, detail="student_id and exam_id are required")
+    
+    frame = decode_frame(image_bytes)
+    if frame is None:
+        raise HTTPException(status_code=400, detail="Request body is not a decodable image")
+    decode_ms = (time.perf_counter() - request_start) * 1000.0
+    
+    return await analyze_frame(frame, student_id, exam_id, request_start, decode_ms)
+
+@app.websocket("/ws/proctor")
+async def proctor_stream(websocket: WebSocket, student_id: str, exam_id: str):
+    """
+    Streaming proctoring channel bound to one (student_id, exam_id) session.
+    The client sends binary JPEG frames; the server answers each analysed frame
+    with an "analysis" event. Only the newest frame is kept: frames that arrive
+    while one is being analysed replace each other and are counted as dropped.
+    The server analyses at most WS_TARGET_FPS frames per second and tells the
+    client that rate in the initial "config" event.
+    """
+    await websocket.accept()
+    await websocket.send_json({"type": "config", "target_fps": WS_TARGET_FPS})
+    
+    state = {"frame_bytes": None, "received_at": None, "dropped": 0}
+    frame_ready = asyncio.Event()
+    min_interval = 1.0 / WS_TARGET_FPS if WS_TARGET_FPS > 0 else 0.0
+    
+    async def receive_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            data = message.get("bytes")
+            if not data:
+                continue  # text messages are keep-alives
+            if state["frame_bytes"] is not None:
+                state["dropped"] += 1
+            state["frame_bytes"] = data
+            state["received_at"] = time.perf_counter()
+            frame_ready.set()
+    
+    async def analyze_frames():
+        last_started = 0.0
+        while True:
+            await frame_ready.wait()
+            # Pace analysis; newer frames keep replacing the pending one meanwhile
+            wait = last_started + min_interval - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            frame_ready.clear()
+            image_bytes, request_start = state["frame_bytes"], state["received_at"]
+            state["frame_bytes"] = None
+            last_started = time.perf_counter()
+            
+            frame = decode_frame(image_bytes)
+            if frame is None:
+                await websocket.send_json({"type": "error", "detail": "Frame is not a decodable image"})
+                continue
+            decode_ms = (time.perf_counter() - last_started) * 1000.0
+            
+            try:
+                result, pool_timings = await inference_pool.run(
+                    hybrid_verifier.process_frame, frame, student_id, exam_id
+                )
+            except InferencePoolSaturated as e:
+                metrics.FRAMES.inc(outcome='rejected')
+                await websocket.send_json({"type": "frame_skipped", "detail": str(e)})
+                continue
+            except Exception:
+                metrics.FRAMES.inc(outcome='error')
+                raise
+            
+            record_start = time.perf_counter()
+            recorded = violation_writer.record(student_id, exam_id, result['violations'], details=violation_details(result))
+            
+            timings = {
+                "decode_ms": decode_ms,
+                **pool_timings,
+                **result.get('timings', {}),
+                "record_ms": (time.perf_counter() - record_start) * 1000.0,
+                "total_ms": (time.perf_counter() - request_start) * 1000.0
+            }
+            metrics.record_frame(result, timings, recorded)
+            event = build_analysis_response(result, timings)
+            event.update({"type": "analysis", "dropped_frames": state["dropped"]})
+            await websocket.send_json(event)
+    
+    receiver = asyncio.create_task(receive_frames())
+    analyzer = asyncio.create_task(analyze_frames())
+    try:
+        done, _ = await asyncio.wait({receiver, analyzer}, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() and not isinstance(task.exception(), WebSocketDisconnect):
+                log.error("Proctoring stream for %s/%s failed: %s", student_id, exam_id, task.exception())
+    finally:
+        receiver.cancel()
+        analyzer.cancel()
+        await asyncio.gather(receiver, analyzer, return_exceptions=True)
 
 @app.get("/tracking_status")
-async def get_tracking_status():
+async def get_tracking_status(student_id: str, exam_id: str):
     try:
-        status = hybrid_verifier.get_tracking_status()
+        status = hybrid_verifier.get_tracking_status(student_id, exam_id)
         return {"success": True, "status": status}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/reset_tracking")
-async def reset_tracking():
+async def reset_tracking(student_id: Optional[str] = None, exam_id: Optional[str] = None):
+    """Reset tracking for one session, or for all sessions when no student_id is given."""
     try:
-        hybrid_verifier.reset_tracking()
+        hybrid_verifier.reset_tracking(student_id, exam_id)
         return {"success": True, "message": "Tracking reset successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/session_status")
+async def get_session_status():
+    """Get proctoring session registry statistics."""
+    try:
+        status = hybrid_verifier.get_session_status()
+        return {"success": True, "status": status}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/batching_status")
+async def get_batching_status():
+    """Get dynamic batching statistics for YOLO and FaceNet inference."""
+    try:
+        status = hybrid_verifier.get_batching_status()
+        return {"success": True, "status": status}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/motion_gate_status")
+async def get_motion_gate_status():
+    """Get motion gate statistics (frames seen, skipped and forced refreshes)."""
+    try:
+        status = hybrid_verifier.get_motion_gate_status()
+        return {"success": True, "status": status}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/embedding_cache_status")
+async def get_embedding_cache_status():
+    """Get live-embedding cache statistics (hits, misses, re-scored, expired, evicted)."""
+    try:
+        status = hybrid_verifier.get_embedding_cache_status()
+        return {"success": True, "status": status}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/gallery_status")
+async def get_gallery_status():
+    """Get 1:N gallery statistics (enrolled embeddings, index type, search latency)."""
+    try:
+        status = hybrid_verifier.get_gallery_status()
+        return {"success": True, "status": status}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/cascade_status")
+async def get_cascade_status():
+    """Get cascade scheduler settings and per-check run counts, skips and cost."""
+    try:
+        status = hybrid_verifier.get_cascade_status()
+        return {"success": True, "status": status}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/cascade_config")
+async def set_cascade_config(exam_id: str, overrides: dict):
+    """
+    Set per-exam check settings, e.g. {"devices": {"every_n": 3}, "face_mesh": {"every_n": 2}}.
+    An empty object restores the defaults for the exam.
+    """
+    try:
+        config = hybrid_verifier.set_cascade_config(exam_id, overrides)
+        return {"success": True, "exam_id": exam_id, "config": config}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/violation_writer_status")
+async def get_violation_writer_status():
+    """Get buffered violation writer statistics."""
+    try:
+        return {"success": True, "status": violation_writer.get_status()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/model_status")
+async def get_model_status():
+    """Get loaded models and their memory usage."""
+    try:
+        return {"success": True, "status": model_registry.get_status()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/device_detection_status")
-async def get_device_detection_status():
+async def get_device_detection_status(student_id: str, exam_id: str):
     """Get current device detection status for debugging."""
     try:
-        status = hybrid_verifier.get_device_detection_status()
+        status = hybrid_verifier.get_device_detection_status(student_id, exam_id)
         return {"success": True, "status": status}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/multiple_people_detection_status")
-async def get_multiple_people_detection_status():
+async def get_multiple_people_detection_status(student_id: str, exam_id: str):
     """Get current multiple people detection status for debugging."""
     try:
-        status = hybrid_verifier.get_multiple_people_detection_status()
+        status = hybrid_verifier.get_multiple_people_detection_status(student_id, exam_id)
         return {"success": True, "status": status}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,243 @@
+"""
+Hot-path instrumentation: counters, latency histograms and a non-blocking logger.
+
+Metrics are kept in memory and rendered in the Prometheus text format by
+GET /metrics. Recording is a dict update under a lock, cheap enough for every
+frame. Values that already live elsewhere (queue depths, cache hit counts) are
+read through collectors registered at startup, only when /metrics is scraped.
+
+The backend modules log through `log` instead of print(). Records are handed to a
+background thread, so the request thread never blocks on stdout. Debug messages
+are sampled by PROCTOR_DEBUG_LOG:
+
+- ``sampled`` (default): the first occurrence of each message and then one in
+  PROCTOR_DEBUG_LOG_EVERY
+- ``all``: every debug message
+- ``off``: no debug messages
+"""
+
+import atexit
+import bisect
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+DEBUG_LOG_MODE = os.getenv('PROCTOR_DEBUG_LOG', 'sampled')
+DEBUG_LOG_EVERY = max(1, int(os.getenv('PROCTOR_DEBUG_LOG_EVERY', '100')))
+
+# Latency buckets in seconds, from sub-millisecond gate checks to multi-second model loads
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+# ---------------------------------------------------------------------------- metric types
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = ','.join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(labelnames, values)
+    )
+    return '{' + pairs + '}'
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, '') for name in self.labelnames), 0.0)
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {value}' for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels, in seconds."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        lines = []
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values[:-1]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames + ("le",), key + (le,))} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {values[-1]}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    """Metrics plus collectors that report current values of other components at scrape time."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """
+        collector() returns a list of (name, kind, documentation, samples) where samples
+        is a list of ({label: value}, number). Failing collectors are skipped.
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                log.error("Metrics collector failed: %s", e)
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f'{name}{_format_labels(tuple(labels), tuple(labels.values()))} {float(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    'proctor_stage_seconds', 'Per-frame pipeline stage latency', ['stage']))
+FRAMES = registry.register(Counter(
+    'proctor_frames_total', 'Frames received, by outcome (analysed, gated, rejected, error)', ['outcome']))
+VIOLATIONS_DETECTED = registry.register(Counter(
+    'proctor_violations_detected_total', 'Frames with a positive violation, by type', ['type']))
+VIOLATIONS_RECORDED = registry.register(Counter(
+    'proctor_violations_recorded_total', 'Violations queued for the database after duplicate suppression', ['type']))
+LOG_DROPPED = registry.register(Counter(
+    'proctor_log_messages_dropped_total', 'Log messages dropped by sampling or a full log queue', ['reason']))
+
+
+def observe_timings(timings):
+    """Record a frame's {stage_ms: milliseconds} timings in the stage histogram."""
+    for key, milliseconds in timings.items():
+        if key.endswith('_ms') and milliseconds is not None:
+            STAGE_SECONDS.observe(milliseconds / 1000.0, stage=key[:-3])
+
+
+def record_frame(result, timings, recorded=()):
+    """Count one analysed frame: outcome, stage timings, detected and recorded violations."""
+    FRAMES.inc(outcome='gated' if result.get('gated') else 'analysed')
+    observe_timings(timings)
+    for violation_type, detected in result['violations'].items():
+        if detected:
+            VIOLATIONS_DETECTED.inc(type=violation_type)
+    for violation_type in recorded:
+        VIOLATIONS_RECORDED.inc(type=violation_type)
+
+
+def render():
+    return registry.render()
+
+
+# ---------------------------------------------------------------------------- logging
+
+class _DebugSampler(logging.Filter):
+    """Lets through the first occurrence of each debug message template, then one in `every`."""
+
+    def __init__(self, mode=DEBUG_LOG_MODE, every=DEBUG_LOG_EVERY):
+        super().__init__()
+        self.mode = mode
+        self.every = every
+        self._counts = {}
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.mode == 'all':
+            return True
+        if self.mode == 'off':
+            return False
+        count = self._counts.get(record.msg, 0)
+        self._counts[record.msg] = count + 1
+        if count % self.every == 0:
+            return True
+        LOG_DROPPED.inc(reason='sampled')
+        return False
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Drops records instead of blocking when the log queue is full."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc(reason='queue_full')
+
+
+def _build_logger():
+    logger = logging.getLogger('proctor')
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    if logger.handlers:
+        return logger
+    records = queue.Queue(maxsize=10000)
+    handler = _NonBlockingQueueHandler(records)
+    # Sampling runs before the record is queued, so dropped messages are never formatted
+    handler.addFilter(_DebugSampler())
+    logger.addHandler(handler)
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
+    listener = logging.handlers.QueueListener(records, output, respect_handler_level=False)
+    listener.start()
+    atexit.register(listener.stop)
+    return logger
+
+
+# Use %-style arguments (log.debug("x=%s", x)) so skipped messages cost no formatting
+log = _build_logger()
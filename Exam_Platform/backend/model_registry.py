@@ -0,0 +1,139 @@
+"""
+Process-wide registry of the heavy models used by the proctoring backend.
+
+Each model is loaded at most once per process and shared read-only by every
+service. Call preload() before the server forks workers (e.g. gunicorn --preload)
+so the weights are loaded in the master and shared with the workers copy-on-write.
+"""
+
+import gc
+import os
+import threading
+import time
+
+import inference_backends
+from metrics import log
+
+YOLO_MODEL_PATH = os.getenv('PROCTOR_YOLO_MODEL', 'yolov8n.pt')
+FACE_YOLO_MODEL_PATH = os.getenv(
+    'PROCTOR_FACE_YOLO_MODEL',
+    os.path.join(os.path.dirname(__file__), 'weights', 'yolov8n-face.pt')
+)
+
+
+# Loaders go through inference_backends, so PROCTOR_INFERENCE_BACKEND picks PyTorch, TorchScript or ONNX
+def _load_yolo():
+    return inference_backends.load_yolo(YOLO_MODEL_PATH)
+
+
+def _load_face_yolo():
+    return inference_backends.load_yolo(FACE_YOLO_MODEL_PATH)
+
+
+_LOADERS = {
+    'yolo': _load_yolo,                             # YOLOv8n: persons and devices
+    'face_yolo': _load_face_yolo,                   # YOLOv8n-face: face crops for verification
+    'facenet': inference_backends.load_facenet,     # InceptionResnetV1 embedder: (N, 3, 160, 160) -> (N, 512)
+}
+
+_models = {}
+_load_times = {}
+_lock = threading.Lock()
+
+
+def get_model(name):
+    """Return the shared instance of a model, loading it on first use."""
+    model = _models.get(name)
+    if model is not None:
+        return model
+    if name not in _LOADERS:
+        raise KeyError(f"Unknown model '{name}'")
+    with _lock:
+        model = _models.get(name)
+        if model is None:
+            start = time.perf_counter()
+            model = _LOADERS[name]()
+            _load_times[name] = time.perf_counter() - start
+            _models[name] = model
+            log.info("Loaded model '%s' in %.2fs", name, _load_times[name])
+    return model
+
+
+def get_yolo():
+    return get_model('yolo')
+
+
+def get_face_yolo():
+    return get_model('face_yolo')
+
+
+def get_facenet():
+    return get_model('facenet')
+
+
+def is_loaded(name):
+    return name in _models
+
+
+def loaded_models():
+    return sorted(_models)
+
+
+def available_models():
+    return sorted(_LOADERS)
+
+
+def preload(names=None):
+    """
+    Load models eagerly. Intended to run in the master process before workers fork:
+    gc.freeze() moves the loaded objects out of the collector's generations so
+    garbage collection in the workers does not touch (and un-share) their pages.
+    """
+    for name in names or _LOADERS:
+        get_model(name)
+    gc.freeze()
+
+
+def _torch_module(model):
+    """Return the underlying torch.nn.Module for a registry model."""
+    import torch
+    if isinstance(model, torch.nn.Module):
+        return model
+    # Ultralytics YOLO wraps the network in .model, torch embedders in .module;
+    # ONNX Runtime sessions have no torch module
+    for attr in ('model', 'module'):
+        inner = getattr(model, attr, None)
+        if isinstance(inner, torch.nn.Module):
+            return inner
+    return None
+
+
+def _module_bytes(module):
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def memory_usage():
+    """Approximate weight memory per loaded model plus the process' peak RSS, in bytes."""
+    usage = {}
+    for name, model in list(_models.items()):
+        module = _torch_module(model)
+        usage[name] = _module_bytes(module) if module is not None else None
+    try:
+        import resource
+        # ru_maxrss is in kilobytes on Linux
+        usage['process_peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        usage['process_peak_rss'] = None
+    return usage
+
+
+def get_status():
+    """Loaded models, load times and memory usage for debugging."""
+    return {
+        'loaded': loaded_models(),
+        'available': available_models(),
+        'load_seconds': dict(_load_times),
+        'memory_bytes': memory_usage(),
+        'inference': inference_backends.get_status()
+    }
@@ -1,10 +1,13 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, ForeignKey, Index, func, select
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 import os
+import pytz
 from dotenv import load_dotenv
 
+from metrics import log
+
 load_dotenv()
 
 # Use PostgreSQL as the default database, targeting the report schema
@@ -15,20 +18,139 @@ if not DATABASE_URL:
 # Create engine and session
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# CREATE INDEX CONCURRENTLY cannot run inside a transaction; DDL goes through this engine
+ddl_engine = engine.execution_options(isolation_level='AUTOCOMMIT')
 Base = declarative_base()
 
+# Violation times are stored as naive Asia/Kolkata wall-clock time in every writer
+TIMEZONE = pytz.timezone('Asia/Kolkata')
+
+def violation_time(timestamp=None):
+    """A timestamp (default: now) in the stored form: naive Asia/Kolkata time. Naive input is taken as already local."""
+    if timestamp is None:
+        timestamp = datetime.now(TIMEZONE)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(TIMEZONE).replace(tzinfo=None)
+    return timestamp
+
 class Violation(Base):
     __tablename__ = "violations"
-    __table_args__ = {'schema': 'report'}
+    __table_args__ = (
+        # Serves per-student lookups, per-type dedup checks and time-range scans.
+        # Built CONCURRENTLY on PostgreSQL so existing tables stay writable (see ensure_indexes)
+        Index('ix_violations_exam_student_type_ts', 'exam_id', 'student_id', 'violation_type', 'timestamp',
+              postgresql_concurrently=True),
+        # Keyset pagination and exam-wide export, ordered by (timestamp, id)
+        Index('ix_violations_exam_student_ts_id', 'exam_id', 'student_id', 'timestamp', 'id',
+              postgresql_concurrently=True),
+        {'schema': 'report'}
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     student_id = Column(String, index=True)
     exam_id = Column(String, index=True)
     violation_type = Column(String)  # 'multiple_faces', 'looking_away', 'device_detected', etc.
     confidence = Column(Float)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=violation_time)
     details = Column(String)  # Additional details about the violation
 
+class ViolationSummary(Base):
+    """Per (exam, student, violation type) count and first/last occurrence, maintained on every insert."""
+    __tablename__ = "violation_summaries"
+    __table_args__ = {'schema': 'report'}
+
+    exam_id = Column(String, primary_key=True)
+    student_id = Column(String, primary_key=True)
+    violation_type = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    first_seen = Column(DateTime)
+    last_seen = Column(DateTime)
+
+def update_violation_summaries(db, rows):
+    """
+    Fold a batch of violation rows (dicts with exam_id, student_id, violation_type,
+    timestamp) into report.violation_summaries within the caller's transaction.
+    """
+    grouped = {}
+    for row in rows:
+        key = (row['exam_id'], row['student_id'], row['violation_type'])
+        timestamp = violation_time(row.get('timestamp'))
+        if key not in grouped:
+            grouped[key] = {'count': 0, 'first_seen': timestamp, 'last_seen': timestamp}
+        entry = grouped[key]
+        entry['count'] += 1
+        entry['first_seen'] = min(entry['first_seen'], timestamp)
+        entry['last_seen'] = max(entry['last_seen'], timestamp)
+    if not grouped:
+        return
+
+    values = [
+        {'exam_id': exam_id, 'student_id': student_id, 'violation_type': v_type, **entry}
+        for (exam_id, student_id, v_type), entry in grouped.items()
+    ]
+    dialect = db.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as upsert_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert_insert
+        stmt = upsert_insert(ViolationSummary)
+        table = ViolationSummary.__table__
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=['exam_id', 'student_id', 'violation_type'],
+                set_={
+                    'count': table.c.count + stmt.excluded.count,
+                    'first_seen': func.least(table.c.first_seen, stmt.excluded.first_seen) if dialect == 'postgresql'
+                    else func.min(table.c.first_seen, stmt.excluded.first_seen),
+                    'last_seen': func.greatest(table.c.last_seen, stmt.excluded.last_seen) if dialect == 'postgresql'
+                    else func.max(table.c.last_seen, stmt.excluded.last_seen),
+                }
+            ),
+            values
+        )
+        return
+
+    # Other databases: primary-key lookups, one per key in the batch
+    for value in values:
+        summary = db.get(ViolationSummary, (value['exam_id'], value['student_id'], value['violation_type']))
+        if summary is None:
+            db.add(ViolationSummary(**value))
+        else:
+            summary.count += value['count']
+            summary.first_seen = min(violation_time(summary.first_seen), value['first_seen'])
+            summary.last_seen = max(violation_time(summary.last_seen), value['last_seen'])
+
+def rebuild_violation_summaries(db):
+    """Recompute report.violation_summaries from report.violations (one-off backfill)."""
+    db.query(ViolationSummary).delete()
+    db.execute(
+        ViolationSummary.__table__.insert().from_select(
+            ['exam_id', 'student_id', 'violation_type', 'count', 'first_seen', 'last_seen'],
+            select(
+                Violation.exam_id, Violation.student_id, Violation.violation_type,
+                func.count(Violation.id), func.min(Violation.timestamp), func.max(Violation.timestamp)
+            ).group_by(Violation.exam_id, Violation.student_id, Violation.violation_type)
+        )
+    )
+    db.commit()
+
+def ensure_indexes(bind=None):
+    """
+    Create indexes added after report.violations already existed (create_all skips existing tables).
+    On PostgreSQL they are built CONCURRENTLY, which does not block writes but can take a while on a
+    large table, so call this off the request path. A failed concurrent build leaves an invalid index
+    behind; it is dropped so the next start retries.
+    """
+    bind = bind or ddl_engine
+    for index in Violation.__table__.indexes:
+        try:
+            index.create(bind=bind, checkfirst=True)
+        except Exception as e:
+            log.error("Creating index %s failed: %s", index.name, e)
+            if bind.dialect.name == 'postgresql':
+                index.drop(bind=bind, checkfirst=True)
+
 # Do not create tables in production PostgreSQL
 # Base.metadata.create_all(bind=engine)
 
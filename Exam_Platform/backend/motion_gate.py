@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+MOTION_GATE_ENABLED = os.getenv('PROCTOR_MOTION_GATE', '1') == '1'
+# Grayscale thumbnail compared between frames (width, height)
+MOTION_THUMBNAIL_SIZE = (32, 24)
+# A thumbnail pixel counts as changed when it differs by more than this (0-255)
+MOTION_PIXEL_DELTA = int(os.getenv('PROCTOR_MOTION_PIXEL_DELTA', '12'))
+# Fraction of changed thumbnail pixels that counts as meaningful change
+MOTION_CHANGED_FRACTION = float(os.getenv('PROCTOR_MOTION_CHANGED_FRACTION', '0.02'))
+# The full pipeline runs at least this often even when nothing moves (seconds)
+MOTION_MAX_SKIP_SECONDS = float(os.getenv('PROCTOR_MOTION_MAX_SKIP_SECONDS', '2.0'))
+
+
+def motion_thumbnail(frame):
+    """Downscaled grayscale copy of a BGR frame; area averaging also smooths sensor noise. None for no frame."""
+    if frame is None:
+        return None
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    return cv2.resize(gray, MOTION_THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+
+
+class MotionGate:
+    """
+    Cheap pre-stage that decides whether a frame needs the full detection pipeline.
+
+    Each session keeps the thumbnail of the last fully analysed frame. A new frame
+    is skipped, and the session's cached result reused, only when its thumbnail is
+    close to that reference, the cached result is quiet (no violations and no
+    detection waiting on temporal persistence) and the last full analysis is
+    younger than max_skip_seconds. Comparing against the last analysed frame rather
+    than the previous one means slow drift still accumulates into a refresh.
+    """
+
+    def __init__(self, pixel_delta=MOTION_PIXEL_DELTA, changed_fraction=MOTION_CHANGED_FRACTION,
+                 max_skip_seconds=MOTION_MAX_SKIP_SECONDS, enabled=MOTION_GATE_ENABLED):
+        self.pixel_delta = pixel_delta
+        self.changed_fraction = changed_fraction
+        self.max_skip_seconds = max_skip_seconds
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self.frames_seen = 0
+        self.frames_skipped = 0
+        self.forced_refreshes = 0
+
+    def changed_fraction_between(self, reference, thumbnail):
+        if reference is None or thumbnail is None or reference.shape != thumbnail.shape:
+            return 1.0
+        diff = cv2.absdiff(reference, thumbnail)
+        return float(np.count_nonzero(diff > self.pixel_delta)) / diff.size
+
+    def should_skip(self, session, thumbnail):
+        """Return True when the session's cached result can stand in for this frame. Caller holds session.lock."""
+        with self._lock:
+            self.frames_seen += 1
+        if not self.enabled or session.last_result is None or not self._is_quiet(session):
+            return False
+        if self.changed_fraction_between(session.motion_reference, thumbnail) > self.changed_fraction:
+            return False
+        if time.time() - session.last_analysis_time >= self.max_skip_seconds:
+            with self._lock:
+                self.forced_refreshes += 1
+            return False
+        with self._lock:
+            self.frames_skipped += 1
+        return True
+
+    def _is_quiet(self, session):
+        """Nothing in the cached result or the session's detectors depends on seeing the next frame."""
+        return (
+            not any(session.last_result['violations'].values())
+            and not session.device_detection_history
+            and session.multiple_people_detection_history['consecutive_frames'] == 0
+            and not session.face_verification_required
+        )
+
+    def get_status(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'pixel_delta': self.pixel_delta,
+                'changed_fraction': self.changed_fraction,
+                'max_skip_seconds': self.max_skip_seconds,
+                'frames_seen': self.frames_seen,
+                'frames_skipped': self.frames_skipped,
+                'forced_refreshes': self.forced_refreshes,
+                'skip_ratio': self.frames_skipped / self.frames_seen if self.frames_seen else 0.0
+            }
@@ -0,0 +1,83 @@
+"""
+Head pose and gaze from FaceMesh landmark arrays.
+
+Landmarks come in as (468, 3) arrays normalised to the face box (see
+landmarks.py). Pose is solved once per face and returned together with the eye
+aspect ratio, for all faces of a frame in one call.
+"""
+
+import cv2
+import numpy as np
+
+# Key facial landmarks for head pose estimation
+POSE_LANDMARKS = [33, 263, 1, 61, 291, 199]  # Nose, left eye, right eye, left mouth, right mouth, chin
+# Eye landmarks for looking away detection, as (left, right) pairs
+EYE_OUTER = [33, 362]  # Left eye outer and inner corners, right eye outer and inner corners
+EYE_INNER = [133, 263]
+EYE_TOP = [159, 386]  # Top of left and right eyes
+EYE_BOTTOM = [145, 374]  # Bottom of left and right eyes
+
+# Thresholds in degrees
+HEAD_YAW_LIMIT = 30
+HEAD_PITCH_LIMIT = 20
+NORMAL_EAR_RANGE = (0.2, 0.5)  # Normal range for eye aspect ratio
+
+# Landmarks are scaled by 100 before solving, so the camera is fixed in that space
+_LANDMARK_SCALE = 100.0
+_FOCAL_LENGTH = 500
+_CAMERA_CENTER = (100, 100)
+CAMERA_MATRIX = np.array([
+    [_FOCAL_LENGTH, 0, _CAMERA_CENTER[0]],
+    [0, _FOCAL_LENGTH, _CAMERA_CENTER[1]],
+    [0, 0, 1]
+], dtype=np.float64)
+DIST_COEFFS = np.zeros((4, 1), dtype=np.float64)
+
+
+def _as_batch(landmark_sets):
+    batch = np.asarray(landmark_sets, dtype=np.float64)
+    return batch.reshape(-1, batch.shape[-2], 3)
+
+
+def eye_aspect_ratios(landmark_sets):
+    """Average of both eyes' vertical/horizontal ratio, for an (F, 468, 3) batch; returns (F,)."""
+    batch = _as_batch(landmark_sets)[:, :, :2]
+    vertical = np.linalg.norm(batch[:, EYE_TOP] - batch[:, EYE_BOTTOM], axis=2)
+    horizontal = np.linalg.norm(batch[:, EYE_OUTER] - batch[:, EYE_INNER], axis=2)
+    ratios = np.divide(vertical, horizontal, out=np.zeros_like(vertical), where=horizontal > 0)
+    return ratios.mean(axis=1)
+
+
+def head_angles(landmark_sets):
+    """Solve (pitch, yaw, roll) in degrees for each face of an (F, 468, 3) batch; returns an (F, 3) array."""
+    # Scale in float32 like the landmarks themselves, then solve in float64
+    batch = np.asarray(landmark_sets, dtype=np.float32).reshape(-1, np.shape(landmark_sets)[-2], 3)
+    points = (batch[:, POSE_LANDMARKS] * np.float32(_LANDMARK_SCALE)).astype(np.float64)
+    angles = np.zeros((len(points), 3))
+    for i, face_3d in enumerate(points):
+        face_2d = np.ascontiguousarray(face_3d[:, :2])
+        success, rot_vec, _ = cv2.solvePnP(np.ascontiguousarray(face_3d), face_2d, CAMERA_MATRIX, DIST_COEFFS)
+        if not success:
+            continue
+        rmat, _ = cv2.Rodrigues(rot_vec)
+        angles[i] = cv2.RQDecomp3x3(rmat)[0]
+    return angles
+
+
+def estimate(landmark_sets):
+    """
+    Pose and gaze for every face of a frame.
+    Returns a dict of (F,) arrays: pitch, yaw, roll, ear, head_turning, looking_away.
+    """
+    if len(landmark_sets) == 0:
+        empty = np.zeros(0)
+        return {'pitch': empty, 'yaw': empty, 'roll': empty, 'ear': empty,
+                'head_turning': empty.astype(bool), 'looking_away': empty.astype(bool)}
+    angles = head_angles(landmark_sets)
+    pitch, yaw, roll = angles[:, 0], angles[:, 1], angles[:, 2]
+    ear = eye_aspect_ratios(landmark_sets)
+    head_turning = (np.abs(yaw) > HEAD_YAW_LIMIT) | (np.abs(pitch) > HEAD_PITCH_LIMIT)
+    # Looking away: head turned or tilted too far, or eyes unusually closed or wide open
+    looking_away = head_turning | (ear < NORMAL_EAR_RANGE[0]) | (ear > NORMAL_EAR_RANGE[1])
+    return {'pitch': pitch, 'yaw': yaw, 'roll': roll, 'ear': ear,
+            'head_turning': head_turning, 'looking_away': looking_away}
@@ -1,46 +1,61 @@
-# backend/face_utils/recognition.py
-
-from facenet_pytorch import InceptionResnetV1
-import torch
-import numpy as np
-from PIL import Image
-import cv2
-import torch.nn.functional as F
-
-class FaceRecognizer:
-    def __init__(self):
-        self.device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
-        self.resnet = InceptionResnetV1(pretrained='vggface2').eval().to(self.device)
-
-    def get_embedding(self, face_img):
-        """Convert face image (PIL.Image or np.ndarray) to embedding vector."""
-        if face_img is None:
-            return None
-
-        # Convert PIL Image to numpy if needed
-        if isinstance(face_img, Image.Image):
-            face_img = np.array(face_img)
-
-        if face_img.shape[2] == 3 and np.max(face_img) > 1.0:
-            face_img = cv2.cvtColor(face_img, cv2.COLOR_BGR2RGB)
-
-        # Resize and normalize face image
-        face_img = cv2.resize(face_img, (160, 160))
-        face_img = face_img.astype(np.float32) / 255.0
-        face_img = (face_img - 0.5) / 0.5  # Normalize to [-1, 1]
-
-        # Convert to tensor and get embedding
-        face_tensor = torch.from_numpy(face_img).permute(2, 0, 1).unsqueeze(0).to(self.device)
-        embedding = self.resnet(face_tensor).detach().cpu().numpy()
-
-        return embedding
-
-    def compare_faces(self, embedding1, embedding2, threshold=0.92):
-        """Compare two face embeddings and return True if they match."""
-        if embedding1 is None or embedding2 is None:
-            return False
-
-        distance = np.linalg.norm(embedding1 - embedding2)
-        print(f"[INFO] Face embedding distance: {distance}")
-        print(f"[DEBUG] Face distance: {distance}, Threshold: {threshold}")
-        return distance < threshold
+# backend/face_utils/recognition.py
+
+import numpy as np
+from PIL import Image
+import cv2
+from batching import MicroBatcher
+from model_registry import get_facenet
+from metrics import log
+
+class FaceRecognizer:
+    def __init__(self):
+        # Face crops from concurrent requests are embedded together in one forward pass
+        self.batcher = MicroBatcher(self._embed_batch, name='facenet')
+
+    @property
+    def embedder(self):
+        # InceptionResnetV1 is shared process-wide through the model registry and loaded on first use;
+        # the configured inference backend (PyTorch, TorchScript or ONNX) maps a numpy batch to embeddings
+        return get_facenet()
+
+    def _preprocess(self, face_img):
+        """Convert face image (PIL.Image or np.ndarray) to a normalized (3, 160, 160) float32 array."""
+        # Convert PIL Image to numpy if needed
+        if isinstance(face_img, Image.Image):
+            face_img = np.array(face_img)
+
+        if face_img.shape[2] == 3 and np.max(face_img) > 1.0:
+            face_img = cv2.cvtColor(face_img, cv2.COLOR_BGR2RGB)
+
+        # Resize and normalize face image
+        face_img = cv2.resize(face_img, (160, 160))
+        face_img = face_img.astype(np.float32) / 255.0
+        face_img = (face_img - 0.5) / 0.5  # Normalize to [-1, 1]
+
+        return np.ascontiguousarray(face_img.transpose(2, 0, 1))
+
+    def _embed_batch(self, face_arrays):
+        """Run InceptionResnetV1 once over a list of preprocessed face arrays."""
+        embeddings = self.embedder(np.stack(face_arrays))
+        return [embeddings[i:i + 1] for i in range(len(face_arrays))]
+
+    def get_embedding(self, face_img):
+        """Convert face image (PIL.Image or np.ndarray) to a (1, 512) embedding vector."""
+        if face_img is None:
+            return None
+
+        return self.batcher(self._preprocess(face_img))
+
+    def get_embeddings(self, face_imgs):
+        """Embed several face images; returns a list of (1, 512) embeddings in input order."""
+        futures = [self.batcher.submit(self._preprocess(img)) for img in face_imgs]
+        return [future.result() for future in futures]
+
+    def compare_faces(self, embedding1, embedding2, threshold=0.92):
+        """Compare two face embeddings and return True if they match."""
+        if embedding1 is None or embedding2 is None:
+            return False
+
+        distance = np.linalg.norm(embedding1 - embedding2)
+        log.debug("Face distance: %s, Threshold: %s", distance, threshold)
+        return distance < threshold
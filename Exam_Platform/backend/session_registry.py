@@ -0,0 +1,149 @@
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from tracker import PersonTracker
+from metrics import log
+
+# Sessions idle for longer than this are dropped (seconds)
+SESSION_IDLE_TIMEOUT = float(os.getenv('PROCTOR_SESSION_IDLE_TIMEOUT', '900'))
+# Hard cap on live sessions per process; least recently used sessions are evicted first
+MAX_SESSIONS = int(os.getenv('PROCTOR_MAX_SESSIONS', '2000'))
+
+# Distinguishes successive trackers of the same student/exam, whose track IDs restart at 1
+_tracker_generations = itertools.count(1)
+
+
+def new_multiple_people_history():
+    return {
+        'first_detected': None,
+        'last_detected': None,
+        'total_detections': 0,
+        'consecutive_frames': 0,
+        'violation_triggered': False
+    }
+
+
+class ProctoringSession:
+    """Tracking state for one examinee in one exam."""
+
+    __slots__ = (
+        'student_id', 'exam_id', 'lock', 'created_at', 'last_active',
+        'tracked_person_id', 'person_last_seen', 'person_disappeared',
+        'face_verification_required', 'last_verification_time',
+        'person_tracking_history', 'device_detection_history',
+        'multiple_people_detection_history', 'person_tracker', 'original_student_id',
+        'motion_reference', 'last_analysis_time', 'last_result',
+        'frame_index', 'check_state', 'cache_key'
+    )
+
+    def __init__(self, student_id, exam_id):
+        self.student_id = student_id
+        self.exam_id = exam_id
+        # Frames from the same session must not be processed concurrently
+        self.lock = threading.Lock()
+        self.created_at = time.time()
+        self.last_active = self.created_at
+        self.reset()
+
+    def reset(self):
+        """Reset tracking state while keeping the session identity."""
+        self.tracked_person_id = None
+        self.person_last_seen = None
+        self.person_disappeared = False
+        self.face_verification_required = False
+        self.last_verification_time = 0
+        self.person_tracking_history = {}
+        self.device_detection_history = {}
+        self.multiple_people_detection_history = new_multiple_people_history()
+        self.person_tracker = PersonTracker()  # Stable person IDs across frames
+        self.original_student_id = None  # Preserved original student's person ID
+        # Motion gate: thumbnail and result of the last fully analysed frame
+        self.motion_reference = None
+        self.last_analysis_time = 0
+        self.last_result = None
+        # Cascade scheduler: analysed frame count and per-check last run
+        self.frame_index = 0
+        self.check_state = {}
+        # Embedding cache entries are keyed by (cache_key, track ID); a reset starts a new key
+        self.cache_key = (self.student_id, self.exam_id, next(_tracker_generations))
+
+    def touch(self):
+        self.last_active = time.time()
+
+
+class SessionRegistry:
+    """
+    Thread-safe registry of ProctoringSession objects keyed by (student_id, exam_id).
+    Sessions are kept in LRU order so idle eviction and the size cap are cheap.
+    """
+
+    def __init__(self, idle_timeout=SESSION_IDLE_TIMEOUT, max_sessions=MAX_SESSIONS):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted_idle = 0
+        self.evicted_capacity = 0
+
+    def get(self, student_id, exam_id, create=True):
+        """Return the session for (student_id, exam_id), creating it if requested."""
+        key = (str(student_id), str(exam_id))
+        with self._lock:
+            self._evict_idle_locked()
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+            elif create:
+                session = ProctoringSession(*key)
+                self._sessions[key] = session
+                while len(self._sessions) > self.max_sessions:
+                    evicted_key, _ = self._sessions.popitem(last=False)
+                    self.evicted_capacity += 1
+                    log.info("Evicted session %s (session cap %s reached)", evicted_key, self.max_sessions)
+            if session is not None:
+                session.touch()
+            return session
+
+    def remove(self, student_id, exam_id):
+        """Drop a session. Returns True if it existed."""
+        with self._lock:
+            return self._sessions.pop((str(student_id), str(exam_id)), None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def evict_idle(self):
+        """Drop sessions that have been idle longer than idle_timeout. Returns the number evicted."""
+        with self._lock:
+            return self._evict_idle_locked()
+
+    def _evict_idle_locked(self):
+        cutoff = time.time() - self.idle_timeout
+        evicted = 0
+        # OrderedDict is in LRU order, so stop at the first session that is still active
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if session.last_active >= cutoff:
+                break
+            del self._sessions[key]
+            evicted += 1
+        self.evicted_idle += evicted
+        return evicted
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get_status(self):
+        """Registry statistics for debugging."""
+        with self._lock:
+            return {
+                'active_sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'idle_timeout': self.idle_timeout,
+                'evicted_idle': self.evicted_idle,
+                'evicted_capacity': self.evicted_capacity
+            }
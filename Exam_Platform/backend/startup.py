@@ -0,0 +1,126 @@
+"""
+Startup timing and model warm-up.
+
+Import this module first in main.py so PROCESS_START is taken before the other
+imports. PROCTOR_STARTUP_MODE selects how models are loaded:
+
+- ``lazy``: on first use; the replica is ready as soon as the app has started
+- ``warm``: in a background thread after startup; ready once every model is loaded
+- ``eager``: before the app accepts requests
+
+A failed warm-up is retried PROCTOR_WARMUP_RETRIES times. If it still fails the
+replica stays not ready, so the orchestrator can restart it instead of routing
+frames to a replica that would load models on the request path.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import log
+
+PROCESS_START = time.perf_counter()
+
+STARTUP_MODE = os.getenv('PROCTOR_STARTUP_MODE', 'warm')
+STARTUP_MODES = ('lazy', 'warm', 'eager')
+WARMUP_RETRIES = int(os.getenv('PROCTOR_WARMUP_RETRIES', '2'))
+WARMUP_RETRY_DELAY = float(os.getenv('PROCTOR_WARMUP_RETRY_DELAY', '5'))
+
+
+class StartupTracker:
+    """Records how long each startup phase took and tracks model warm-up."""
+
+    def __init__(self, mode=STARTUP_MODE):
+        if mode not in STARTUP_MODES:
+            log.warning("Unknown PROCTOR_STARTUP_MODE '%s', using 'warm'", mode)
+            mode = 'warm'
+        self.mode = mode
+        self.phases = {}
+        self.warmup_state = 'pending'
+        self.warmup_error = None
+        self.warmup_attempts = 0
+        self.started_at = None  # seconds from process start until the app accepted requests
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] = (time.perf_counter() - start) * 1000.0
+
+    def mark(self, name):
+        """Record the time from process start until now as a phase, e.g. module imports."""
+        with self._lock:
+            self.phases[name] = (time.perf_counter() - PROCESS_START) * 1000.0
+
+    def mark_started(self):
+        self.started_at = time.perf_counter() - PROCESS_START
+
+    def _load_models(self, names, warmups):
+        import model_registry
+        for name in names:
+            with self.phase(f'load_{name}'):
+                model_registry.get_model(name)
+        for name, warm_up in warmups.items():
+            with self.phase(f'warm_{name}'):
+                warm_up()
+
+    def _warmup(self, names, warmups):
+        self.warmup_state = 'running'
+        for attempt in range(WARMUP_RETRIES + 1):
+            self.warmup_attempts = attempt + 1
+            try:
+                with self.phase('warmup'):
+                    self._load_models(names, warmups)
+                self.warmup_state = 'done'
+                self.warmup_error = None
+                log.info("Model warm-up finished in %.2fs", self.phases['warmup'] / 1000.0)
+                return
+            except Exception as e:
+                self.warmup_error = str(e)
+                if attempt < WARMUP_RETRIES:
+                    log.warning("Model warm-up failed (attempt %s), retrying: %s", attempt + 1, e)
+                    time.sleep(WARMUP_RETRY_DELAY * (attempt + 1))
+        # Requests are still served, loading models on first use, but /ready stays 503
+        self.warmup_state = 'failed'
+        log.error("Model warm-up failed after %s attempts: %s", self.warmup_attempts, self.warmup_error)
+
+    def load_models(self, names, warmups=None):
+        """
+        Load models according to the startup mode; called from the app's startup event.
+        warmups maps a name to a callable run after the models load, e.g. per-thread setup.
+        """
+        warmups = warmups or {}
+        if self.mode == 'lazy':
+            self.warmup_state = 'skipped'
+        elif self.mode == 'eager':
+            self._warmup(names, warmups)
+        elif self._thread is None:
+            self._thread = threading.Thread(target=self._warmup, args=(names, warmups), name='model-warmup', daemon=True)
+            self._thread.start()
+
+    def is_ready(self):
+        if self.started_at is None:
+            return False
+        return self.mode == 'lazy' or self.warmup_state == 'done'
+
+    def get_status(self):
+        with self._lock:
+            phases = dict(self.phases)
+        return {
+            'mode': self.mode,
+            'ready': self.is_ready(),
+            'warmup': self.warmup_state,
+            'warmup_error': self.warmup_error,
+            'warmup_attempts': self.warmup_attempts,
+            'seconds_to_accept_requests': self.started_at,
+            'phases_ms': phases
+        }
+
+
+startup_tracker = StartupTracker()
@@ -0,0 +1,172 @@
+import os
+import time
+
+import numpy as np
+
+import box_ops
+
+# Minimum IoU between a predicted track box and a detection to match them
+TRACK_IOU_THRESHOLD = float(os.getenv('PROCTOR_TRACK_IOU_THRESHOLD', '0.3'))
+# Unmatched tracks coast on their motion prediction for this long before being dropped (seconds)
+TRACK_MAX_AGE = float(os.getenv('PROCTOR_TRACK_MAX_AGE', '1.0'))
+
+# Constant-velocity model over (cx, cy, w, h): state is (cx, cy, w, h, vcx, vcy, vw, vh)
+_STATE_DIM = 8
+_MEASUREMENT_DIM = 4
+_H = np.hstack((np.eye(4), np.zeros((4, 4)))).astype(np.float64)
+# Measurement noise (pixels): box centers are steadier than box sizes
+_R = np.diag([5.0, 5.0, 10.0, 10.0]) ** 2
+# Initial uncertainty: position from the first detection, velocity unknown
+_P0 = np.diag([10.0, 10.0, 20.0, 20.0, 400.0, 400.0, 100.0, 100.0]) ** 2
+# Acceleration noise (pixels / s^2) for centers and sizes
+_ACCEL_STD = np.array([400.0, 400.0, 100.0, 100.0])
+
+
+def _boxes_to_measurements(boxes):
+    return np.concatenate((box_ops.centers(boxes), (boxes[:, 2:] - boxes[:, :2])), axis=1).astype(np.float64)
+
+
+def _states_to_boxes(states):
+    half_size = np.clip(states[:, 2:4], 1.0, None) / 2
+    return np.concatenate((states[:, :2] - half_size, states[:, :2] + half_size), axis=1).astype(np.float32)
+
+
+def _transition(dt):
+    F = np.eye(_STATE_DIM)
+    F[:4, 4:] = np.eye(4) * dt
+    # Discretised white-acceleration noise per axis
+    q = _ACCEL_STD ** 2
+    Q = np.zeros((_STATE_DIM, _STATE_DIM))
+    Q[:4, :4] = np.diag(q * dt ** 4 / 4)
+    Q[:4, 4:] = Q[4:, :4] = np.diag(q * dt ** 3 / 2)
+    Q[4:, 4:] = np.diag(q * dt ** 2)
+    return F, Q
+
+
+class PersonTracker:
+    """
+    Lightweight multi-object tracker for the people in one session's camera view.
+
+    Each track carries a Kalman filter with a constant-velocity model over the box
+    center and size. On every frame the tracks are predicted forward by the elapsed
+    time, matched to detections by IoU (greedy one-to-one), and leftovers are matched
+    by center distance relative to the box size, so a fast move keeps its ID.
+    Unmatched tracks coast for max_age seconds before they are dropped. All tracks are
+    held in batched arrays, so predict and update are a few NumPy calls per frame.
+    """
+
+    def __init__(self, iou_threshold=TRACK_IOU_THRESHOLD, max_age=TRACK_MAX_AGE):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.next_id = 1
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.states = np.zeros((0, _STATE_DIM))
+        self.covariances = np.zeros((0, _STATE_DIM, _STATE_DIM))
+        self.last_seen = np.zeros(0)
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.last_time = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _predict(self, now):
+        dt = 0.0 if self.last_time is None else max(now - self.last_time, 0.0)
+        self.last_time = now
+        if not len(self) or dt == 0.0:
+            return
+        F, Q = _transition(dt)
+        self.states = self.states @ F.T
+        self.covariances = F @ self.covariances @ F.T + Q
+
+    def _correct(self, track_indices, measurements):
+        P = self.covariances[track_indices]
+        S = _H @ P @ _H.T + _R
+        # K = P H^T S^-1, solved per track as S^T K^T = H P^T
+        K = np.linalg.solve(S.transpose(0, 2, 1), (_H @ P.transpose(0, 2, 1))).transpose(0, 2, 1)
+        residual = measurements - self.states[track_indices] @ _H.T
+        self.states[track_indices] += np.einsum('tij,tj->ti', K, residual)
+        self.covariances[track_indices] = (np.eye(_STATE_DIM) - K @ _H) @ P
+
+    def _match(self, boxes):
+        """Return (track_index, detection_index) pairs: IoU first, then size-relative center distance."""
+        predicted = _states_to_boxes(self.states)
+        iou = box_ops.pairwise_iou(predicted, boxes)
+        pairs = [(col, row) for row, col in box_ops.greedy_assign(1.0 - iou.T, 1.0 - self.iou_threshold)]
+
+        matched_tracks = {track for track, _ in pairs}
+        matched_detections = {detection for _, detection in pairs}
+        free_tracks = [t for t in range(len(self)) if t not in matched_tracks]
+        free_detections = [d for d in range(len(boxes)) if d not in matched_detections]
+        if free_tracks and free_detections:
+            # Distance in units of the track's box diagonal
+            track_boxes = predicted[free_tracks]
+            diagonals = np.hypot(track_boxes[:, 2] - track_boxes[:, 0], track_boxes[:, 3] - track_boxes[:, 1])
+            distances = box_ops.pairwise_distances(box_ops.centers(track_boxes), box_ops.centers(boxes[free_detections]))
+            relative = distances / np.clip(diagonals, 1.0, None)[:, None]
+            pairs += [(free_tracks[t], free_detections[d]) for t, d in box_ops.greedy_assign(relative, 0.5)]
+        return pairs
+
+    def update(self, boxes, now=None):
+        """
+        Advance the tracker with one frame's (N, 4) person boxes.
+        Returns an (N,) array of track IDs in detection order.
+        """
+        now = time.time() if now is None else now
+        boxes = box_ops.as_boxes(boxes)
+        self._predict(now)
+
+        detection_ids = np.zeros(len(boxes), dtype=np.int64)
+        matched = set()
+        if len(self) and len(boxes):
+            pairs = self._match(boxes)
+            if pairs:
+                track_indices = np.array([t for t, _ in pairs])
+                detection_indices = np.array([d for _, d in pairs])
+                self._correct(track_indices, _boxes_to_measurements(boxes[detection_indices]))
+                self.last_seen[track_indices] = now
+                self.hits[track_indices] += 1
+                detection_ids[detection_indices] = self.ids[track_indices]
+                matched = set(detection_indices.tolist())
+
+        # New tracks for unmatched detections
+        new = [d for d in range(len(boxes)) if d not in matched]
+        if new:
+            new_ids = np.arange(self.next_id, self.next_id + len(new))
+            self.next_id += len(new)
+            detection_ids[new] = new_ids
+            states = np.zeros((len(new), _STATE_DIM))
+            states[:, :4] = _boxes_to_measurements(boxes[new])
+            self.ids = np.concatenate((self.ids, new_ids))
+            self.states = np.concatenate((self.states, states))
+            self.covariances = np.concatenate((self.covariances, np.repeat(_P0[None], len(new), axis=0)))
+            self.last_seen = np.concatenate((self.last_seen, np.full(len(new), now)))
+            self.hits = np.concatenate((self.hits, np.ones(len(new), dtype=np.int64)))
+
+        # Age out tracks that have coasted too long
+        alive = now - self.last_seen <= self.max_age
+        if not alive.all():
+            self.ids = self.ids[alive]
+            self.states = self.states[alive]
+            self.covariances = self.covariances[alive]
+            self.last_seen = self.last_seen[alive]
+            self.hits = self.hits[alive]
+
+        return detection_ids
+
+    def get_status(self, now=None):
+        now = time.time() if now is None else now
+        return {
+            'active_tracks': [
+                {
+                    'id': int(track_id),
+                    'bbox': box.tolist(),
+                    'velocity': state[4:6].tolist(),
+                    'hits': int(hits),
+                    'age_since_seen': float(now - seen)
+                }
+                for track_id, box, state, hits, seen in zip(
+                    self.ids, _states_to_boxes(self.states), self.states, self.hits, self.last_seen
+                )
+            ],
+            'next_id': self.next_id
+        }
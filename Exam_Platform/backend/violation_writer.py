@@ -0,0 +1,280 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DisconnectionError, InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+
+from models import Violation, SessionLocal, update_violation_summaries, violation_time, TIMEZONE
+from metrics import log
+
+VIOLATION_FLUSH_INTERVAL = float(os.getenv('PROCTOR_VIOLATION_FLUSH_INTERVAL', '1.0'))
+VIOLATION_BATCH_SIZE = int(os.getenv('PROCTOR_VIOLATION_BATCH_SIZE', '500'))
+# Optional write-ahead file; buffered violations survive a crash and are replayed on start
+VIOLATION_WAL_PATH = os.getenv('PROCTOR_VIOLATION_WAL', '')
+# Buffered rows kept while the database is unreachable; the oldest are dropped beyond this
+VIOLATION_MAX_PENDING = int(os.getenv('PROCTOR_VIOLATION_MAX_PENDING', '50000'))
+# Flushes a row the database rejects is retried in before it is dropped
+VIOLATION_MAX_ATTEMPTS = int(os.getenv('PROCTOR_VIOLATION_MAX_ATTEMPTS', '3'))
+# Optional JSON-lines file that receives dropped rows instead of discarding them
+VIOLATION_DEAD_LETTER_PATH = os.getenv('PROCTOR_VIOLATION_DEAD_LETTER', '')
+
+# The database could not be reached: the whole flush is retried later
+_CONNECTION_ERRORS = (OperationalError, InterfaceError, DisconnectionError, PoolTimeoutError)
+
+
+class ViolationWriter:
+    """
+    Buffers detected violations in memory and writes them to the database in bulk
+    from a background thread, so the frame hot path never waits on the database.
+
+    Duplicates are suppressed with an in-memory index of the last time each
+    (student_id, exam_id, violation_type) was recorded, replacing the per-frame
+    SELECT against report.violations. The buffer is flushed every flush_interval
+    seconds, as soon as batch_size rows are pending, and on stop().
+
+    If the database is unreachable, rows stay buffered, up to max_pending rows. If it
+    rejects a batch, the batch is bisected down to the offending rows. Those rows are
+    retried for max_attempts flushes and then dropped, like rows beyond max_pending.
+    Dropped rows are counted and written to the dead-letter file when one is set.
+    """
+
+    def __init__(self, duplicate_window=2, flush_interval=VIOLATION_FLUSH_INTERVAL,
+                 batch_size=VIOLATION_BATCH_SIZE, wal_path=VIOLATION_WAL_PATH, session_factory=SessionLocal,
+                 max_pending=VIOLATION_MAX_PENDING, max_attempts=VIOLATION_MAX_ATTEMPTS,
+                 dead_letter_path=VIOLATION_DEAD_LETTER_PATH):
+        self.duplicate_window = timedelta(seconds=duplicate_window)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.wal_path = wal_path or None
+        self.session_factory = session_factory
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.dead_letter_path = dead_letter_path or None
+
+        self._last_recorded = {}  # (student_id, exam_id, violation_type) -> datetime
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+        # Statistics
+        self.recorded = 0
+        self.suppressed = 0
+        self.flushed = 0
+        self.flush_failures = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.last_flush_ms = 0.0
+
+        self._replay_wal()
+
+    # ------------------------------------------------------------------ hot path
+
+    def record(self, student_id, exam_id, violations, confidence=0.8, details_prefix='Hybrid detection', details=None):
+        """
+        Queue every positive entry of a {violation_type: bool} dict.
+        `details` optionally maps a violation type to extra text stored with it.
+        Returns the list of violation types that were queued (not suppressed as duplicates).
+        """
+        details = details or {}
+        current_time = datetime.now(TIMEZONE)
+        queued = []
+        with self._lock:
+            for v_type, is_violation in violations.items():
+                if not is_violation:
+                    continue
+                key = (student_id, exam_id, v_type)
+                last = self._last_recorded.get(key)
+                if last is not None and current_time - last < self.duplicate_window:
+                    self.suppressed += 1
+                    continue
+                self._last_recorded[key] = current_time
+                row = {
+                    'student_id': student_id,
+                    'exam_id': exam_id,
+                    'violation_type': v_type,
+                    'confidence': confidence,
+                    'details': f"{details_prefix}: {v_type}" + (f" - {details[v_type]}" if v_type in details else ''),
+                    'timestamp': violation_time(current_time)
+                }
+                self._buffer.append(row)
+                queued.append(v_type)
+            if queued and self.wal_path:
+                self._append_wal(self._buffer[-len(queued):])
+            self.recorded += len(queued)
+            pending = len(self._buffer)
+        if pending >= self.batch_size:
+            self._wake.set()
+        return queued
+
+    # ------------------------------------------------------------------ write-ahead file
+
+    def _append_wal(self, rows):
+        with open(self.wal_path, 'a') as f:
+            for row in rows:
+                f.write(json.dumps({**row, 'timestamp': row['timestamp'].isoformat()}) + '\n')
+
+    def _rewrite_wal(self):
+        """Rewrite the WAL to hold only rows still buffered. Caller holds self._lock."""
+        tmp_path = self.wal_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for row in self._buffer:
+                f.write(json.dumps({**row, 'timestamp': row['timestamp'].isoformat()}) + '\n')
+        os.replace(tmp_path, self.wal_path)
+
+    def _replay_wal(self):
+        if not self.wal_path or not os.path.exists(self.wal_path):
+            return
+        replayed = 0
+        with open(self.wal_path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                    row['timestamp'] = violation_time(datetime.fromisoformat(row['timestamp']))
+                except (ValueError, KeyError):
+                    continue  # partially written last line
+                self._buffer.append(row)
+                replayed += 1
+        if replayed:
+            log.info("Replayed %s unflushed violations from %s", replayed, self.wal_path)
+
+    # ------------------------------------------------------------------ background flushing
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._loop, name='violation-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and flush everything still buffered."""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+        self.flush()
+
+    def _loop(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stopping:
+                break
+            self.flush()
+
+    def flush(self):
+        """Write all buffered violations in bulk. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+                self._prune_dedup_index()
+            if not rows:
+                return 0
+
+            start = time.perf_counter()
+            written, rejected, unsent = self._write(rows)
+            if rejected or unsent:
+                self.flush_failures += 1
+            if written:
+                self.last_flush_ms = (time.perf_counter() - start) * 1000.0
+
+            dropped = []
+            for row in rejected:
+                row['attempts'] = row.get('attempts', 0) + 1
+            retry = [row for row in rejected if row['attempts'] < self.max_attempts]
+            dropped.extend(row for row in rejected if row['attempts'] >= self.max_attempts)
+            with self._lock:
+                # Retried rows keep their place ahead of rows queued during the flush
+                self._buffer = unsent + retry + self._buffer
+                overflow = len(self._buffer) - self.max_pending
+                if overflow > 0:
+                    dropped.extend(self._buffer[:overflow])
+                    self._buffer = self._buffer[overflow:]
+                self.flushed += written
+                if self.wal_path and (written or dropped):
+                    self._rewrite_wal()
+            if dropped:
+                self._drop(dropped)
+            return written
+
+    def _write(self, rows):
+        """
+        Insert rows, bisecting a rejected batch down to the rows the database refuses.
+        Returns (rows written, rejected rows, rows not sent because the database is unreachable).
+        """
+        try:
+            self._insert(rows)
+            return len(rows), [], []
+        except _CONNECTION_ERRORS as e:
+            log.error("Failed to flush %s violations, database unavailable: %s", len(rows), e)
+            return 0, [], rows
+        except Exception as e:
+            if len(rows) == 1:
+                self.rejected += 1
+                log.warning("Violation rejected by the database: %s", e)
+                return 0, rows, []
+        middle = len(rows) // 2
+        written, rejected, unsent = self._write(rows[:middle])
+        if unsent:
+            return written, rejected, unsent + rows[middle:]
+        more_written, more_rejected, unsent = self._write(rows[middle:])
+        return written + more_written, rejected + more_rejected, unsent
+
+    def _insert(self, rows):
+        db = self.session_factory()
+        try:
+            db.execute(insert(Violation), [{key: value for key, value in row.items() if key != 'attempts'} for row in rows])
+            update_violation_summaries(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _drop(self, rows):
+        """Give up on rows: count them and append them to the dead-letter file if configured."""
+        self.dropped += len(rows)
+        log.error("Dropped %s violations (%s in total)", len(rows), self.dropped)
+        if not self.dead_letter_path:
+            return
+        try:
+            with open(self.dead_letter_path, 'a') as f:
+                for row in rows:
+                    f.write(json.dumps({**row, 'timestamp': row['timestamp'].isoformat()}) + '\n')
+        except OSError as e:
+            log.error("Failed to write dropped violations to %s: %s", self.dead_letter_path, e)
+
+    def _prune_dedup_index(self):
+        """Forget dedup entries older than the duplicate window. Caller holds self._lock."""
+        cutoff = datetime.now(TIMEZONE) - self.duplicate_window
+        self._last_recorded = {key: ts for key, ts in self._last_recorded.items() if ts >= cutoff}
+
+    def get_status(self):
+        with self._lock:
+            pending = len(self._buffer)
+            tracked_keys = len(self._last_recorded)
+        return {
+            'pending': pending,
+            'recorded': self.recorded,
+            'suppressed_duplicates': self.suppressed,
+            'flushed': self.flushed,
+            'flush_failures': self.flush_failures,
+            'rejected': self.rejected,
+            'dropped': self.dropped,
+            'max_pending': self.max_pending,
+            'last_flush_ms': self.last_flush_ms,
+            'dedup_keys': tracked_keys,
+            'flush_interval': self.flush_interval,
+            'batch_size': self.batch_size,
+            'wal_path': self.wal_path
+        }
@@ -73,70 +73,93 @@ const WebcamFeed: React.FC = () => {
       }
     };
 
-    const startHybridAnalysis = () => {
-      const analyzeFrame = async () => {
-        if (videoRef.current && videoRef.current.readyState === videoRef.current.HAVE_ENOUGH_DATA) {
-          // Draw current frame to canvas
-          const canvas = canvasRef.current;
-          if (!canvas) return;
-          
-          const ctx = canvas.getContext('2d');
-          if (!ctx) return;
+    // Streaming proctoring channel for this effect run; closed in cleanup
+    let proctorSocket: WebSocket | null = null;
+    let streamTimer: ReturnType<typeof setInterval> | null = null;
+    // While the channel is down, frames go over HTTP and the socket is reopened with backoff
+    let httpFallbackActive = false;
+    let httpLoopId = 0;
+    let reconnectTimer: ReturnType<typeof setTimeout> | null = null;
+    let reconnectAttempts = 0;
+    let stopped = false;
+    const RECONNECT_BASE_MS = 1000;
+    const RECONNECT_MAX_MS = 30000;
+
+    const captureFrame = async (): Promise<Blob | null> => {
+      if (!videoRef.current || videoRef.current.readyState !== videoRef.current.HAVE_ENOUGH_DATA) return null;
+
+      // Draw current frame to canvas
+      const canvas = canvasRef.current;
+      if (!canvas) return null;
 
-          canvas.width = videoRef.current.videoWidth;
-          canvas.height = videoRef.current.videoHeight;
-          ctx.drawImage(videoRef.current, 0, 0);
+      const ctx = canvas.getContext('2d');
+      if (!ctx) return null;
 
-          // Convert canvas to base64
-          const imageData = canvas.toDataURL('image/jpeg', 0.8);
+      canvas.width = videoRef.current.videoWidth;
+      canvas.height = videoRef.current.videoHeight;
+      ctx.drawImage(videoRef.current, 0, 0);
 
+      // Encode the frame as raw JPEG bytes (no base64/JSON wrapping)
+      return new Promise<Blob | null>((resolve) => canvas.toBlob(resolve, 'image/jpeg', 0.8));
+    };
+
+    const handleAnalysis = (data: any) => {
+      if (!data.success) return;
+      setViolations(data.violations);
+      setHybridVerification(data.verification);
+      setTrackedPersonId(data.tracked_person_id);
+
+      // Store detection boxes for drawing
+      if (data.detection_boxes) {
+        setDetectionBoxes(data.detection_boxes);
+      }
+
+      // Handle face verification results
+      if (data.verification.face_verification_triggered) {
+        if (data.verification.identity_verified === false) {
+          setFaceVerification({
+            success: true,
+            verified: false,
+            message: 'Identity verification failed - different person detected'
+          });
+          reportProxyViolation('Identity mismatch detected during hybrid verification');
+        } else if (data.verification.identity_verified === true) {
+          setFaceVerification({
+            success: true,
+            verified: true,
+            message: 'Identity verified - same person confirmed'
+          });
+          // Reset violation state when verification passes
+          setProxyViolationReported(false);
+          console.log('Identity verified - resetting violation state');
+        }
+      }
+    };
+
+    // Fallback: one HTTP request per frame when the WebSocket channel is unavailable
+    const startHttpAnalysis = () => {
+      if (httpFallbackActive) return;
+      httpFallbackActive = true;
+      // A loop left over from an earlier fallback period exits on its next frame
+      const loopId = ++httpLoopId;
+      const analyzeFrame = async () => {
+        if (!httpFallbackActive || stopped || loopId !== httpLoopId) return;
+        const frameBlob = await captureFrame();
+        if (frameBlob) {
           try {
             // Send frame to backend for hybrid analysis
-            const response = await fetch('http://localhost:5000/hybrid_analyze', {
+            const response = await fetch('http://localhost:5000/hybrid_analyze_frame', {
               method: 'POST',
               headers: {
-                'Content-Type': 'application/json',
+                'Content-Type': 'application/octet-stream',
+                'X-Student-Id': localStorage.getItem('studentId') || '',
+                'X-Exam-Id': localStorage.getItem('examId') || ''
               },
-              body: JSON.stringify({ 
-                image: imageData,
-                student_id: localStorage.getItem('studentId'),
-                exam_id: localStorage.getItem('examId')
-              }),
+              body: frameBlob,
             });
 
             if (response.ok) {
-              const data = await response.json();
-              if (data.success) {
-                setViolations(data.violations);
-                setHybridVerification(data.verification);
-                setTrackedPersonId(data.tracked_person_id);
-                
-                // Store detection boxes for drawing
-                if (data.detection_boxes) {
-                  setDetectionBoxes(data.detection_boxes);
-                }
-                
-                // Handle face verification results
-                if (data.verification.face_verification_triggered) {
-                  if (data.verification.identity_verified === false) {
-                    setFaceVerification({
-                      success: true,
-                      verified: false,
-                      message: 'Identity verification failed - different person detected'
-                    });
-                    reportProxyViolation('Identity mismatch detected during hybrid verification');
-                  } else if (data.verification.identity_verified === true) {
-                    setFaceVerification({
-                      success: true,
-                      verified: true,
-                      message: 'Identity verified - same person confirmed'
-                    });
-                    // Reset violation state when verification passes
-                    setProxyViolationReported(false);
-                    console.log('Identity verified - resetting violation state');
-                  }
-                }
-              }
+              handleAnalysis(await response.json());
             }
           } catch (err) {
             console.error('Error analyzing frame:', err);
@@ -147,6 +170,60 @@ const WebcamFeed: React.FC = () => {
       requestAnimationFrame(analyzeFrame);
     };
 
+    const startHybridAnalysis = () => {
+      const params = new URLSearchParams({
+        student_id: localStorage.getItem('studentId') || '',
+        exam_id: localStorage.getItem('examId') || ''
+      });
+      const socket = new WebSocket(`ws://localhost:5000/ws/proctor?${params.toString()}`);
+      proctorSocket = socket;
+      let opened = false;
+
+      socket.onopen = () => {
+        opened = true;
+        reconnectAttempts = 0;
+        // Streaming again: stop the per-frame HTTP fallback
+        httpFallbackActive = false;
+      };
+
+      socket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.type === 'config') {
+          // The server decides how many frames per second it wants
+          const fps = data.target_fps > 0 ? data.target_fps : 5;
+          streamTimer = setInterval(async () => {
+            if (socket.readyState !== WebSocket.OPEN) return;
+            const frameBlob = await captureFrame();
+            if (frameBlob) socket.send(frameBlob);
+          }, 1000 / fps);
+        } else if (data.type === 'analysis') {
+          handleAnalysis(data);
+        } else if (data.type === 'error') {
+          console.error('Proctoring stream error:', data.detail);
+        }
+      };
+
+      socket.onclose = () => {
+        if (streamTimer) {
+          clearInterval(streamTimer);
+          streamTimer = null;
+        }
+        if (stopped || proctorSocket !== socket) return;
+        // Channel could not be opened or dropped mid-exam: keep analysing over HTTP and reconnect
+        console.warn(opened
+          ? 'Proctoring WebSocket closed, falling back to HTTP while reconnecting'
+          : 'Proctoring WebSocket unavailable, falling back to HTTP while retrying');
+        proctorSocket = null;
+        startHttpAnalysis();
+        const delay = Math.min(RECONNECT_BASE_MS * 2 ** reconnectAttempts, RECONNECT_MAX_MS);
+        reconnectAttempts += 1;
+        reconnectTimer = setTimeout(() => {
+          reconnectTimer = null;
+          if (!stopped) startHybridAnalysis();
+        }, delay);
+      };
+    };
+
     const reportProxyViolation = async (details: string) => {
       console.log('reportProxyViolation called with details:', details);
       if (proxyViolationReported) {
@@ -194,6 +271,19 @@ const WebcamFeed: React.FC = () => {
 
     // Cleanup function
     return () => {
+      stopped = true;
+      httpFallbackActive = false;
+      if (reconnectTimer) {
+        clearTimeout(reconnectTimer);
+      }
+      if (proctorSocket) {
+        const socket = proctorSocket;
+        proctorSocket = null;
+        socket.close();
+      }
+      if (streamTimer) {
+        clearInterval(streamTimer);
+      }
       if (videoRef.current && videoRef.current.srcObject) {
         const stream = videoRef.current.srcObject as MediaStream;
         stream.getTracks().forEach(track => track.stop());
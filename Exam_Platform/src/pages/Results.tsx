@@ -33,16 +33,24 @@ const Results: React.FC = () => {
           return;
         }
 
-        const response = await fetch(
-          `http://localhost:5000/get_violations?student_id=${studentId}&exam_id=${examId}`
-        );
-        const data = await response.json();
-
-        if (data.success) {
-          setViolations(data.violations);
-        } else {
-          setError(data.error || 'Failed to fetch violations');
-        }
+        // The API is paginated: follow next_cursor until the last page
+        const allViolations: Violation[] = [];
+        let cursor: string | null = null;
+        do {
+          const params = new URLSearchParams({ student_id: studentId, exam_id: examId, limit: '500' });
+          if (cursor) params.set('cursor', cursor);
+          const response = await fetch(`http://localhost:5000/get_violations?${params}`);
+          const data = await response.json();
+
+          if (!data.success) {
+            setError(data.error || 'Failed to fetch violations');
+            return;
+          }
+          allViolations.push(...data.violations);
+          cursor = data.next_cursor;
+        } while (cursor);
+
+        setViolations(allViolations);
       } catch (err) {
         setError('Error fetching violations');
         console.error('Error:', err);